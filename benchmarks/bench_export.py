@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rate and peak Python memory of export.export_table for increasing table
+sizes. Peak memory should not grow with the number of rows. The rates are
+lowered by tracing the memory use.
+
+Usage
+-----
+python benchmarks/bench_export.py
+python benchmarks/bench_export.py 100000,1000000
+"""
+
+#Standard Library
+#------------------------
+import datetime
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Local
+#------------------------
+from reference_resolver import export
+from reference_resolver import tables
+
+_INSERT_CHUNK = 50000
+
+
+def fill(engine, n_papers):
+    papers = tables.Paper.__table__
+    now = datetime.datetime.utcnow()
+    with engine.begin() as conn:
+        for start in range(0, n_papers, _INSERT_CHUNK):
+            stop = min(start + _INSERT_CHUNK, n_papers)
+            conn.execute(papers.insert(), [
+                {'doi': '10.1000/%d' % i, 'title': 'Title of paper %d' % i,
+                 'authors': 'Smith J; Jones K', 'year': 1990 + i % 30,
+                 'new_pointer': 0, 'created': now}
+                for i in range(start, stop)])
+
+
+def main(sizes):
+    print('%10s %8s %11s %9s' % ('papers', 'format', 'rows/s', 'peak MB'))
+    for n_papers in sizes:
+        with tempfile.TemporaryDirectory() as root:
+            tables.set_db_path(os.path.join(root, 'bench.db'))
+            engine = tables.get_engine()
+            fill(engine, n_papers)
+            for format in export.FORMATS:
+                path = os.path.join(root, 'papers.' + format + '.gz')
+                tracemalloc.start()
+                t0 = time.perf_counter()
+                n_rows = export.export_table('papers', path, format=format)
+                elapsed = time.perf_counter() - t0
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print('%10d %8s %11.0f %9.2f' % (n_rows, format,
+                                                 n_rows/elapsed, peak/1e6))
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main([int(x) for x in sys.argv[1].split(',')])
+    else:
+        main([10000, 100000, 1000000])
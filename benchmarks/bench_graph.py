@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build time, memory and query latency of graph.CitationGraph on a synthetic
+citation graph, compared with the equivalent SQL queries.
+
+Each paper cites N_REFS earlier papers, with a preference for highly cited
+ones, giving the skewed in degree distribution of real citation data.
+
+Usage
+-----
+python benchmarks/bench_graph.py
+python benchmarks/bench_graph.py 2000000
+"""
+
+#Standard Library
+#------------------------
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Third party
+#------------------------
+import numpy as np
+
+#Local
+#------------------------
+from reference_resolver import tables
+from reference_resolver.graph import CitationGraph
+
+N_REFS = 30
+N_QUERIES = 200
+#Edges written to the database for the load and SQL comparisons
+N_DB_EDGES = 500000
+
+
+def make_edges(n_edges, seed=0):
+    rng = np.random.RandomState(seed)
+    n_papers = n_edges//N_REFS
+    citing = np.repeat(np.arange(1, n_papers + 1), N_REFS)
+    #Squaring a uniform biases towards the oldest (most cited) papers
+    cited = (citing*rng.random_sample(len(citing))**2).astype(np.int64) + 1
+    return citing, cited
+
+
+def timed(fn, args_list):
+    durations = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        durations.append(time.perf_counter() - t0)
+    return 1000*np.median(durations)
+
+
+def bench_memory(n_edges):
+    citing, cited = make_edges(n_edges)
+    t0 = time.perf_counter()
+    g = CitationGraph.from_edges(citing, cited)
+    build = time.perf_counter() - t0
+    print('%d citations between %d papers' % (g.n_citations, g.n_papers))
+    print('build %.2f s, %.1f MB' % (build, g.nbytes/1e6))
+
+    rng = np.random.RandomState(1)
+    ids = g.ids[rng.randint(0, g.n_papers, N_QUERIES)]
+    queries = [(x,) for x in ids]
+    print('%-26s %10s' % ('query', 'median ms'))
+    print('%-26s %10.3f' % ('citations', timed(g.citations, queries)))
+    print('%-26s %10.3f' % ('in_degree (all papers)',
+                            timed(g.in_degree, [()]*10)))
+    print('%-26s %10.3f' % ('cocited_with top 10',
+                            timed(lambda x: g.cocited_with(x, 10), queries)))
+    print('%-26s %10.3f' % ('coupled_with top 10',
+                            timed(lambda x: g.coupled_with(x, 10), queries)))
+    print('%-26s %10.3f' % ('neighborhood k=2',
+                            timed(lambda x: g.neighborhood(x, 2), queries)))
+
+
+def bench_database():
+    import sqlalchemy as sql
+    citing, cited = make_edges(N_DB_EDGES)
+    with tempfile.TemporaryDirectory() as root:
+        tables.set_db_path(os.path.join(root, 'bench.db'))
+        engine = tables.get_engine()
+        rows = [{'main_paper_id': int(a), 'ref_paper_id': int(b),
+                 'ordering': i % N_REFS}
+                for i, (a, b) in enumerate(zip(citing, cited))]
+        with engine.begin() as conn:
+            conn.execute(tables.Reference.__table__.insert(), rows)
+
+        t0 = time.perf_counter()
+        g = CitationGraph.load()
+        print('\nload %d citations from the database: %.2f s' %
+              (g.n_citations, time.perf_counter() - t0))
+
+        rng = np.random.RandomState(2)
+        queries = [(int(x),) for x in g.ids[rng.randint(0, g.n_papers, 20)]]
+        cocitation_sql = sql.text(
+            'SELECT b.ref_paper_id, count(*) AS n FROM "references" a '
+            'JOIN "references" b ON a.main_paper_id = b.main_paper_id '
+            'WHERE a.ref_paper_id = :x AND b.ref_paper_id != :x '
+            'GROUP BY b.ref_paper_id ORDER BY n DESC LIMIT 10')
+        with engine.connect() as conn:
+            sql_ms = timed(lambda x: conn.execute(cocitation_sql,
+                                                  x=x).fetchall(), queries)
+        graph_ms = timed(lambda x: g.cocited_with(x, 10), queries)
+        print('cocited_with top 10: sql %.3f ms, graph %.3f ms' %
+              (sql_ms, graph_ms))
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    n_edges = int(sys.argv[1]) if len(sys.argv) > 1 else 3000000
+    bench_memory(n_edges)
+    bench_database()
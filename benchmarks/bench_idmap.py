@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import rate of idmap.import_file and lookup rate of idmap.pmids_to_dois for
+a synthetic mapping file in the PMC-ids.csv format.
+
+Usage
+-----
+python benchmarks/bench_idmap.py
+python benchmarks/bench_idmap.py 5000000
+"""
+
+#Standard Library
+#------------------------
+import csv
+import gzip
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Local
+#------------------------
+from reference_resolver import idmap
+from reference_resolver import tables
+
+N_LOOKUPS = 1000000
+
+
+def write_file(path, n_rows):
+    with io.TextIOWrapper(gzip.open(path, 'wb', compresslevel=1),
+                          encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Journal Title', 'ISSN', 'eISSN', 'Year', 'Volume',
+                         'Issue', 'Page', 'DOI', 'PMCID', 'PMID',
+                         'Manuscript Id', 'Release Date'])
+        for i in range(n_rows):
+            #Some articles have no DOI or PMID
+            writer.writerow(['Journal %d' % (i % 100), '', '', '2014', '9',
+                             '11', '1402', '' if i % 10 == 0 else
+                             '10.%d/a.%d' % (1000 + i % 500, i),
+                             'PMC%d' % (1000000 + i),
+                             '' if i % 7 == 0 else str(20000000 + i), '',
+                             'live'])
+
+
+def main(n_rows):
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'PMC-ids.csv.gz')
+        write_file(path, n_rows)
+        tables.set_db_path(os.path.join(root, 'bench.db'))
+
+        t0 = time.perf_counter()
+        n_imported = idmap.import_file(path)
+        elapsed = time.perf_counter() - t0
+        print('import:  %d rows in %.1f s, %.0f rows/s'
+              % (n_imported, elapsed, n_imported/elapsed))
+
+        random.seed(0)
+        #About half of these are unknown
+        pmids = [20000000 + random.randrange(2*n_rows)
+                 for _ in range(N_LOOKUPS)]
+        t0 = time.perf_counter()
+        dois = idmap.pmids_to_dois(pmids)
+        elapsed = time.perf_counter() - t0
+        print('lookup:  %d PMIDs in %.1f s, %.0f ids/s, %d found'
+              % (len(pmids), elapsed, len(pmids)/elapsed,
+                 sum(x is not None for x in dois)))
+        tables.get_engine().dispose()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
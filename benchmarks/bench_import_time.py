@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measures the cost of 'import reference_resolver' in a fresh interpreter.
+
+The cumulative import time of the package (from python -X importtime) is
+reported as the median over several runs. The script exits with a non-zero
+status if it exceeds MAX_IMPORT_MS or if any of the heavy dependencies
+(database, HTTP, Crossref client) are loaded by the import.
+
+Usage
+-----
+python benchmarks/bench_import_time.py
+"""
+
+#Standard Library
+#------------------------
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+N_RUNS = 7
+MAX_IMPORT_MS = 50
+
+#These should only be loaded when actually used
+HEAVY_MODULES = ['sqlalchemy', 'requests', 'crossref', 'scopy', 'aiohttp']
+
+CHECK_CODE = ('import sys, reference_resolver; '
+              'print(",".join(m for m in %r if m in sys.modules))' % HEAVY_MODULES)
+
+
+def run_once():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHECK_CODE],
+                             env=env, capture_output=True, text=True, check=True)
+    #Lines look like: 'import time:   self [us] | cumulative | name'
+    for line in process.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == 'reference_resolver':
+            import_us = int(parts[1])
+            break
+    else:
+        raise RuntimeError('Package import not found in -X importtime output')
+
+    loaded = [x for x in process.stdout.strip().split(',') if x]
+    return import_us/1000.0, loaded
+
+
+def main():
+    times = []
+    loaded = []
+    for i in range(N_RUNS):
+        import_ms, loaded = run_once()
+        times.append(import_ms)
+
+    median_ms = statistics.median(times)
+    print('import reference_resolver: median %.1f ms, min %.1f ms, max %.1f ms'
+          % (median_ms, min(times), max(times)))
+
+    failed = False
+    if loaded:
+        print('FAIL: heavy modules loaded on import: %s' % ', '.join(loaded))
+        failed = True
+    if median_ms > MAX_IMPORT_MS:
+        print('FAIL: import time exceeds %d ms' % MAX_IMPORT_MS)
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput of reference ingestion, in reference rows per second.
+
+    orm  - one Paper/Reference ORM object at a time via session.add
+    bulk - ingest.add_references_bulk
+
+Each paper has N_REFS references, 10% of which are unresolved text.
+
+Usage
+-----
+python benchmarks/bench_ingest.py
+"""
+
+#Standard Library
+#------------------------
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Local
+#------------------------
+from reference_resolver import tables, ingest
+from reference_resolver.tables import Paper, Reference, UnknownReference
+
+N_REFS = 200
+#Number of papers for each method, the ORM approach is much slower
+N_PAPERS = {'orm': 20, 'bulk': 500}
+#Papers per add_references_bulk call
+BULK_BATCH_SIZE = 50
+
+
+def make_papers(n_papers, seed):
+    items = []
+    for i in range(n_papers):
+        refs = []
+        for j in range(N_REFS):
+            if j % 10 == 9:
+                refs.append({'text': 'Unresolved reference %d.%d' % (i, j)})
+            else:
+                #Overlapping reference DOIs, as in a real corpus
+                refs.append('10.%d/ref.%d' % (1000 + j, (i*7 + j) % 5000))
+        items.append(('10.9999/%s.main.%d' % (seed, i), refs))
+    return items
+
+
+def ingest_orm(items):
+    session = tables.Session()
+    for main_doi, refs in items:
+        main_paper = Paper(doi=main_doi)
+        session.add(main_paper)
+        session.flush()
+        for ordering, ref in enumerate(refs):
+            if isinstance(ref, dict):
+                reference = Reference(main_paper_id=main_paper.id,
+                                      ref_paper_id=-1, ordering=ordering)
+                session.add(reference)
+                session.flush()
+                session.add(UnknownReference(ref_id=reference.id,
+                                             unknown_text=ref['text']))
+            else:
+                ref_paper = session.query(Paper).filter_by(doi=ref).first()
+                if ref_paper is None:
+                    ref_paper = Paper(doi=ref)
+                    session.add(ref_paper)
+                    session.flush()
+                session.add(Reference(main_paper_id=main_paper.id,
+                                      ref_paper_id=ref_paper.id,
+                                      ordering=ordering))
+        session.commit()
+    session.close()
+
+
+def ingest_bulk(items):
+    for i in range(0, len(items), BULK_BATCH_SIZE):
+        ingest.add_references_bulk(items[i:i + BULK_BATCH_SIZE])
+
+
+def main():
+    methods = {'orm': ingest_orm, 'bulk': ingest_bulk}
+    print('%6s %8s %10s %12s' % ('method', 'papers', 'seconds', 'rows/sec'))
+    with tempfile.TemporaryDirectory() as root:
+        tables.set_db_path(os.path.join(root, 'bench.db'))
+        for name, fn in methods.items():
+            items = make_papers(N_PAPERS[name], name)
+            t0 = time.perf_counter()
+            fn(items)
+            elapsed = time.perf_counter() - t0
+            n_rows = len(items)*N_REFS
+            print('%6s %8d %10.2f %12.0f' % (name, len(items), elapsed,
+                                             n_rows/elapsed))
+        tables.get_engine().dispose()
+
+
+if __name__ == '__main__':
+    main()
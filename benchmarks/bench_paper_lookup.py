@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of Paper.get_from_doi / get_from_pmid as the papers table
+grows.
+
+For each table size three timings are reported (microseconds per lookup):
+    scan   - query on an unindexed copy of the doi column
+    index  - get_from_doi with the in-memory cache cleared before each call
+    memory - get_from_doi served from the in-memory cache
+
+Usage
+-----
+python benchmarks/bench_paper_lookup.py
+"""
+
+#Standard Library
+#------------------------
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Local
+#------------------------
+from reference_resolver import tables
+from reference_resolver.tables import Paper
+
+SIZES = [1000, 10000, 100000, 1000000]
+N_LOOKUPS = 200
+
+
+def use_temporary_db(path):
+    tables.set_db_path(path)
+    return tables.get_engine()
+
+
+def populate(engine, n_papers):
+    rows = [{'doi': '10.%d/paper.%d' % (1000 + i % 5000, i),
+             'pmid': 10000000 + i} for i in range(n_papers)]
+    with engine.begin() as conn:
+        conn.execute(Paper.__table__.insert(), rows)
+        #unindexed copy of the doi for comparison
+        conn.execute('ALTER TABLE papers ADD COLUMN doi_unindexed VARCHAR')
+        conn.execute('UPDATE papers SET doi_unindexed = doi')
+    return [r['doi'] for r in rows]
+
+
+def time_per_call(fn, values):
+    t0 = time.perf_counter()
+    for value in values:
+        fn(value)
+    return 1e6*(time.perf_counter() - t0)/len(values)
+
+
+def run_size(n_papers):
+    with tempfile.TemporaryDirectory() as root:
+        engine = use_temporary_db(os.path.join(root, 'bench.db'))
+        dois = populate(engine, n_papers)
+        sample = random.sample(dois, N_LOOKUPS)
+
+        def scan(doi):
+            with engine.connect() as conn:
+                conn.execute('SELECT id FROM papers WHERE doi_unindexed = ?',
+                             (doi,)).fetchone()
+
+        def index(doi):
+            Paper.clear_lookup_cache()
+            Paper.get_from_doi(doi)
+
+        #Fewer scans as they get slow
+        scan_us = time_per_call(scan, sample[:max(5, N_LOOKUPS*1000//n_papers)])
+        index_us = time_per_call(index, sample)
+
+        Paper.clear_lookup_cache()
+        for doi in sample:
+            Paper.get_from_doi(doi)
+        memory_us = time_per_call(Paper.get_from_doi, sample)
+
+    return scan_us, index_us, memory_us
+
+
+def main():
+    print('%10s %12s %12s %12s' % ('papers', 'scan (us)', 'index (us)',
+                                   'memory (us)'))
+    for n_papers in SIZES:
+        scan_us, index_us, memory_us = run_size(n_papers)
+        print('%10d %12.1f %12.1f %12.2f' % (n_papers, scan_us, index_us,
+                                            memory_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per object memory of references held as dicts, plain objects, namedtuples
+and records.ReferenceRecord.
+
+Each reference has a DOI, title, authors and year (the other attributes
+are None), as a resolved reference typically would. The strings are
+shared between the representations so only the containers are compared.
+
+Usage
+-----
+python benchmarks/bench_records.py
+python benchmarks/bench_records.py 1000000
+"""
+
+#Standard Library
+#------------------------
+import collections
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Local
+#------------------------
+from reference_resolver.records import ReferenceRecord
+from reference_resolver.citations import _CitationDOISearchResponse
+
+
+class PlainReference(object):
+
+    #As ReferenceRecord but with an instance dict
+    def __init__(self, **kwargs):
+        for name in ReferenceRecord._fields:
+            setattr(self, name, kwargs.get(name))
+
+
+class PlainSearchResponse(object):
+
+    #_CitationDOISearchResponse before it used __slots__
+    def __init__(self, json):
+        self.doi = json['doi']
+        self.score = json.get('score')
+        self.normalized_score = json.get('normalized_score')
+        self.raw_key = 'crossref_search/' + 'f'*40
+        self._raw = None
+
+
+ReferenceTuple = collections.namedtuple('ReferenceTuple',
+                                        ReferenceRecord._fields)
+
+
+def make_values(n):
+    return [{'doi': '10.1000/%d' % i,
+             'title': 'Title of paper %d' % i,
+             'authors': 'Smith J; Jones K',
+             'year': 1990 + i % 30}
+            for i in range(n)]
+
+
+def measure(make, values):
+    gc.collect()
+    tracemalloc.start()
+    objects = [make(x) for x in values]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    #The list itself is the same for all representations
+    list_size = sys.getsizeof(objects)
+    del objects
+    return (size - list_size)/len(values)
+
+
+def main(n):
+    values = make_values(n)
+    full = [dict((name, x.get(name)) for name in ReferenceRecord._fields)
+            for x in values]
+
+    print('%d references, bytes per object' % n)
+    print('%-26s %8.0f' % ('dict (all keys)',
+                           measure(lambda x: dict(x), full)))
+    print('%-26s %8.0f' % ('dict (set keys only)',
+                           measure(lambda x: dict(x), values)))
+    print('%-26s %8.0f' % ('plain object',
+                           measure(lambda x: PlainReference(**x), values)))
+    print('%-26s %8.0f' % ('namedtuple',
+                           measure(lambda x: ReferenceTuple(**x), full)))
+    print('%-26s %8.0f' % ('ReferenceRecord',
+                           measure(lambda x: ReferenceRecord(**x), values)))
+
+    responses = [{'doi': x['doi'], 'score': 99.0} for x in values]
+    print('\n%d search responses, bytes per object' % n)
+    print('%-26s %8.0f' % ('plain object',
+                           measure(PlainSearchResponse, responses)))
+    print('%-26s %8.0f' % ('_CitationDOISearchResponse',
+                           measure(lambda x: _CitationDOISearchResponse(
+                               x, 'crossref_search/' + 'f'*40), responses)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
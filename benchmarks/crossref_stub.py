@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for the Crossref services used by reference_resolver.
+
+Serves recorded responses (see fixtures/) for:
+    /dois?q=...   - search.crossref.org citation search
+    /works?...    - api.crossref.org bibliographic queries
+    /works?filter=doi:...,doi:... - api.crossref.org metadata by DOI. An
+                    item is made up for each DOI, except for DOIs
+                    containing 'missing'.
+
+The response for a query is picked deterministically from the recorded
+responses, so repeated queries get the same answer. A latency (with
+optional uniform jitter) can be injected to mimic the real round-trip.
+
+Usage
+-----
+As a standalone server:
+    python benchmarks/crossref_stub.py --port 8080 --latency-ms 150
+
+From code:
+    server = crossref_stub.start(latency_ms=100)
+    crossref_stub.point_resolver_at(server)
+    ...
+    server.shutdown()
+"""
+
+#Standard Library
+#------------------------
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    raise Exception('Python 3.7+ is required for the stand-in server')
+
+from urllib.parse import urlparse, parse_qs
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures')
+
+
+def _load_fixture(name):
+    with open(os.path.join(FIXTURE_PATH, name), 'rb') as f:
+        return [json.dumps(x).encode('utf-8') for x in json.loads(f.read())]
+
+
+def _doi_filter_response(filter_value):
+    items = []
+    for part in filter_value.split(','):
+        name, _, doi = part.partition(':')
+        if name == 'doi' and 'missing' not in doi:
+            items.append({'DOI': doi.upper(),
+                          'title': ['Made up title for %s' % doi],
+                          'container-title': ['Journal of Stand-ins'],
+                          'published': {'date-parts': [[2014, 11]]},
+                          'type': 'journal-article'})
+    message = {'total-results': len(items), 'items': items,
+               'items-per-page': len(items), 'facets': {}}
+    return json.dumps({'status': 'ok', 'message-type': 'work-list',
+                       'message': message}).encode('utf-8')
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    #Keep-alive, so connection pooling on the client side can be measured
+    protocol_version = 'HTTP/1.1'
+    #Otherwise headers and body sent separately can stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        if url.path.endswith('/dois'):
+            responses = server.search_responses
+        elif url.path.endswith('/works'):
+            responses = server.works_responses
+        else:
+            self.send_error(404)
+            return
+
+        if server.latency_s or server.jitter_s:
+            time.sleep(server.latency_s + random.uniform(0, server.jitter_s))
+
+        params = parse_qs(url.query)
+        if 'filter' in params:
+            body = _doi_filter_response(params['filter'][0])
+        else:
+            key = hashlib.md5(url.query.encode('utf-8')).digest()
+            body = responses[key[0] % len(responses)]
+
+        server.count_request()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Rate-Limit-Limit', str(server.rate_limit))
+        self.send_header('X-Rate-Limit-Interval', '1s')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CrossrefStubServer(ThreadingHTTPServer):
+
+    """
+    Attributes
+    ----------
+    url : str
+        Base url, e.g. http://127.0.0.1:51234
+    n_requests : int
+        Number of requests served.
+    """
+
+    daemon_threads = True
+    #The default of 5 is too small for concurrent benchmarks
+    request_queue_size = 512
+
+    def __init__(self, port=0, latency_ms=0, jitter_ms=0, rate_limit=50):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+        #Advertised in the X-Rate-Limit headers, but not enforced
+        self.rate_limit = rate_limit
+        self.latency_s = latency_ms/1000.0
+        self.jitter_s = jitter_ms/1000.0
+        self.search_responses = _load_fixture('search_dois.json')
+        self.works_responses = _load_fixture('works_query.json')
+        self.n_requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def count_request(self):
+        with self._lock:
+            self.n_requests += 1
+
+
+def start(port=0, latency_ms=0, jitter_ms=0, rate_limit=50):
+    """
+    Starts a server on a background thread.
+
+    Returns
+    -------
+    CrossrefStubServer
+    """
+    server = CrossrefStubServer(port, latency_ms, jitter_ms, rate_limit)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def point_resolver_at(server):
+    """
+    Directs all reference_resolver Crossref traffic to the server.
+    """
+    from reference_resolver import citations, crossref
+    citations.SEARCH_URL = server.url + '/dois'
+    crossref.API_URL = server.url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-limit', type=int, default=50,
+                        help='requests per second to advertise')
+    args = parser.parse_args()
+
+    server = CrossrefStubServer(args.port, args.latency_ms, args.jitter_ms,
+                                args.rate_limit)
+    print('Serving recorded Crossref responses on %s' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark suite for reference_resolver.
+
+All Crossref traffic goes to a local stand-in server (crossref_stub.py)
+serving recorded responses with an injected latency, and a temporary
+database is used, so no network access is needed and results are
+repeatable.
+
+For each scenario the following are reported:
+    p50/p99 - per call latency in ms
+    rate    - calls (citations or db operations) per second
+    peak MB - peak memory allocated by Python during the scenario. This is
+              only measured with --memory, since tracing allocations slows
+              everything down. The process' peak RSS is always reported.
+
+With --stages the time spent in each stage of the lookups (see
+reference_resolver/metrics.py) is also printed for each scenario.
+
+Usage
+-----
+python benchmarks/run_benchmarks.py
+python benchmarks/run_benchmarks.py --latency-ms 200 --n 500 --workers 32
+python benchmarks/run_benchmarks.py --only batch_doi,db_cache --memory
+python benchmarks/run_benchmarks.py --only single_doi --stages
+"""
+
+#Standard Library
+#------------------------
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+#Local
+#------------------------
+import crossref_stub
+
+from reference_resolver import batch
+from reference_resolver import cache
+from reference_resolver import citations
+from reference_resolver import ingest
+from reference_resolver import local_match
+from reference_resolver import metrics
+from reference_resolver import main as rr_main
+from reference_resolver import optional
+from reference_resolver import tables
+
+
+def make_citations(n):
+    base = ('Senís, Elena, et al. "CRISPR/Cas9-mediated genome engineering: '
+            'An adeno-associated viral (AAV) vector toolbox. Biotechnology '
+            'journal 9.11 (2014): 1402-1412. [%d]')
+    return [base % i for i in range(n)]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    index = min(len(values) - 1, int(round(fraction*(len(values) - 1))))
+    return values[index]
+
+
+class Timer(object):
+
+    """
+    Wraps a function, recording the duration of each call.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.durations = []
+
+    def __call__(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            self.durations.append(time.perf_counter() - t0)
+
+
+#Scenarios
+#-------------------------------------------------------------------------
+#Each returns (per call durations in seconds, number of calls)
+
+def scenario_single_doi(args, items):
+    timer = Timer(lambda x: citations.citation_to_doi(x, use_cache=False))
+    for item in items:
+        timer(item)
+    return timer.durations, len(items)
+
+
+def scenario_batch_doi(args, items):
+    timer = Timer(lambda x: citations.citation_to_doi(x, use_cache=False))
+    results = batch.run_batch(timer, items, max_workers=args.workers)
+    _check(results)
+    return timer.durations, len(items)
+
+
+def scenario_single_paper_info(args, items):
+    timer = Timer(lambda x: rr_main.citation_to_paper_info(
+        x, use_cache=False, use_local=False))
+    for item in items:
+        timer(item)
+    return timer.durations, len(items)
+
+
+def scenario_batch_paper_info(args, items):
+    timer = Timer(lambda x: rr_main.citation_to_paper_info(
+        x, use_cache=False, use_local=False))
+    results = batch.run_batch(timer, items, max_workers=args.workers)
+    _check(results)
+    return timer.durations, len(items)
+
+
+def scenario_async_doi(args, items):
+    from reference_resolver import aio
+
+    durations = []
+
+    async def timed(citation, client):
+        t0 = time.perf_counter()
+        try:
+            return await aio.async_citation_to_doi(citation, client)
+        finally:
+            durations.append(time.perf_counter() - t0)
+
+    async def run():
+        async with aio.AsyncClient(max_concurrency=args.async_concurrency) as client:
+            return await aio._async_batch(timed, items, client)
+
+    _check(asyncio.run(run()))
+    return durations, len(items)
+
+
+def _make_dois(items):
+    return ['10.5555/meta.%d' % i for i in range(len(items))]
+
+
+def scenario_doi_metadata_single(args, items):
+    #One request per DOI
+    timer = Timer(lambda x: rr_main.dois_to_metadata([x]))
+    results = batch.run_batch(timer, _make_dois(items),
+                              max_workers=args.workers)
+    _check([x.result[0] for x in results])
+    return timer.durations, len(items)
+
+
+def scenario_doi_metadata_chunked(args, items):
+    #Timed per chunk, rate is per DOI
+    fetch = Timer(rr_main._fetch_doi_chunk)
+    original = rr_main._fetch_doi_chunk
+    rr_main._fetch_doi_chunk = fetch
+    try:
+        _check(rr_main.dois_to_metadata(_make_dois(items),
+                                        max_workers=args.workers))
+    finally:
+        rr_main._fetch_doi_chunk = original
+    return fetch.durations, len(items)
+
+
+def scenario_db_ingest(args, items):
+    #Each item is one paper with 50 references
+    n_refs = 50
+    papers = [('10.5555/bench.%d' % i,
+               ['10.5556/ref.%d' % ((i*13 + j) % 20000) for j in range(n_refs)])
+              for i in range(len(items))]
+    timer = Timer(ingest.add_references_bulk)
+    for i in range(0, len(papers), 20):
+        timer(papers[i:i + 20])
+    return timer.durations, len(papers)*n_refs
+
+
+def scenario_db_paper_lookup(args, items):
+    #Uses the papers created by db_ingest if it ran, otherwise mostly misses
+    dois = ['10.5556/ref.%d' % (i % 20000) for i in range(len(items)*10)]
+    tables.Paper.clear_lookup_cache()
+    timer = Timer(tables.Paper.get_from_doi)
+    for doi in dois:
+        timer(doi)
+    return timer.durations, len(dois)
+
+
+def scenario_db_cache(args, items):
+    cache.configure(enabled=True)
+    put_timer = Timer(cache.put)
+    get_timer = Timer(cache.get)
+    for i, item in enumerate(items):
+        put_timer(item, '10.5557/cached.%d' % i, 1.0)
+    for item in items:
+        get_timer(item)
+    cache.configure(enabled=False)
+    return put_timer.durations + get_timer.durations, 2*len(items)
+
+
+SCENARIOS = [('single_doi', scenario_single_doi),
+             ('batch_doi', scenario_batch_doi),
+             ('single_paper_info', scenario_single_paper_info),
+             ('batch_paper_info', scenario_batch_paper_info),
+             ('async_doi', scenario_async_doi),
+             ('doi_metadata_single', scenario_doi_metadata_single),
+             ('doi_metadata_chunked', scenario_doi_metadata_chunked),
+             ('db_ingest', scenario_db_ingest),
+             ('db_paper_lookup', scenario_db_paper_lookup),
+             ('db_cache', scenario_db_cache)]
+
+
+def _check(results):
+    errors = [x.error for x in results if not x.ok]
+    if errors:
+        raise Exception('%d lookups failed, first error: %r' % (len(errors),
+                                                                errors[0]))
+
+
+def run_scenario(fn, args, items):
+    metrics.reset()
+    if args.memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    durations, n_calls = fn(args, items)
+    elapsed = time.perf_counter() - t0
+    if args.memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = '%9.2f' % (peak/1e6)
+    else:
+        peak_mb = '%9s' % '-'
+    return {'p50': 1000*percentile(durations, 0.5),
+            'p99': 1000*percentile(durations, 0.99),
+            'rate': n_calls/elapsed,
+            'peak_mb': peak_mb}
+
+
+def print_stages():
+    timings = metrics.stats()['timings']
+    for name, timing in sorted(timings.items(), key=lambda x: -x[1]['sum']):
+        print('    %-22s %9.2f %9.2f %11d calls' % (name, 1000*timing['mean'],
+              1000*timing['p99'], timing['count']))
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        #Windows
+        return float('nan')
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #bytes on macOS, kilobytes elsewhere
+    return rss/1e6 if sys.platform == 'darwin' else rss/1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline reference_resolver benchmarks')
+    parser.add_argument('--n', type=int, default=200,
+                        help='citations per scenario (single scenarios use n/10)')
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=batch.DEFAULT_MAX_WORKERS)
+    parser.add_argument('--async-concurrency', type=int, default=100)
+    parser.add_argument('--rate-limit', type=int, default=10000,
+                        help='requests per second the stand-in advertises, '
+                             'Crossref allows 50')
+    parser.add_argument('--only', default='',
+                        help='comma separated scenario names')
+    parser.add_argument('--memory', action='store_true',
+                        help='trace peak Python memory per scenario')
+    parser.add_argument('--stages', action='store_true',
+                        help='print the mean and p99 (ms) of each stage')
+    args = parser.parse_args()
+
+    only = [x for x in args.only.split(',') if x]
+    metrics.configure(enabled=args.stages)
+
+    server = crossref_stub.start(latency_ms=args.latency_ms,
+                                 jitter_ms=args.jitter_ms,
+                                 rate_limit=args.rate_limit)
+    crossref_stub.point_resolver_at(server)
+
+    #Network scenarios should always hit the stand-in
+    cache.configure(enabled=False)
+    local_match.configure(enabled=False)
+
+    print('stand-in latency %.0f +/- %.0f ms, %d workers' %
+          (args.latency_ms, args.jitter_ms/2, args.workers))
+    print('%-22s %9s %9s %11s %9s' % ('scenario', 'p50 (ms)', 'p99 (ms)',
+                                      'rate (/s)', 'peak MB'))
+
+    with tempfile.TemporaryDirectory() as root:
+        tables.set_db_path(os.path.join(root, 'bench.db'))
+        for name, fn in SCENARIOS:
+            if only and name not in only:
+                continue
+            if name == 'async_doi' and not optional.aiohttp_available:
+                print('%-22s skipped, aiohttp not installed' % name)
+                continue
+            n = args.n//10 if name.startswith('single') else args.n
+            result = run_scenario(fn, args, make_citations(max(n, 1)))
+            print('%-22s %9.2f %9.2f %11.1f %s' % (name, result['p50'],
+                  result['p99'], result['rate'], result['peak_mb']))
+            if args.stages:
+                print_stages()
+        tables.get_engine().dispose()
+
+    server.shutdown()
+    print('stand-in requests served: %d' % server.n_requests)
+    print('peak RSS: %.1f MB' % peak_rss_mb())
+
+
+if __name__ == '__main__':
+    main()
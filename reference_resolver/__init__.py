@@ -1,5 +1,12 @@
 
 from .main import citation_to_paper_info
+from .main import citations_to_paper_info
+from .main import iter_citations_to_paper_info
+from .main import dois_to_metadata
+
+from .citations import citation_to_doi
+from .citations import citations_to_dois
+from .citations import iter_citations_to_dois
 
 #from .main import paper_info_from_citation
 #from .main import paper_info_from_link
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line interface.
+
+Usage
+-----
+python -m reference_resolver resolve refs.bib refs.jsonl
+python -m reference_resolver resolve citations.txt out.jsonl --workers 16
+python -m reference_resolver crawl 10.1002/biot.201400046 --depth 2
+python -m reference_resolver dedup
+python -m reference_resolver enqueue paper_info citations.txt
+python -m reference_resolver worker --workers 16
+python -m reference_resolver jobs
+python -m reference_resolver export dump/ --format csv --gzip
+python -m reference_resolver import-idmap PMC-ids.csv.gz
+
+Run with --help for the options of each command.
+"""
+
+#Standard Library
+#------------------------
+import argparse
+import sys
+
+#Local
+#------------------------
+from . import batch
+from . import bibfile
+
+
+def _add_resolve_parser(subparsers):
+    parser = subparsers.add_parser(
+        'resolve', help='resolve a bibliography file to DOIs',
+        description='Resolves each entry of a bibliography file, writing '
+                    'one JSON object per line. Interrupted runs resume '
+                    'from their checkpoint when run again.')
+    parser.add_argument('input', help='citations (one per line), .bib or .ris')
+    parser.add_argument('output', help='JSON lines output file')
+    parser.add_argument('--format', choices=bibfile.FORMATS,
+                        help='input format, by default from the extension')
+    parser.add_argument('--method', choices=['paper_info', 'doi'],
+                        default='paper_info',
+                        help='Crossref lookup to use (default: paper_info)')
+    parser.add_argument('--workers', type=int,
+                        default=batch.DEFAULT_MAX_WORKERS,
+                        help='lookups in flight (default: %(default)s)')
+    parser.add_argument('--checkpoint',
+                        help='checkpoint file (default: OUTPUT.checkpoint)')
+    parser.add_argument('--checkpoint-every', type=int,
+                        default=bibfile.DEFAULT_CHECKPOINT_EVERY,
+                        help='entries between checkpoints (default: %(default)s)')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore any checkpoint and start over')
+    parser.add_argument('--db', help='database file (default: refs.db)')
+    parser.add_argument('--quiet', action='store_true')
+    parser.set_defaults(run=_run_resolve)
+
+
+def _run_resolve(args):
+    if args.db:
+        from . import tables
+        tables.set_db_path(args.db)
+
+    def progress(n_done):
+        if not args.quiet:
+            sys.stderr.write('\r%d entries done' % n_done)
+            sys.stderr.flush()
+
+    try:
+        counts = bibfile.resolve_file(
+            args.input, args.output, format=args.format, method=args.method,
+            max_workers=args.workers, checkpoint_path=args.checkpoint,
+            checkpoint_every=args.checkpoint_every, resume=not args.restart,
+            progress=progress)
+    except KeyboardInterrupt:
+        sys.stderr.write('\nInterrupted, run again to resume\n')
+        return 130
+    except ValueError as e:
+        #e.g. a checkpoint for a different input
+        sys.stderr.write('%s\n' % e)
+        return 2
+
+    if not args.quiet:
+        sys.stderr.write('\r%(n_ok)d resolved, %(n_failed)d failed, '
+                         '%(n_skipped)d done previously\n' % counts)
+    return 0
+
+
+def _add_crawl_parser(subparsers):
+    parser = subparsers.add_parser(
+        'crawl', help='store the citation graph around seed papers',
+        description='Retrieves references breadth first from the seed DOIs. '
+                    'Papers whose references are already stored are not '
+                    'fetched again, so an interrupted crawl is resumed by '
+                    'running it again.')
+    parser.add_argument('seeds', nargs='*', help='seed DOIs')
+    parser.add_argument('--seed-file',
+                        help='file with one seed DOI per line')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='levels of references to follow (default: %(default)s)')
+    parser.add_argument('--max-papers', type=int,
+                        help='maximum number of papers to fetch')
+    parser.add_argument('--workers', type=int,
+                        default=batch.DEFAULT_MAX_WORKERS,
+                        help='fetches in flight (default: %(default)s)')
+    parser.add_argument('--db', help='database file (default: refs.db)')
+    parser.add_argument('--quiet', action='store_true')
+    parser.set_defaults(run=_run_crawl)
+
+
+def _run_crawl(args):
+    from . import crawler
+
+    seeds = list(args.seeds)
+    if args.seed_file:
+        with open(args.seed_file) as f:
+            seeds.extend(line.strip() for line in f if line.strip())
+    if not seeds:
+        sys.stderr.write('No seed DOIs given\n')
+        return 2
+
+    if args.db:
+        from . import tables
+        tables.set_db_path(args.db)
+
+    def progress(stats):
+        if not args.quiet:
+            sys.stderr.write('\rdepth %(depth)d: %(fetched)d fetched, '
+                             '%(failed)d failed' % stats)
+            sys.stderr.flush()
+
+    stats = crawler.crawl(seeds, max_depth=args.depth,
+                          max_papers=args.max_papers,
+                          max_workers=args.workers, progress=progress)
+    if not args.quiet:
+        sys.stderr.write('\r%(fetched)d fetched, %(failed)d failed, '
+                         '%(stored)d already stored, %(no_doi)d without a '
+                         'DOI, depth %(depth)d\n' % stats)
+        if not stats['complete']:
+            sys.stderr.write('Stopped at --max-papers, run again to '
+                             'continue\n')
+    return 0
+
+
+def _add_dedup_parser(subparsers):
+    parser = subparsers.add_parser(
+        'dedup', help='merge duplicate papers',
+        description='Merges papers sharing a DOI, PMID or ISBN, including '
+                    'PMIDs and DOIs paired by imported identifier mappings. '
+                    'Only papers added or updated since the last run are '
+                    'checked.')
+    parser.add_argument('--full', action='store_true',
+                        help='recheck all papers, e.g. after import-idmap')
+    parser.add_argument('--db', help='database file (default: refs.db)')
+    parser.set_defaults(run=_run_dedup)
+
+
+def _run_dedup(args):
+    from . import dedup
+
+    if args.db:
+        from . import tables
+        tables.set_db_path(args.db)
+
+    stats = dedup.merge_duplicates(full=args.full)
+    sys.stderr.write('%(processed)d new and %(rechecked)d updated papers '
+                     'checked, %(merged)d merged into %(groups)d groups\n'
+                     % stats)
+    return 0
+
+
+def _add_enqueue_parser(subparsers):
+    from . import jobs
+    parser = subparsers.add_parser(
+        'enqueue', help='add jobs to the database work queue',
+        description='Adds one job per line of the input file to the work '
+                    'queue run by "worker". Lines already queued with the '
+                    'same kind are skipped.')
+    parser.add_argument('kind', choices=jobs.handler_kinds(),
+                        help='paper_info or doi (citations), references (DOIs)')
+    parser.add_argument('input', help='file with one citation or DOI per line')
+    parser.add_argument('--max-attempts', type=int,
+                        help='tries per job (default: %d)'
+                             % jobs.DEFAULT_MAX_ATTEMPTS)
+    parser.add_argument('--db', help='database file (default: refs.db)')
+    parser.set_defaults(run=_run_enqueue)
+
+
+def _run_enqueue(args):
+    from . import jobs
+
+    if args.db:
+        from . import tables
+        tables.set_db_path(args.db)
+
+    with open(args.input) as f:
+        payloads = [line.strip() for line in f if line.strip()]
+    n_added = jobs.enqueue(args.kind, payloads, max_attempts=args.max_attempts)
+    sys.stderr.write('%d jobs added, %d already queued\n'
+                     % (n_added, len(payloads) - n_added))
+    return 0
+
+
+def _add_worker_parser(subparsers):
+    from . import jobs
+    parser = subparsers.add_parser(
+        'worker', help='run jobs from the database work queue',
+        description='Claims and runs queued jobs. Any number of workers, '
+                    'on any hosts sharing the database, can run at once.')
+    parser.add_argument('--kind', action='append', dest='kinds',
+                        help='only run this kind of job (repeatable)')
+    parser.add_argument('--workers', type=int,
+                        default=batch.DEFAULT_MAX_WORKERS,
+                        help='jobs in flight (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int,
+                        default=jobs.DEFAULT_BATCH_SIZE,
+                        help='jobs claimed at a time (default: %(default)s)')
+    parser.add_argument('--lease', type=float,
+                        help='lease in seconds (default: %g)'
+                             % jobs.DEFAULT_LEASE_SECONDS)
+    parser.add_argument('--max-jobs', type=int,
+                        help='exit after running this many jobs')
+    parser.add_argument('--exit-when-empty', action='store_true',
+                        help='exit when no job is claimable')
+    parser.add_argument('--rate-state',
+                        help='file for sharing Crossref rate limits between '
+                             'workers on this host')
+    parser.add_argument('--db', help='database file (default: refs.db)')
+    parser.add_argument('--quiet', action='store_true')
+    parser.set_defaults(run=_run_worker)
+
+
+def _run_worker(args):
+    from . import jobs
+
+    if args.db:
+        from . import tables
+        tables.set_db_path(args.db)
+    if args.rate_state:
+        from . import ratelimit
+        ratelimit.configure(state_path=args.rate_state)
+
+    def progress(stats):
+        if not args.quiet:
+            sys.stderr.write('\r%(done)d done, %(retried)d to retry, '
+                             '%(failed)d failed' % stats)
+            sys.stderr.flush()
+
+    try:
+        stats = jobs.run_worker(kinds=args.kinds, batch_size=args.batch_size,
+                                max_workers=args.workers,
+                                lease_seconds=args.lease,
+                                max_jobs=args.max_jobs,
+                                exit_when_empty=args.exit_when_empty,
+                                progress=progress)
+    except KeyboardInterrupt:
+        #Claimed jobs are picked up by other workers once their lease ends
+        sys.stderr.write('\nInterrupted\n')
+        return 130
+
+    if not args.quiet:
+        sys.stderr.write('\r%(done)d done, %(retried)d to retry, '
+                         '%(failed)d failed, %(lost)d lost\n' % stats)
+    return 0
+
+
+def _add_jobs_parser(subparsers):
+    parser = subparsers.add_parser(
+        'jobs', help='show the state of the work queue',
+        description='Prints the number of jobs in each state.')
+    parser.add_argument('--kind', help='only count this kind of job')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='make failed jobs pending again')
+    parser.add_argument('--db', help='database file (default: refs.db)')
+    parser.set_defaults(run=_run_jobs)
+
+
+def _run_jobs(args):
+    from . import jobs
+
+    if args.db:
+        from . import tables
+        tables.set_db_path(args.db)
+
+    if args.retry_failed:
+        n_reset = jobs.retry_failed(kind=args.kind)
+        sys.stderr.write('%d failed jobs made pending\n' % n_reset)
+
+    counts = jobs.counts(kind=args.kind)
+    for status in jobs.STATUSES:
+        sys.stdout.write('%-8s %d\n' % (status, counts[status]))
+    return 0
+
+
+def _add_export_parser(subparsers):
+    from . import export
+    parser = subparsers.add_parser(
+        'export', help='dump papers and references to JSON lines or CSV',
+        description='Writes one file per table to the output directory, '
+                    'streaming rows so memory use stays flat.')
+    parser.add_argument('directory', help='output directory')
+    parser.add_argument('--format', choices=export.FORMATS, default='jsonl',
+                        help='(default: %(default)s)')
+    parser.add_argument('--gzip', action='store_true',
+                        help='gzip the files')
+    parser.add_argument('--since',
+                        help='only papers created or updated since this UTC '
+                             'time (e.g. 2026-01-31T12:00), and their '
+                             'references')
+    parser.add_argument('--tables', default=','.join(export.TABLES),
+                        help='comma separated (default: %(default)s)')
+    parser.add_argument('--db', help='database file (default: refs.db)')
+    parser.set_defaults(run=_run_export)
+
+
+def _run_export(args):
+    from . import export
+
+    if args.db:
+        from . import tables
+        tables.set_db_path(args.db)
+
+    names = [x for x in args.tables.split(',') if x]
+    for name in names:
+        if name not in export.TABLES:
+            sys.stderr.write('Unrecognized table: %s\n' % name)
+            return 2
+    try:
+        since = export.parse_since(args.since)
+    except ValueError as e:
+        sys.stderr.write('%s\n' % e)
+        return 2
+
+    counts = export.export_all(args.directory, format=args.format,
+                               since=since, compress=args.gzip, names=names)
+    for name in names:
+        sys.stderr.write('%s: %d rows\n' % (name, counts[name]))
+    sys.stderr.write('Use --since %s to export later changes\n'
+                     % counts['started'].isoformat())
+    return 0
+
+
+def _add_import_idmap_parser(subparsers):
+    parser = subparsers.add_parser(
+        'import-idmap', help='load a PMID/PMCID/DOI mapping file',
+        description='Loads a CSV file (e.g. PMC-ids.csv.gz) with PMID, '
+                    'PMCID and/or DOI columns, used to map between these '
+                    'identifiers without any requests.')
+    parser.add_argument('input', help='CSV file, optionally gzipped')
+    parser.add_argument('--append', action='store_true',
+                        help='add to the existing mappings rather than '
+                             'replacing them')
+    parser.add_argument('--db', help='database file (default: refs.db)')
+    parser.add_argument('--quiet', action='store_true')
+    parser.set_defaults(run=_run_import_idmap)
+
+
+def _run_import_idmap(args):
+    from . import idmap
+
+    if args.db:
+        from . import tables
+        tables.set_db_path(args.db)
+
+    def progress(n_rows):
+        if not args.quiet:
+            sys.stderr.write('\r%d rows' % n_rows)
+            sys.stderr.flush()
+
+    try:
+        n_rows = idmap.import_file(args.input, replace=not args.append,
+                                   progress=progress)
+    except ValueError as e:
+        sys.stderr.write('%s\n' % e)
+        return 2
+
+    if not args.quiet:
+        sys.stderr.write('\r%d rows imported\n' % n_rows)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m reference_resolver')
+    subparsers = parser.add_subparsers(dest='command')
+    _add_resolve_parser(subparsers)
+    _add_crawl_parser(subparsers)
+    _add_dedup_parser(subparsers)
+    _add_enqueue_parser(subparsers)
+    _add_worker_parser(subparsers)
+    _add_jobs_parser(subparsers)
+    _add_export_parser(subparsers)
+    _add_import_idmap_parser(subparsers)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
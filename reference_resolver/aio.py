@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio versions of the citation resolvers.
+
+All requests go through a single shared AsyncClient which holds one
+aiohttp session (i.e. one connection pool) and a semaphore limiting how many
+requests are in flight at once.
+
+Example
+-------
+import asyncio
+from reference_resolver import aio
+
+async def run(citations):
+    aio.configure(max_concurrency=200)
+    try:
+        return await aio.async_citations_to_dois(citations)
+    finally:
+        await aio.close_client()
+
+results = asyncio.run(run(citations))
+
+See Also
+--------
+citations.citation_to_doi
+main.citation_to_paper_info
+"""
+
+#Standard Library
+#------------------------
+import asyncio
+
+#Local
+#------------------------
+from .optional import aiohttp
+from . import batch
+from . import citations
+from . import crossref
+from . import main
+from . import metrics
+from . import ratelimit
+from . import raw_store
+from .singleflight import AsyncSingleFlight
+from .utils import normalize_citation
+
+DEFAULT_MAX_CONCURRENCY = 100
+DEFAULT_TIMEOUT = 30
+
+class AsyncClient(object):
+
+    """
+    A non-blocking HTTP client shared by all async lookups.
+
+    The underlying aiohttp session is created on first use. If the client
+    is used from a different event loop than the one it was created in
+    (e.g. from a second asyncio.run() call) the session is recreated.
+
+    Concurrent lookups of the same citation made through a client share a
+    single request (see singleflight.py).
+
+    Attributes
+    ----------
+    max_concurrency : int
+        Maximum number of requests in flight.
+    timeout : float
+        Total timeout per request, in seconds.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+        self._flights = None
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            #The connector limit is left to the semaphore
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._flights = AsyncSingleFlight()
+            self._loop = loop
+        return self._session
+
+    async def coalesce(self, key, fn, *args):
+        """
+        Awaits fn(*args), sharing the result with concurrent callers using
+        the same key.
+        """
+        self._get_session()
+        return await self._flights.do(key, fn, *args)
+
+    async def get_json(self, url, params=None):
+        """
+        Parameters
+        ----------
+        url : str
+        params : dict
+            Query parameters
+
+        Returns
+        -------
+        Decoded JSON
+        """
+        session = self._get_session()
+        for attempt in range(ratelimit._config['max_retries'] + 1):
+            #The wait is outside the semaphore so it doesn't hold a slot
+            wait = ratelimit.reserve(url)
+            metrics.observe('rate_limit_wait', wait)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with self._semaphore:
+                with metrics.timer('http_request'):
+                    async with session.get(url, params=params) as response:
+                        if (ratelimit.update(url, response.status,
+                                             response.headers)
+                                and attempt < ratelimit._config['max_retries']):
+                            continue
+                        response.raise_for_status()
+                        #search.crossref.org doesn't always set a JSON
+                        #content type
+                        return await response.json(content_type=None)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+_client = None
+
+def configure(max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+    """
+    Replaces the shared client with one using the given settings.
+
+    This should be called before any requests are made. Any previously
+    created client is not closed (see close_client).
+    """
+    global _client
+    _client = AsyncClient(max_concurrency=max_concurrency, timeout=timeout)
+    return _client
+
+def get_client():
+    """
+    Returns the shared AsyncClient, creating it if necessary.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncClient()
+    return _client
+
+async def close_client():
+    if _client is not None:
+        await _client.close()
+
+async def async_citation_to_doi(citation, client=None, use_cache=True,
+                                retry_misses=False):
+    """
+    asyncio version of citations.citation_to_doi
+
+    The embedded DOI and cache checks, the min_score check and caching are
+    the same as for the blocking version. The local database calls among
+    these are made on the event loop since they are quick compared to a
+    request.
+
+    Parameters
+    ----------
+    citation : str
+    client : AsyncClient
+        Defaults to the shared client.
+    use_cache : bool
+    retry_misses : bool
+
+    Returns
+    -------
+    citations._CitationDOISearchResponse
+
+    Raises
+    ------
+    errors.CitationNotFoundError
+    """
+    with metrics.timer('citation_to_doi'):
+        response = citations._resolve_without_search(citation, use_cache,
+                                                     retry_misses)
+        if response is not None:
+            return response
+
+        if client is None:
+            client = get_client()
+
+        async def search():
+            with metrics.timer('encode_url'):
+                url = citations._get_search_url(citation)
+            with metrics.timer('crossref_search'):
+                json_data = await client.get_json(url)
+            with metrics.timer('raw_store_put'):
+                raw_key = raw_store.put('crossref_search', url, json_data)
+            return citations._handle_search_response(citation, json_data,
+                                                     raw_key, use_cache)
+
+        return await client.coalesce(('search', normalize_citation(citation)),
+                                     search)
+
+async def async_citation_to_paper_info(citation, client=None, use_cache=True,
+                                       use_local=True, retry_misses=False):
+    """
+    asyncio version of main.citation_to_paper_info
+
+    All strategies are the same as for the blocking version, see
+    async_citation_to_doi.
+
+    Parameters
+    ----------
+    citation : str
+    client : AsyncClient
+        Defaults to the shared client.
+    use_cache : bool
+    use_local : bool
+    retry_misses : bool
+
+    Returns
+    -------
+    main.PaperInfo
+
+    Raises
+    ------
+    errors.CitationNotFoundError
+    """
+    with metrics.timer('citation_to_paper_info'):
+        paper_info = main._resolve_without_query(citation, use_cache,
+                                                 use_local, retry_misses)
+        if paper_info is not None:
+            return paper_info
+
+        if client is None:
+            client = get_client()
+
+        params = {'query.bibliographic': citation,
+                  'select': main.WORKS_SELECT,
+                  'rows': main.WORKS_ROWS}
+
+        async def query():
+            with metrics.timer('crossref_works'):
+                result = await client.get_json(crossref.get_works_url(),
+                                               params=params)
+            with metrics.timer('raw_store_put'):
+                raw_store.put('crossref_works', citation, result)
+            return main._handle_works_response(citation, result, use_cache)
+
+        return await client.coalesce(('works', normalize_citation(citation)),
+                                     query)
+
+async def _async_batch(fn, items, client):
+
+    async def call(index, item):
+        try:
+            return batch.BatchResult(index, item, result=await fn(item, client))
+        except Exception as e:
+            return batch.BatchResult(index, item, error=e)
+
+    #Concurrency is limited by the client, not here
+    return await asyncio.gather(*[call(i, x) for i, x in enumerate(items)])
+
+async def async_citations_to_dois(citations, client=None):
+    """
+    Resolves many citations concurrently on the current event loop.
+
+    Returns
+    -------
+    list of batch.BatchResult
+        In input order, see citations.citations_to_dois
+    """
+    return await _async_batch(async_citation_to_doi, citations, client)
+
+async def async_citations_to_paper_info(citations, client=None):
+    """
+    Returns
+    -------
+    list of batch.BatchResult
+        In input order, see main.citations_to_paper_info
+    """
+    return await _async_batch(async_citation_to_paper_info, citations, client)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers for running a single-item resolver over many inputs.
+
+The resolvers in this package (e.g. citations.citation_to_doi) make one
+blocking network call per input. The functions in this module fan those
+calls out over a thread pool. Errors are captured per item so that one bad
+citation doesn't abort the rest of the batch.
+
+See Also
+--------
+citations.citations_to_dois
+main.citations_to_paper_info
+"""
+
+#Standard Library
+#------------------------
+import collections
+
+#Local
+#------------------------
+from . import utils
+from .utils import get_truncated_display_string as td
+
+DEFAULT_MAX_WORKERS = 8
+
+#Number of submitted but not yet consumed items, per worker. This keeps
+#memory bounded when the input is a (possibly very long) generator.
+_IN_FLIGHT_PER_WORKER = 2
+
+
+class BatchResult(object):
+
+    """
+    The outcome of resolving one item of a batch.
+
+    Attributes
+    ----------
+    index : int
+        Position of the item in the input iterable.
+    input :
+        The item that was passed to the resolver.
+    result :
+        Output of the resolver. None if an error was raised.
+    error : Exception or None
+        The exception raised by the resolver, if any.
+    """
+
+    __slots__ = ('index', 'input', 'result', 'error')
+
+    def __init__(self, index, input, result=None, error=None):
+        self.index = index
+        self.input = input
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        pv = ['index', self.index,
+              'input', td(str(self.input)),
+              'result', td(str(self.result)),
+              'error', repr(self.error)]
+        return utils.property_values_to_string(pv)
+
+
+def _call(fn, index, item):
+    try:
+        return BatchResult(index, item, result=fn(item))
+    except Exception as e:
+        return BatchResult(index, item, error=e)
+
+
+def iter_batch(fn, inputs, max_workers=DEFAULT_MAX_WORKERS, ordered=False):
+    """
+    Applies fn to each input using a pool of worker threads.
+
+    Parameters
+    ----------
+    fn : callable
+        Function taking a single input.
+    inputs : iterable
+        Consumed lazily, so this may be a generator.
+    max_workers : int
+        Maximum number of concurrent calls to fn.
+    ordered : bool
+        If True results are yielded in input order. Otherwise results are
+        yielded as soon as they complete.
+
+    Yields
+    ------
+    BatchResult
+    """
+
+    #Imported here to keep 'import reference_resolver' cheap
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    if max_workers < 1:
+        raise ValueError('max_workers must be at least 1')
+
+    max_in_flight = max_workers*_IN_FLIGHT_PER_WORKER
+
+    source = enumerate(inputs)
+
+    #future => None, only used for tracking what is still outstanding
+    pending = {}
+    #Futures in submission order, used when ordered=True
+    queue = collections.deque()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit_next():
+        try:
+            index, item = next(source)
+        except StopIteration:
+            return False
+        future = executor.submit(_call, fn, index, item)
+        pending[future] = None
+        queue.append(future)
+        return True
+
+    try:
+        while len(pending) < max_in_flight and submit_next():
+            pass
+
+        while pending:
+            if ordered:
+                future = queue.popleft()
+                done = [future]
+                future.result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                del pending[future]
+                if not ordered:
+                    queue.remove(future)
+                yield future.result()
+
+            while len(pending) < max_in_flight and submit_next():
+                pass
+    finally:
+        #Only relevant if the caller stops iterating early
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def run_batch(fn, inputs, max_workers=DEFAULT_MAX_WORKERS, known=None):
+    """
+    Like iter_batch, but returns all results as a list in input order.
+
+    Parameters
+    ----------
+    known : list or None
+        Results already known, one per input (None if not known). fn is
+        only called for the inputs without a known result.
+
+    Returns
+    -------
+    list of BatchResult
+    """
+    if known is None:
+        return list(iter_batch(fn, inputs, max_workers=max_workers,
+                               ordered=True))
+
+    inputs = list(inputs)
+    output = [BatchResult(i, item, result=result)
+              for i, (item, result) in enumerate(zip(inputs, known))]
+    todo = [i for i, result in enumerate(known) if result is None]
+    for result in iter_batch(fn, [inputs[i] for i in todo],
+                             max_workers=max_workers, ordered=True):
+        result.index = todo[result.index]
+        output[result.index] = result
+    return output
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resolving of whole bibliography files.
+
+Supported input formats are:
+    lines  - one citation per line, blank lines are skipped
+    bibtex - .bib files
+    ris    - .ris files
+
+Input is read lazily and resolved with a bounded number of lookups in
+flight, so memory use doesn't depend on the size of the file. Results are
+appended to a JSON lines file as they are resolved. Every so often the
+number of entries written is saved to a checkpoint file, so that a run
+which is interrupted can be resumed where it stopped. The checkpoint records
+the path, size and modification time of the input, and resuming with a
+different or changed input is refused. The checkpoint is removed once the
+whole file has been resolved.
+
+Each output line looks like:
+    {"index": 0, "key": "senis2014", "citation": "...", "doi": "10...",
+     "score": null, "source": "crossref", "error": null}
+
+'source' is 'file' for DOIs given in the file (the BibTeX doi field or RIS
+DO tag, with any doi.org link removed and in lower case; entries whose DOI
+isn't valid are looked up), otherwise where the lookup found the DOI: 'embedded' (in the citation text), 'cache', 'local' (see
+local_match.py) or 'crossref'.
+
+Example
+-------
+from reference_resolver import bibfile
+bibfile.resolve_file('refs.bib', 'refs.jsonl')
+
+or from the command line:
+    python -m reference_resolver resolve refs.bib refs.jsonl
+
+See Also
+--------
+batch.iter_batch
+main.citation_to_paper_info
+"""
+
+#Standard Library
+#------------------------
+import collections
+import itertools
+import json
+import os
+import re
+
+#Local
+#------------------------
+from . import batch
+from . import doi_extract
+from . import utils
+
+DEFAULT_CHECKPOINT_EVERY = 100
+
+FORMATS = ('lines', 'bibtex', 'ris')
+
+_EXTENSIONS = {'.bib': 'bibtex',
+               '.bibtex': 'bibtex',
+               '.ris': 'ris'}
+
+BibEntry = collections.namedtuple('BibEntry', ['key', 'citation', 'doi'])
+BibEntry.__doc__ = """
+key : str
+    BibTeX key, RIS ID, or line number for plain text.
+citation : str
+    Citation text to resolve.
+doi : str or None
+    DOI given in the file itself, in which case no lookup is needed. See
+    _clean_doi.
+"""
+
+#Readers
+#-------------------------------------------------------------------------
+def _format_citation(authors, title, container, year, volume=None,
+                     issue=None, pages=None):
+    """
+    Joins the parts of an entry into a plain text citation, in roughly the
+    form used in reference lists.
+    """
+    parts = []
+    if authors:
+        parts.append(', '.join(authors))
+    if title:
+        parts.append(title)
+    source = container or ''
+    if volume:
+        source += ' ' + volume
+        if issue:
+            source += '(%s)' % issue
+    if year:
+        source += ' (%s)' % year
+    if pages:
+        source += ': ' + pages
+    if source.strip():
+        parts.append(source.strip())
+    return '. '.join(x.strip().rstrip('.') for x in parts) + '.'
+
+
+def read_lines(f):
+    """
+    Parameters
+    ----------
+    f : file
+        Opened in text mode.
+
+    Yields
+    ------
+    BibEntry
+        Keyed by (1 based) line number.
+    """
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if line:
+            yield BibEntry(str(line_number), line, None)
+
+
+_BIBTEX_START = re.compile(r'@\s*(\w+)\s*[{(]')
+_BIBTEX_FIELD = re.compile(r'\s*,?\s*([\w\-:.]+)\s*=\s*', re.UNICODE)
+_BIBTEX_SKIP = ('comment', 'string', 'preamble')
+#Accents, e.g. \'e, and commands like \emph, whose argument is kept
+_LATEX_ACCENT = re.compile(r"\\[`'^\"~=.]")
+_LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+\s*')
+
+
+def _bibtex_value(text, i):
+    """
+    Reads a field value starting at text[i].
+
+    Returns
+    -------
+    (value, index after the value)
+    """
+    pieces = []
+    n = len(text)
+    while i < n:
+        while i < n and text[i].isspace():
+            i += 1
+        if i >= n:
+            break
+        c = text[i]
+        if c == '{':
+            depth = 1
+            start = i + 1
+            i += 1
+            while i < n and depth:
+                if text[i] == '{':
+                    depth += 1
+                elif text[i] == '}':
+                    depth -= 1
+                i += 1
+            pieces.append(text[start:i - 1])
+        elif c == '"':
+            start = i + 1
+            i += 1
+            depth = 0
+            while i < n and (text[i] != '"' or depth):
+                if text[i] == '{':
+                    depth += 1
+                elif text[i] == '}':
+                    depth -= 1
+                i += 1
+            pieces.append(text[start:i])
+            i += 1
+        else:
+            #Bare number or @string macro, the latter is left as is
+            start = i
+            while i < n and text[i] not in ',#}) \t\r\n':
+                i += 1
+            pieces.append(text[start:i])
+
+        while i < n and text[i].isspace():
+            i += 1
+        if i < n and text[i] == '#':
+            i += 1
+            continue
+        break
+
+    value = _LATEX_COMMAND.sub('', _LATEX_ACCENT.sub('', ''.join(pieces)))
+    value = value.replace('{', '').replace('}', '')
+    return ' '.join(value.split()), i
+
+
+def _parse_bibtex_entry(body):
+    """
+    Parameters
+    ----------
+    body : str
+        Everything between the opening and closing brace of an entry.
+
+    Returns
+    -------
+    (key, dict of lowercase field names => values)
+    """
+    key, _, rest = body.partition(',')
+    fields = {}
+    i = 0
+    while True:
+        match = _BIBTEX_FIELD.match(rest, i)
+        if match is None:
+            break
+        value, i = _bibtex_value(rest, match.end())
+        fields[match.group(1).lower()] = value
+    return key.strip(), fields
+
+
+def _clean_doi(value):
+    """
+    Returns a DOI from a file in the form lookups return them, e.g.
+    '10.1000/x' for 'https://doi.org/10.1000/X.', or None if it isn't
+    valid. Entries without a valid DOI are looked up from their citation.
+    """
+    if not value:
+        return None
+    doi = doi_extract.clean_doi(doi_extract.strip_doi_link(value.strip()),
+                                require_known_prefix=False)
+    return utils.normalize_doi(doi)
+
+
+def _bibtex_to_entry(key, fields):
+    authors = [x.strip() for x in fields.get('author', '').split(' and ')
+               if x.strip()]
+    container = (fields.get('journal') or fields.get('booktitle') or
+                 fields.get('publisher'))
+    pages = fields.get('pages', '').replace('--', '-')
+    citation = _format_citation(authors, fields.get('title'), container,
+                                fields.get('year'), fields.get('volume'),
+                                fields.get('number'), pages)
+    return BibEntry(key, citation, _clean_doi(fields.get('doi')))
+
+
+def read_bibtex(f):
+    """
+    A small BibTeX reader, sufficient for building citations.
+
+    Only one entry is held in memory at a time. @string macros are not
+    expanded.
+
+    Parameters
+    ----------
+    f : file
+        Opened in text mode.
+
+    Yields
+    ------
+    BibEntry
+    """
+    entry_type = None
+    buffer = []
+    for line in f:
+        while line:
+            if entry_type is None:
+                match = _BIBTEX_START.search(line)
+                if match is None:
+                    break
+                entry_type = match.group(1).lower()
+                #Only the delimiter that opened the entry is counted, titles
+                #may contain unbalanced parentheses
+                opener = match.group(0)[-1]
+                closer = '}' if opener == '{' else ')'
+                line = line[match.end():]
+                depth = 1
+                buffer = []
+
+            #Find where the entry closes, if on this line
+            end = None
+            for i, c in enumerate(line):
+                if c == opener:
+                    depth += 1
+                elif c == closer:
+                    depth -= 1
+                    if depth == 0:
+                        end = i
+                        break
+
+            if end is None:
+                buffer.append(line)
+                break
+
+            buffer.append(line[:end])
+            if entry_type not in _BIBTEX_SKIP:
+                yield _bibtex_to_entry(*_parse_bibtex_entry(''.join(buffer)))
+            entry_type = None
+
+            #Another entry may start on the same line
+            line = line[end + 1:]
+
+
+_RIS_LINE = re.compile(r'^([A-Z][A-Z0-9])  -\s?(.*)$')
+
+
+def _ris_to_entry(fields, index):
+    def first(*tags):
+        for tag in tags:
+            if fields.get(tag):
+                return fields[tag][0]
+        return None
+
+    year = first('PY', 'Y1', 'DA')
+    if year:
+        year = year.split('/')[0]
+    pages = first('SP')
+    end_page = first('EP')
+    if pages and end_page:
+        pages = '%s-%s' % (pages, end_page)
+    authors = fields.get('AU', []) + fields.get('A1', [])
+    citation = _format_citation(authors, first('TI', 'T1'),
+                                first('JO', 'JF', 'T2', 'JA'), year,
+                                first('VL'), first('IS'), pages)
+    key = first('ID') or str(index)
+    return BibEntry(key, citation, _clean_doi(first('DO')))
+
+
+def read_ris(f):
+    """
+    Parameters
+    ----------
+    f : file
+        Opened in text mode.
+
+    Yields
+    ------
+    BibEntry
+        Keyed by the ID tag if present, otherwise the (1 based) record
+        number.
+    """
+    fields = None
+    index = 0
+    for line in f:
+        match = _RIS_LINE.match(line.rstrip('\r\n'))
+        if match is None:
+            continue
+        tag, value = match.group(1), match.group(2).strip()
+        if tag == 'TY':
+            fields = {}
+            index += 1
+        elif tag == 'ER':
+            if fields is not None:
+                yield _ris_to_entry(fields, index)
+            fields = None
+        elif fields is not None and value:
+            fields.setdefault(tag, []).append(value)
+
+
+_READERS = {'lines': read_lines,
+            'bibtex': read_bibtex,
+            'ris': read_ris}
+
+
+def guess_format(path):
+    """
+    Returns the format implied by the file extension, 'lines' by default.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    return _EXTENSIONS.get(ext, 'lines')
+
+
+def iter_entries(path, format=None):
+    """
+    Parameters
+    ----------
+    path : str
+    format : str
+        See FORMATS. By default this is guessed from the file extension.
+
+    Yields
+    ------
+    BibEntry
+    """
+    if format is None:
+        format = guess_format(path)
+    if format not in _READERS:
+        raise ValueError('Unrecognized bibliography format: %s' % format)
+
+    with open(path, encoding='utf-8-sig', errors='replace') as f:
+        for entry in _READERS[format](f):
+            yield entry
+
+
+#Checkpointing
+#-------------------------------------------------------------------------
+def _read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _input_id(input_path):
+    """
+    Identifies the input file a checkpoint belongs to.
+    """
+    stat = os.stat(input_path)
+    return {'path': os.path.abspath(input_path), 'size': stat.st_size,
+            'mtime': stat.st_mtime}
+
+
+def _write_checkpoint(path, n_done, output_size, input_id):
+    #Written to a temporary file and renamed, so a crash can't leave a
+    #partial checkpoint behind
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'n_done': n_done, 'output_size': output_size,
+                   'input': input_id}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+#Resolving
+#-------------------------------------------------------------------------
+def _get_resolver(method):
+    if method == 'paper_info':
+        from .main import citation_to_paper_info
+        return citation_to_paper_info
+    elif method == 'doi':
+        from .citations import citation_to_doi
+        return citation_to_doi
+    raise ValueError('Unrecognized resolver method: %s' % method)
+
+
+def _to_record(index, entry, result):
+    record = {'index': index,
+              'key': entry.key,
+              'citation': entry.citation,
+              'doi': None,
+              'score': None,
+              'source': None,
+              'error': None}
+    if result.ok:
+        doi, source = result.result
+        if source is None:
+            source = getattr(doi, 'source', None)
+        if isinstance(doi, str):
+            record['doi'] = doi
+        else:
+            record['doi'] = getattr(doi, 'doi', None)
+            record['score'] = getattr(doi, 'score', None)
+        record['source'] = source
+    else:
+        record['error'] = '%s: %s' % (type(result.error).__name__,
+                                      result.error)
+    return record
+
+
+def resolve_file(input_path, output_path, format=None, method='paper_info',
+                 max_workers=batch.DEFAULT_MAX_WORKERS, checkpoint_path=None,
+                 checkpoint_every=DEFAULT_CHECKPOINT_EVERY, resume=True,
+                 progress=None):
+    """
+    Resolves every entry in a bibliography file, writing JSON lines.
+
+    Parameters
+    ----------
+    input_path : str
+    output_path : str
+        Results are written in input order, one JSON object per line.
+    format : str
+        See FORMATS. By default this is guessed from the file extension.
+    method : {'paper_info', 'doi'}
+        'paper_info' uses main.citation_to_paper_info, 'doi' uses
+        citations.citation_to_doi.
+    max_workers : int
+        Maximum number of lookups in flight.
+    checkpoint_path : str
+        Defaults to output_path + '.checkpoint'
+    checkpoint_every : int
+        Number of entries between checkpoints.
+    resume : bool
+        If True and a checkpoint exists, entries already written are
+        skipped and output is appended. Otherwise the output is
+        overwritten.
+    progress : callable
+        Called as progress(n_done) after each checkpoint.
+
+    Returns
+    -------
+    dict
+        'n_ok', 'n_failed' and 'n_skipped' (already done in an earlier run)
+
+    Raises
+    ------
+    ValueError
+        If resuming from a checkpoint made for a different or since
+        changed input file. Use resume=False to start over.
+    """
+
+    resolver = _get_resolver(method)
+
+    if checkpoint_path is None:
+        checkpoint_path = output_path + '.checkpoint'
+
+    input_id = _input_id(input_path)
+    checkpoint = _read_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is not None and os.path.exists(output_path):
+        if checkpoint.get('input') != input_id:
+            raise ValueError('The checkpoint %s is for a different or changed '
+                             'input file. Start over with resume=False '
+                             '(--restart).' % checkpoint_path)
+        n_skipped = checkpoint['n_done']
+        #Anything written after the checkpoint is redone
+        output = open(output_path, 'r+b')
+        output.truncate(checkpoint['output_size'])
+        output.seek(0, os.SEEK_END)
+    else:
+        n_skipped = 0
+        output = open(output_path, 'wb')
+
+    def resolve(entry):
+        if entry.doi:
+            return entry.doi, 'file'
+        #The source is taken from the result, see _to_record
+        return resolver(entry.citation), None
+
+    entries = itertools.islice(iter_entries(input_path, format), n_skipped,
+                               None)
+
+    n_done = n_skipped
+    counts = {'n_ok': 0, 'n_failed': 0, 'n_skipped': n_skipped}
+    try:
+        for result in batch.iter_batch(resolve, entries,
+                                       max_workers=max_workers, ordered=True):
+            record = _to_record(n_skipped + result.index, result.input,
+                                result)
+            output.write(json.dumps(record).encode('utf-8') + b'\n')
+            counts['n_ok' if result.ok else 'n_failed'] += 1
+            n_done += 1
+
+            if n_done % checkpoint_every == 0:
+                output.flush()
+                os.fsync(output.fileno())
+                _write_checkpoint(checkpoint_path, n_done, output.tell(),
+                                  input_id)
+                if progress is not None:
+                    progress(n_done)
+    except BaseException:
+        #e.g. KeyboardInterrupt, save what we have for resuming
+        output.flush()
+        _write_checkpoint(checkpoint_path, n_done, output.tell(), input_id)
+        output.close()
+        raise
+
+    output.close()
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return counts
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent citation => DOI cache, stored in the local database.
+
+citations.citation_to_doi and main.citation_to_paper_info check this cache
+before making any HTTP request and store successful lookups in it.
+
+Entries expire after 'ttl'. Once the cache holds more than 'max_size'
+entries the least recently used ones are removed.
+
+Citations which couldn't be resolved are also cached (as entries without a
+DOI), and expire after the shorter 'negative_ttl', so a citation that never
+resolves only costs a local lookup until then. If 'min_score' is set,
+results scoring below it are treated, and cached, as misses too. Pass
+retry_misses=True to the lookup functions to ignore cached misses.
+
+Example
+-------
+from reference_resolver import cache
+cache.configure(max_size=500000)
+...
+cache.stats()
+=> {'hits': 120, 'misses': 30, 'expired': 2, 'evictions': 0, ...}
+
+See Also
+--------
+tables.CitationCache
+"""
+
+#Standard Library
+#------------------------
+import collections
+import datetime
+import threading
+
+#Local
+#------------------------
+from . import metrics
+from .utils import normalize_citation
+
+#tables (and sqlalchemy) are imported inside the functions below so that
+#importing the package doesn't load the database layer
+
+DEFAULT_TTL = datetime.timedelta(days=90)
+DEFAULT_NEGATIVE_TTL = datetime.timedelta(days=7)
+DEFAULT_MAX_SIZE = 200000
+
+#last_used is only rewritten when it is older than this, so that a stream of
+#hits doesn't turn into a stream of writes
+_LAST_USED_RESOLUTION = datetime.timedelta(minutes=10)
+
+#How often (in number of puts) to check whether eviction is needed
+_EVICT_CHECK_INTERVAL = 100
+
+NOT_FOUND = 'not_found'
+LOW_SCORE = 'low_score'
+
+#doi is None for cached misses, with reason NOT_FOUND or LOW_SCORE
+CachedDOI = collections.namedtuple('CachedDOI', ['doi', 'score', 'fetched',
+                                                 'reason'])
+
+_config = {'enabled': True,
+           'ttl': DEFAULT_TTL,
+           'max_size': DEFAULT_MAX_SIZE,
+           'negative_enabled': True,
+           'negative_ttl': DEFAULT_NEGATIVE_TTL,
+           'min_score': None}
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0,
+          'negative_hits': 0}
+_puts_since_evict_check = 0
+
+def configure(**kwargs):
+    """
+    Parameters
+    ----------
+    enabled : bool
+        If False, get() always misses and put() does nothing.
+    ttl : datetime.timedelta
+        Maximum age of an entry.
+    max_size : int
+        Maximum number of entries to keep.
+    negative_enabled : bool
+        If False, misses are not cached.
+    negative_ttl : datetime.timedelta
+        Maximum age of a cached miss.
+    min_score : float or None
+        Lookups whose best result scores below this are treated as misses.
+        Note search.crossref.org (citation_to_doi) and the /works query
+        (citation_to_paper_info) score on different scales.
+    """
+    for key in kwargs:
+        if key not in _config:
+            raise ValueError('Unrecognized cache option: %s' % key)
+    _config.update(kwargs)
+
+def _incr(name, value=1):
+    with _lock:
+        _stats[name] += value
+
+def get(citation, include_misses=True):
+    """
+    Parameters
+    ----------
+    citation : str
+        Raw citation, normalized internally.
+    include_misses : bool
+        If False, cached misses are ignored (returning None).
+
+    Returns
+    -------
+    CachedDOI or None
+        None if the citation is not cached or has expired. For cached
+        misses 'doi' is None.
+    """
+    if not _config['enabled']:
+        return None
+
+    with metrics.timer('citation_cache_get'):
+        value = _get(citation, include_misses)
+    metrics.hit('citation_cache', value is not None)
+    return value
+
+def _get(citation, include_misses):
+    from . import tables
+    from .tables import CitationCache
+
+    key = normalize_citation(citation)
+    now = datetime.datetime.utcnow()
+
+    session = tables.Session()
+    try:
+        entry = session.query(CitationCache).get(key)
+        is_miss = entry is not None and entry.doi is None
+        if entry is None or (is_miss and not (include_misses and
+                                              _config['negative_enabled'])):
+            _incr('misses')
+            return None
+
+        ttl = _config['negative_ttl'] if is_miss else _config['ttl']
+        if now - entry.fetched > ttl:
+            session.delete(entry)
+            session.commit()
+            _incr('expired')
+            _incr('misses')
+            return None
+
+        value = CachedDOI(entry.doi, entry.score, entry.fetched, entry.reason)
+
+        if now - entry.last_used > _LAST_USED_RESOLUTION:
+            entry.last_used = now
+            session.commit()
+
+        _incr('hits')
+        if is_miss:
+            _incr('negative_hits')
+        return value
+    finally:
+        session.close()
+
+def is_low_score(score):
+    """
+    Returns whether a score is below the configured min_score.
+    """
+    return (_config['min_score'] is not None and score is not None
+            and score < _config['min_score'])
+
+def put_miss(citation, reason=NOT_FOUND, score=None):
+    """
+    Caches that a citation couldn't be resolved.
+
+    Parameters
+    ----------
+    citation : str
+    reason : str
+        NOT_FOUND or LOW_SCORE
+    score : float
+        The best score, for LOW_SCORE
+    """
+    if not _config['negative_enabled']:
+        return
+    _put(citation, None, score, reason)
+
+def put(citation, doi, score=None):
+    """
+    Adds or replaces the cached DOI for a citation.
+    """
+    _put(citation, doi, score, None)
+
+def _put(citation, doi, score, reason):
+    global _puts_since_evict_check
+
+    if not _config['enabled']:
+        return
+
+    from . import tables
+    from .tables import CitationCache
+
+    now = datetime.datetime.utcnow()
+    table = CitationCache.__table__
+
+    statement = table.insert().prefix_with('OR REPLACE').values(
+        citation_key=normalize_citation(citation), doi=doi, score=score,
+        reason=reason, fetched=now, last_used=now)
+
+    with metrics.timer('citation_cache_put'):
+        with tables.get_engine().begin() as conn:
+            conn.execute(statement)
+
+    with _lock:
+        _puts_since_evict_check += 1
+        check_size = _puts_since_evict_check >= _EVICT_CHECK_INTERVAL
+        if check_size:
+            _puts_since_evict_check = 0
+
+    if check_size:
+        evict()
+
+def evict():
+    """
+    Removes the least recently used entries beyond 'max_size'.
+
+    This is called periodically by put() and doesn't normally need to be
+    called directly.
+
+    Returns
+    -------
+    n_removed : int
+    """
+    import sqlalchemy as sql
+    from . import tables
+    from .tables import CitationCache
+
+    table = CitationCache.__table__
+    max_size = _config['max_size']
+
+    with tables.get_engine().begin() as conn:
+        n_entries = conn.execute(
+            sql.select([sql.func.count()]).select_from(table)).scalar()
+        n_remove = n_entries - max_size
+        if n_remove <= 0:
+            return 0
+
+        oldest = sql.select([table.c.citation_key]).order_by(
+            table.c.last_used).limit(n_remove)
+        conn.execute(table.delete().where(table.c.citation_key.in_(oldest)))
+
+    _incr('evictions', n_remove)
+    return n_remove
+
+def clear():
+    """
+    Removes all entries. Counters are not reset, see reset_stats().
+    """
+    from . import tables
+    from .tables import CitationCache
+
+    with tables.get_engine().begin() as conn:
+        conn.execute(CitationCache.__table__.delete())
+
+def stats():
+    """
+    Returns
+    -------
+    dict
+        hits, misses, expired, evictions, negative_hits (hits which were
+        cached misses) and hit_rate (0 to 1). Counters are per process,
+        since the last reset_stats() call.
+    """
+    with _lock:
+        output = dict(_stats)
+    n_lookups = output['hits'] + output['misses']
+    output['hit_rate'] = output['hits']/n_lookups if n_lookups else 0.0
+    return output
+
+def reset_stats():
+    with _lock:
+        for key in _stats:
+            _stats[key] = 0
@@ -12,18 +12,28 @@ if sys.version_info.major == 2:
 else:
     from urllib.parse import quote as urllib_quote
     
-#Third party
-#------------------------    
-import requests
-
-
 #Local
 #------------------------
 from . import utils
+from . import sessions
+from . import cache
+from . import batch
+from . import doi_extract
+from . import metrics
+from .errors import CitationNotFoundError
+from .records import Record
+from . import raw_store
+from .singleflight import SingleFlight
+from .utils import normalize_citation
 from .utils import get_truncated_display_string as td
 #from .utils import get_list_class_display as cld
 
-def citation_to_doi(citation):
+SEARCH_URL = 'http://search.crossref.org/dois'
+
+#Concurrent lookups of the same (normalized) citation share one request
+_flights = SingleFlight()
+
+def citation_to_doi(citation, use_cache=True, retry_misses=False):
     """
 
     Uses a search to CrossRef.org to retrive paper DOI.
@@ -35,16 +45,123 @@ def citation_to_doi(citation):
         Example: Senís, Elena, et al. "CRISPR/Cas9‐mediated genome
                 engineering: An adeno‐associated viral (AAV) vector
                 toolbox. Biotechnology journal 9.11 (2014): 1402-1412.
+    use_cache : bool
+        If True the local citation cache (see cache.py) is checked first
+        and lookups, including failed ones, are added to it.
+    retry_misses : bool
+        If True, citations cached as not found are looked up again.
+        
+    Citations which contain a DOI are resolved to it without any lookup,
+    see doi_extract.py.
+        
+    If the same citation (after normalization) is already being looked up
+    by another thread, that lookup's result is returned instead of making
+    a second request.
                 
     Returns
     -------
     _CitationDOISearchResponse
+        For cached results 'raw' only holds the cached doi and score.
+        Otherwise it is the best match of the response, which is kept in
+        raw_store.py if that is enabled.
+    
+    Raises
+    ------
+    errors.CitationNotFoundError
+        If no DOI was found, the best match scored below the cache's
+        min_score, or this was cached from an earlier lookup.
     
     Usage Notes
     -----------
     This is relatively slow. I'm not sure how much of the slowness is due to 
     parsing into parts versus using those parts to find a DOI (of course those
-    could be done together). 
+    could be done together). The time spent in each stage can be measured
+    with metrics.py.
+    """
+    
+    with metrics.timer('citation_to_doi'):
+        response = _resolve_without_search(citation, use_cache, retry_misses)
+        if response is not None:
+            return response
+        
+        return _flights.do(normalize_citation(citation), _search_citation,
+                           citation, use_cache)
+
+def _embedded_response(doi):
+    return _CitationDOISearchResponse({'doi': doi}, source='embedded')
+
+def _resolve_without_search(citation, use_cache, retry_misses):
+    """
+    The steps of citation_to_doi before the search, shared with the asyncio
+    version (see aio.py).
+    
+    Returns
+    -------
+    _CitationDOISearchResponse or None
+        None if the citation needs to be searched for.
+    """
+    doi = doi_extract.find_doi(citation)
+    metrics.hit('embedded_doi', doi is not None)
+    if doi is not None:
+        return _embedded_response(doi)
+    
+    if use_cache:
+        cached = cache.get(citation, include_misses=not retry_misses)
+        if cached is not None:
+            if cached.doi is None:
+                raise CitationNotFoundError(
+                    'No DOI could be found for the given citation '
+                    '(cached %s)' % cached.reason)
+            return _CitationDOISearchResponse({'doi': cached.doi,
+                                               'score': cached.score},
+                                              source='cache')
+    return None
+
+def _search_citation(citation, use_cache):
+    
+    with metrics.timer('encode_url'):
+        url = _get_search_url(citation)
+    
+    with metrics.timer('crossref_search'):
+        http_response = sessions.get(url)
+    
+    with metrics.timer('json_decode'):
+        json_data = http_response.json()
+    
+    with metrics.timer('raw_store_put'):
+        raw_key = raw_store.put('crossref_search', url, json_data)
+    
+    return _handle_search_response(citation, json_data, raw_key, use_cache)
+
+def _handle_search_response(citation, json_data, raw_key, use_cache):
+    """
+    The steps of citation_to_doi after the search, shared with the asyncio
+    version: parsing, the min_score check and caching.
+    """
+    try:
+        response = _parse_search_response(json_data, raw_key)
+    except LookupError:
+        #Either no results or no DOI in the best one
+        if use_cache:
+            cache.put_miss(citation, cache.NOT_FOUND)
+        raise CitationNotFoundError('No DOI could be found for the given '
+                                    'citation')
+    
+    if cache.is_low_score(response.score):
+        if use_cache:
+            cache.put_miss(citation, cache.LOW_SCORE, response.score)
+        raise CitationNotFoundError('The best match scored %s, below '
+                                    'min_score' % response.score)
+    
+    if use_cache:
+        cache.put(citation, response.doi, response.score)
+    
+    return response
+
+def _get_search_url(citation):
+    """
+    Returns the search.crossref.org query url for a citation. This is shared
+    by the blocking and asyncio (see aio.py) code paths.
     """
     
     citation = urllib_quote(citation)
@@ -55,15 +172,79 @@ def citation_to_doi(citation):
     #Examples: https://search.crossref.org/help/search
     #
     #Inserting /dois as an endpoint converts results from html to JSON
-    api_search_url = 'http://search.crossref.org/dois?q=' + citation
-    json_data = requests.get(api_search_url).json()
+    return SEARCH_URL + '?q=' + citation
+
+def _parse_search_response(json_data, raw_key=None):
+    """
+    Parameters
+    ----------
+    json_data : list
+        Decoded search.crossref.org response
+    raw_key : str or None
+        Key of json_data in raw_store.py, if it was stored
+    """
     
     #Multiple responses are possible. Note we might not have anything:
     best_match_data = json_data[0]
     
-    return _CitationDOISearchResponse(best_match_data)
+    return _CitationDOISearchResponse(best_match_data, raw_key, 'crossref')
+
+def citations_to_dois(citations, max_workers=batch.DEFAULT_MAX_WORKERS):
+    """
+    Resolves many citations concurrently using citation_to_doi.
 
-class _CitationDOISearchResponse(object):
+    Parameters
+    ----------
+    citations : iterable of str
+    max_workers : int
+        Maximum number of requests to have in flight at once.
+        
+    Returns
+    -------
+    list of batch.BatchResult
+        In the same order as the input. The 'result' attribute holds the
+        _CitationDOISearchResponse. Failed lookups have their exception in
+        'error' rather than aborting the batch. Citations containing a DOI
+        are found in a single pass before any lookups are made.
+        
+    See Also
+    --------
+    iter_citations_to_dois
+    """
+    citations = list(citations)
+    known = []
+    for doi in doi_extract.extract_dois(citations):
+        if doi is None:
+            #Counted as a miss by citation_to_doi
+            known.append(None)
+        else:
+            metrics.hit('embedded_doi', True)
+            known.append(_embedded_response(doi))
+    return batch.run_batch(citation_to_doi, citations, max_workers=max_workers,
+                           known=known)
+
+def iter_citations_to_dois(citations, max_workers=batch.DEFAULT_MAX_WORKERS,
+                           ordered=False):
+    """
+    Streaming version of citations_to_dois.
+    
+    Parameters
+    ----------
+    citations : iterable of str
+        Consumed lazily.
+    max_workers : int
+    ordered : bool
+        If False (default), results are yielded as they complete. Use the
+        'index' attribute of each result to map back to the input.
+    
+    Yields
+    ------
+    batch.BatchResult
+    """
+    return batch.iter_batch(citation_to_doi, citations,
+                            max_workers=max_workers, ordered=ordered)
+
+class _CitationDOISearchResponse(Record):
     
     """
     Attributes
@@ -77,14 +258,25 @@ class _CitationDOISearchResponse(object):
     normalized_score : float
         This may always be 100 since we are grabbing the best response
     raw : dict
-        The original JSON response
+        The original JSON response. If raw_key is set this is read from
+        the raw store on each access rather than kept in memory.
+    raw_key : str or None
+        Key of the full search response (all candidates) in raw_store.py
+    source : str
+        Where the DOI came from: 'embedded' (the citation itself), 'cache'
+        or 'crossref'
+        
+    to_dict() returns the attributes other than raw, see records.py
         
     See Also
     --------
     citation_to_doi
     """
+    
+    _fields = ('doi', 'score', 'normalized_score', 'raw_key', 'source')
+    __slots__ = _fields + ('_raw',)
 
-    def __init__(self, json):
+    def __init__(self, json, raw_key=None, source=None):
         """
         Example:
          "doi": "http://dx.doi.org/10.1002/biot.201400046",
@@ -100,16 +292,32 @@ class _CitationDOISearchResponse(object):
             raise LookupError('No DOI could be found for the given citation')
     
         # If crossref returns a http://dx.doi.org/ link, retrieve the doi from it
-        # and save the URL to pass to doi_to_info
         #
         #For now results all seem to be http, no https ...
-        if doi[0:18] == 'http://dx.doi.org/':
-            doi = doi[18:]
-        
-        self.doi = doi
+        self.doi = doi_extract.strip_doi_link(doi)
         self.score = json.get('score')
         self.normalized_score = json.get('normalized_score')
-        self.raw = json
+        self.raw_key = raw_key
+        self.source = source
+        if raw_key is None:
+            self._raw = json
+        else:
+            self._raw = None
+    
+    def __getstate__(self):
+        state = super(_CitationDOISearchResponse, self).__getstate__()
+        return state + (self._raw,)
+    
+    def __setstate__(self, state):
+        super(_CitationDOISearchResponse, self).__setstate__(state[:-1])
+        self._raw = state[-1]
+    
+    @property
+    def raw(self):
+        if self._raw is not None:
+            return self._raw
+        #The best match, see _parse_search_response
+        return raw_store.get(self.raw_key)[0]
         
     def __repr__(self):
         pv = ['doi', self.doi,
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Breadth first crawling of the citation graph.
+
+Starting from seed papers, the references of each paper are retrieved and
+stored, then the references of those references, and so on, up to a given
+depth or number of retrieved papers.
+
+Papers whose references have already been retrieved
+(Paper.references_retrieved is set) are not fetched again; their stored
+references are used to continue the walk. This means an interrupted crawl
+is resumed by running it again with the same seeds: the part of the graph
+that is already stored is walked locally and only the remaining papers are
+fetched.
+
+Each level of the walk is fetched in parallel (see batch.py) and the
+results are written in batches with ingest.add_references_bulk.
+
+Example
+-------
+from reference_resolver import crawler
+stats = crawler.crawl(['10.1002/biot.201400046'], max_depth=2,
+                      max_papers=10000)
+
+or from the command line:
+    python -m reference_resolver crawl 10.1002/biot.201400046 --depth 2
+
+See Also
+--------
+ref_retrieval.retrieve_references
+ingest.add_references_bulk
+"""
+
+#Third party
+#------------------------
+import sqlalchemy as sql
+
+#Local
+#------------------------
+from . import batch
+from . import ingest
+from . import tables
+from .tables import Paper, Reference
+from . import utils
+
+DEFAULT_MAX_DEPTH = 2
+#Papers per database transaction
+DEFAULT_BATCH_SIZE = 50
+
+
+def default_fetch(doi):
+    """
+    Retrieves the references of a paper from its publisher, the default
+    'fetch' of crawl().
+
+    Raises
+    ------
+    LookupError
+        If no references were found.
+    """
+    from . import ref_retrieval
+    references = ref_retrieval.retrieve_references(doi)
+    if references is None:
+        raise LookupError('No references found for %s' % doi)
+    return references
+
+
+def _get_papers(conn, paper_ids):
+    """
+    Returns
+    -------
+    dict
+        paper id => (doi, references retrieved)
+    """
+    papers = Paper.__table__
+    output = {}
+    for chunk in utils.chunks(paper_ids):
+        query = sql.select([papers.c.id, papers.c.doi,
+                            papers.c.references_retrieved]).where(
+            papers.c.id.in_(chunk))
+        for paper_id, doi, retrieved in conn.execute(query):
+            output[paper_id] = (doi, retrieved is not None)
+    return output
+
+
+def _get_reference_ids(conn, paper_ids):
+    """
+    Returns the ids of papers referenced by the given papers, excluding
+    unidentified references.
+    """
+    references = Reference.__table__
+    output = set()
+    for chunk in utils.chunks(paper_ids):
+        query = sql.select([references.c.ref_paper_id]).where(
+            sql.and_(references.c.main_paper_id.in_(chunk),
+                     references.c.ref_paper_id != ingest.UNKNOWN_PAPER_ID)
+            ).distinct()
+        output.update(row[0] for row in conn.execute(query))
+    return output
+
+
+def crawl(seeds, max_depth=DEFAULT_MAX_DEPTH, max_papers=None, fetch=None,
+          max_workers=batch.DEFAULT_MAX_WORKERS,
+          batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Parameters
+    ----------
+    seeds : iterable
+        Papers to start from, e.g. DOIs. See ingest.py for the accepted
+        formats.
+    max_depth : int
+        0 only retrieves the references of the seeds, 1 also those of the
+        papers they reference, etc.
+    max_papers : int or None
+        Maximum number of papers to fetch references for in this call.
+        Papers whose references were already stored don't count.
+    fetch : callable
+        fetch(doi) returning the list of references of a paper (see
+        ingest.py for the accepted formats), raising on failure. Defaults
+        to ref_retrieval.retrieve_references.
+    max_workers : int
+        Number of fetches in flight.
+    batch_size : int
+        Number of papers written per transaction.
+    progress : callable
+        Called as progress(stats) after each written batch.
+
+    Returns
+    -------
+    dict
+        'fetched' : papers whose references were retrieved
+        'failed' : papers whose fetch raised, these are retried next time
+        'stored' : papers skipped as their references were already stored
+        'no_doi' : papers skipped as they have no DOI to fetch with
+        'depth' : last depth reached
+        'complete' : False if max_papers stopped the crawl early
+    """
+    if fetch is None:
+        fetch = default_fetch
+
+    stats = {'fetched': 0, 'failed': 0, 'stored': 0, 'no_doi': 0,
+             'depth': 0, 'complete': True}
+
+    engine = tables.get_engine()
+    frontier = set(ingest.get_paper_ids(seeds))
+    visited = set(frontier)
+
+    for depth in range(max_depth + 1):
+        if not frontier:
+            break
+        stats['depth'] = depth
+
+        with engine.connect() as conn:
+            papers = _get_papers(conn, frontier)
+
+        to_fetch = []
+        for paper_id in sorted(frontier):
+            doi, retrieved = papers[paper_id]
+            if retrieved:
+                stats['stored'] += 1
+            elif doi is None:
+                stats['no_doi'] += 1
+            else:
+                to_fetch.append(doi)
+
+        if max_papers is not None:
+            remaining = max_papers - stats['fetched'] - stats['failed']
+            if len(to_fetch) > remaining:
+                to_fetch = to_fetch[:max(remaining, 0)]
+                stats['complete'] = False
+
+        pending = []
+        for result in batch.iter_batch(fetch, to_fetch,
+                                       max_workers=max_workers):
+            if result.ok:
+                pending.append(({'doi': result.input}, result.result))
+            else:
+                stats['failed'] += 1
+            if len(pending) >= batch_size:
+                _store(pending, stats, progress)
+                pending = []
+        if pending:
+            _store(pending, stats, progress)
+
+        if not stats['complete']:
+            break
+
+        if depth < max_depth:
+            with engine.connect() as conn:
+                next_ids = _get_reference_ids(conn, frontier)
+            frontier = next_ids.difference(visited)
+            visited.update(frontier)
+
+    return stats
+
+
+def _store(pending, stats, progress):
+    ingest.add_references_bulk(pending, replace=True, mark_retrieved=True)
+    stats['fetched'] += len(pending)
+    if progress is not None:
+        progress(stats)
@@ -4,4 +4,104 @@
 Created on Sat Jul 17 08:39:45 2021
 
 @author: jim
+
+Wrapper around the Crossref REST API client (crossref.restful) which routes
+its requests through our shared session (see sessions.py).
 """
+
+#Standard Library
+#------------------------
+import copy
+import threading
+
+#Local
+#------------------------
+from . import sessions
+
+#Base url of the Crossref REST API. This can be changed to point at a
+#mirror or a local stand-in server (see benchmarks/crossref_stub.py).
+_DEFAULT_API_URL = 'https://api.crossref.org'
+API_URL = _DEFAULT_API_URL
+
+def get_works_url():
+    return API_URL + '/works'
+
+def _do_http_request(method, endpoint, data=None, files=None, timeout=100,
+                     only_headers=False, custom_header=None):
+    """
+    Replacement for crossref.restful.HTTPRequest.do_http_request
+    """
+    if only_headers:
+        return sessions.request('head', endpoint, timeout=2,
+                                headers=custom_header)
+    elif method == 'post':
+        return sessions.request('post', endpoint, data=data, files=files,
+                                timeout=timeout, headers=custom_header)
+    else:
+        return sessions.request('get', endpoint, params=data,
+                                timeout=timeout, headers=custom_header)
+
+_works_lock = threading.Lock()
+_works_class = None
+
+def _get_works_class():
+    """
+    Creates the Works subclass on first use. crossref.restful imports
+    requests, which we don't want to pay for on 'import reference_resolver'.
+    """
+    global _works_class
+    if _works_class is None:
+        with _works_lock:
+            if _works_class is None:
+                #https://github.com/ScholarTools/crossrefapi
+                from crossref.restful import Works as _Works
+
+                class SessionWorks(_Works):
+
+                    """
+                    crossref.restful.Works using the shared, pooled session.
+
+                    Query methods (query, filter, select, etc.) return new
+                    instances of this class so derived queries share the
+                    session as well.
+                    """
+
+                    def __init__(self, *args, **kwargs):
+                        #Query methods rebuild the url from the default
+                        #host, so this needs to be handled on every init
+                        request_url = kwargs.get('request_url')
+                        if args:
+                            pass
+                        elif request_url is None:
+                            kwargs['request_url'] = get_works_url()
+                        elif request_url.startswith(_DEFAULT_API_URL):
+                            kwargs['request_url'] = API_URL + \
+                                request_url[len(_DEFAULT_API_URL):]
+                        super(SessionWorks, self).__init__(*args, **kwargs)
+                        self.do_http_request = _do_http_request
+
+                    #The ScholarTools fork provides rows() and get(). These
+                    #fallbacks allow the upstream crossrefapi to be used.
+                    if not hasattr(_Works, 'get'):
+                        def rows(self, n_rows):
+                            output = copy.copy(self)
+                            output.request_params = dict(self.request_params,
+                                                         rows=n_rows)
+                            return output
+
+                        def get(self):
+                            return self.do_http_request(
+                                'get', self.request_url,
+                                data=self.request_params,
+                                custom_header=self.custom_header,
+                                timeout=self.timeout).json()
+
+                _works_class = SessionWorks
+    return _works_class
+
+def Works(*args, **kwargs):
+    """
+    Returns a crossref.restful.Works object whose requests go through the
+    shared session. Arguments are passed through to the Works constructor.
+    """
+    return _get_works_class()(*args, **kwargs)
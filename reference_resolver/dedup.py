@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Merging of duplicate papers.
+
+Papers are duplicates if they share a DOI (ignoring case), a PMID, or an
+ISBN and chapter. Duplicates are found transitively, e.g. a paper known by
+its PMID and another known by its DOI are merged once a paper with both
+is added, or once ingest.py adds the missing identifier to either of them.
+A PMID and DOI are also the same paper if the identifier mappings (see
+idmap.py) say so.
+
+Of each group of duplicates the oldest paper (smallest id) is kept. The
+others are not deleted, instead their new_pointer is set to the kept
+paper's id, so any paper is at most one hop from its canonical paper.
+When groups are joined, all papers pointing to the paper that is no longer
+kept are repointed. Merging also:
+    - rewrites references to the merged papers to the kept paper
+    - keeps the reference list of the kept paper, or if it has none, the
+      list of the oldest merged paper that has one
+    - fills in missing identifiers and bibliographic data of the kept
+      paper from the merged papers
+
+Only papers added since the last run are processed (their ids are above a
+watermark stored in tables.Watermark), as well as papers updated since the
+previous run started (Paper.updated). Run with full=True to recheck all
+papers, e.g. after importing identifier mappings.
+
+Example
+-------
+from reference_resolver import dedup
+stats = dedup.merge_duplicates()
+
+See Also
+--------
+tables.Paper.canonical_id
+ingest.add_references_bulk
+"""
+
+#Standard Library
+#------------------------
+import calendar
+import collections
+import datetime
+
+#Third party
+#------------------------
+import sqlalchemy as sql
+
+#Local
+#------------------------
+from . import tables
+from .tables import IdMapping, Paper, Reference, UnknownReference, Watermark
+from . import utils
+
+WATERMARK_NAME = 'dedup'
+#Start of the last run, as seconds since the epoch (UTC)
+UPDATED_WATERMARK_NAME = 'dedup_updated'
+#New papers processed per transaction
+DEFAULT_CHUNK_SIZE = 20000
+
+#Values copied to the kept paper if it doesn't have them
+_FILL_COLUMNS = ('doi', 'pmid', 'isbn', 'chapter', 'title', 'authors',
+                 'year', 'container', 'references_retrieved')
+
+_PAPER_COLUMNS = ('id', 'new_pointer', 'doi', 'pmid', 'isbn', 'chapter')
+
+
+class UnionFind(object):
+
+    """
+    Disjoint sets of integers. The root of each set is its smallest member.
+    """
+
+    def __init__(self):
+        self._parent = {}
+
+    def find(self, x):
+        parent = self._parent
+        if x not in parent:
+            parent[x] = x
+            return x
+        while parent[x] != x:
+            #Path halving
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+        if a < b:
+            self._parent[b] = a
+        elif b < a:
+            self._parent[a] = b
+
+    def groups(self):
+        """
+        Returns a dict of root => list of members, for sets of two or more.
+        """
+        output = collections.defaultdict(list)
+        for x in self._parent:
+            output[self.find(x)].append(x)
+        return dict((k, v) for k, v in output.items() if len(v) > 1)
+
+
+def _keys(row):
+    """
+    Returns the duplicate detection keys of a paper row.
+    """
+    keys = []
+    if row['doi']:
+        keys.append(('doi', row['doi'].strip().lower()))
+    if row['pmid']:
+        keys.append(('pmid', row['pmid']))
+    if row['isbn']:
+        keys.append(('isbn', row['isbn'].strip(), row['chapter']))
+    return keys
+
+
+def get_watermark(conn, name=WATERMARK_NAME):
+    table = Watermark.__table__
+    value = conn.execute(sql.select([table.c.value]).where(
+        table.c.name == name)).scalar()
+    return value or 0
+
+
+def _set_watermark(conn, value, name=WATERMARK_NAME):
+    table = Watermark.__table__
+    updated = conn.execute(table.update().where(
+        table.c.name == name).values(value=value))
+    if updated.rowcount == 0:
+        conn.execute(table.insert().values(name=name, value=value))
+
+
+def _select_papers(conn, condition):
+    papers = Paper.__table__
+    columns = [papers.c[name] for name in _PAPER_COLUMNS]
+    return [dict(zip(_PAPER_COLUMNS, row))
+            for row in conn.execute(sql.select(columns).where(condition))]
+
+
+def _get_mapped_keys(conn, dois, pmids):
+    """
+    Returns a dict of key => set of keys of the same paper, from the DOI and
+    PMID pairs of the identifier mappings (see idmap.py).
+    """
+    mappings = IdMapping.__table__
+    output = collections.defaultdict(set)
+    for column, values in (('doi', dois), ('pmid', pmids)):
+        for chunk in utils.chunks(values):
+            query = sql.select([mappings.c.doi, mappings.c.pmid]).where(
+                sql.and_(mappings.c[column].in_(chunk),
+                         mappings.c.doi.isnot(None),
+                         mappings.c.pmid.isnot(None)))
+            for doi, pmid in conn.execute(query):
+                output[('doi', doi)].add(('pmid', pmid))
+                output[('pmid', pmid)].add(('doi', doi))
+    return output
+
+
+def _find_matches(conn, new_rows):
+    """
+    Returns
+    -------
+    rows : list
+        All papers (new or old) sharing a key with the new rows, directly
+        or through the identifier mappings.
+    mapped_keys : dict
+        See _get_mapped_keys
+    """
+    papers = Paper.__table__
+    dois = set()
+    pmids = set()
+    isbns = set()
+    for row in new_rows:
+        for key in _keys(row):
+            {'doi': dois, 'pmid': pmids, 'isbn': isbns}[key[0]].add(key[1])
+
+    mapped_keys = _get_mapped_keys(conn, dois, pmids)
+    for keys in list(mapped_keys.values()):
+        for name, value in keys:
+            {'doi': dois, 'pmid': pmids}[name].add(value)
+
+    matches = {}
+    for column, values in (('doi', dois), ('pmid', pmids), ('isbn', isbns)):
+        for chunk in utils.chunks(values):
+            for row in _select_papers(conn, papers.c[column].in_(chunk)):
+                matches[row['id']] = row
+    return list(matches.values()), mapped_keys
+
+
+def _process_chunk(conn, new_rows, stats):
+    papers = Paper.__table__
+
+    #DOIs are normally lower case already (see Paper.normalize_doi) but
+    #older rows or rows written by other tools may not be
+    for row in new_rows:
+        if row['doi'] and row['doi'] != row['doi'].strip().lower():
+            row['doi'] = row['doi'].strip().lower()
+            conn.execute(papers.update().where(papers.c.id == row['id'])
+                         .values(doi=row['doi']))
+
+    rows, mapped_keys = _find_matches(conn, new_rows)
+
+    sets = UnionFind()
+    by_key = {}
+    pointer = {}
+    for row in rows:
+        paper_id = row['id']
+        pointer[paper_id] = row['new_pointer'] or 0
+        sets.find(paper_id)
+        if row['new_pointer']:
+            #Already merged, so join with the group it was merged into
+            sets.union(paper_id, row['new_pointer'])
+        keys = _keys(row)
+        for key in list(keys):
+            keys.extend(mapped_keys.get(key, ()))
+        for key in keys:
+            other = by_key.setdefault(key, paper_id)
+            sets.union(paper_id, other)
+
+    for kept, members in sets.groups().items():
+        #Papers that were canonical (not pointing anywhere) but are no
+        #longer. Papers not in 'pointer' were only reached via pointers,
+        #so they are canonical.
+        demoted = [x for x in members if x != kept and not pointer.get(x)]
+        if not demoted:
+            continue
+        stats['merged'] += len(demoted)
+        stats['groups'] += 1
+        _merge(conn, kept, demoted)
+
+
+def _merge(conn, kept, demoted):
+    papers = Paper.__table__
+    references = Reference.__table__
+    unknown = UnknownReference.__table__
+
+    #Repoint everything, including papers merged into the demoted ones
+    #earlier, so every paper stays at most one hop from the kept one
+    for chunk in utils.chunks(demoted):
+        conn.execute(papers.update().where(
+            sql.or_(papers.c.id.in_(chunk), papers.c.new_pointer.in_(chunk))
+            ).values(new_pointer=kept))
+
+    #Fill in the kept paper's missing values, oldest duplicate first
+    columns = [papers.c.id] + [papers.c[x] for x in _FILL_COLUMNS]
+    rows = conn.execute(sql.select(columns).where(
+        papers.c.id.in_([kept] + demoted)).order_by(papers.c.id)).fetchall()
+    kept_row = [x for x in rows if x[0] == kept]
+    if kept_row:
+        values = {}
+        for i, name in enumerate(_FILL_COLUMNS, 1):
+            if kept_row[0][i] is None:
+                for row in rows:
+                    if row[i] is not None:
+                        values[name] = row[i]
+                        break
+        if values:
+            conn.execute(papers.update().where(papers.c.id == kept)
+                         .values(**values))
+
+    #Citations of the duplicates become citations of the kept paper
+    for chunk in utils.chunks(demoted):
+        conn.execute(references.update().where(
+            references.c.ref_paper_id.in_(chunk)).values(ref_paper_id=kept))
+
+    #Only one reference list is kept
+    with_refs = set(row[0] for row in conn.execute(
+        sql.select([references.c.main_paper_id]).where(
+            references.c.main_paper_id.in_([kept] + demoted)).distinct()))
+    if not with_refs:
+        return
+    if kept in with_refs:
+        adopted = None
+    else:
+        adopted = min(with_refs)
+        conn.execute(references.update().where(
+            references.c.main_paper_id == adopted).values(main_paper_id=kept))
+    dropped = [x for x in with_refs if x not in (kept, adopted)]
+    if dropped:
+        ref_ids = sql.select([references.c.id]).where(
+            references.c.main_paper_id.in_(dropped))
+        conn.execute(unknown.delete().where(unknown.c.ref_id.in_(ref_ids)))
+        conn.execute(references.delete().where(
+            references.c.main_paper_id.in_(dropped)))
+
+
+def _process_query(engine, query, stats, set_watermark=False):
+    """
+    Checks the papers selected by a query in one transaction. With
+    'set_watermark' the watermark is moved past them in the same
+    transaction.
+
+    Returns
+    -------
+    list
+        The selected rows, empty when done.
+    """
+    n_merged = stats['merged']
+    with engine.begin() as conn:
+        rows = [dict(zip(_PAPER_COLUMNS, row)) for row in conn.execute(query)]
+        if not rows:
+            return rows
+        _process_chunk(conn, rows, stats)
+        if set_watermark:
+            _set_watermark(conn, rows[-1]['id'])
+
+    if stats['merged'] != n_merged:
+        #Core updates bypass the ORM events that keep this up to date.
+        #Cleared per chunk so lookups during a long run aren't stale.
+        Paper.clear_lookup_cache()
+    return rows
+
+
+def _to_seconds(value):
+    return calendar.timegm(value.utctimetuple())
+
+
+def merge_duplicates(full=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Merges duplicate papers added or updated since the last run.
+
+    Parameters
+    ----------
+    full : bool
+        If True all papers are (re)checked, not just new ones.
+    chunk_size : int
+        Number of new papers processed per transaction.
+
+    Returns
+    -------
+    dict
+        'processed' : number of new papers checked
+        'rechecked' : number of previously checked papers checked again as
+            they were updated
+        'merged' : number of papers merged into another
+        'groups' : number of groups of duplicates changed
+    """
+    papers = Paper.__table__
+    engine = tables.get_engine()
+    stats = {'processed': 0, 'rechecked': 0, 'merged': 0, 'groups': 0}
+    #Papers updated from here on are rechecked by the next run
+    started = datetime.datetime.utcnow()
+
+    with engine.connect() as conn:
+        watermark = 0 if full else get_watermark(conn)
+        updated_since = (0 if full else
+                         get_watermark(conn, UPDATED_WATERMARK_NAME))
+
+    columns = [papers.c[name] for name in _PAPER_COLUMNS]
+    if updated_since:
+        #Second resolution, so some papers may be rechecked twice
+        since = datetime.datetime.utcfromtimestamp(updated_since)
+        last_id = 0
+        while True:
+            query = sql.select(columns).where(sql.and_(
+                papers.c.id > last_id, papers.c.id <= watermark,
+                papers.c.updated >= since)).order_by(
+                papers.c.id).limit(chunk_size)
+            rows = _process_query(engine, query, stats)
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            stats['rechecked'] += len(rows)
+
+    while True:
+        query = sql.select(columns).where(papers.c.id > watermark).order_by(
+            papers.c.id).limit(chunk_size)
+        new_rows = _process_query(engine, query, stats,
+                                  set_watermark=True)
+        if not new_rows:
+            break
+        watermark = new_rows[-1]['id']
+        stats['processed'] += len(new_rows)
+
+    with engine.begin() as conn:
+        _set_watermark(conn, _to_seconds(started), UPDATED_WATERMARK_NAME)
+
+    return stats
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Extraction of DOIs embedded in citations.
+
+Many reference strings already contain their DOI, either bare
+('doi:10.1002/biot.201400046') or as a link ('https://doi.org/10.1002/...',
+'http://dx.doi.org/10.1002%2F...'). citation_to_doi and
+citation_to_paper_info use find_doi to resolve these without any request.
+
+A found DOI is cleaned up:
+    - URL encoding is decoded
+    - trailing punctuation (e.g. the full stop ending the citation) and
+      unbalanced closing brackets are removed
+and validated:
+    - it must have the form 10.<4 to 9 digits>[.<digits>...]/<suffix>
+    - its prefix must be in the publisher index (see publishers.py), unless
+      configured otherwise. The index is a snapshot so newer prefixes may be
+      missing; those citations are looked up as before.
+
+If a citation contains several DOIs the first valid one is used.
+
+Example
+-------
+from reference_resolver import doi_extract
+doi_extract.find_doi('Senís E, et al. Biotechnol J. 2014. '
+                     'doi:10.1002/biot.201400046.')
+=> '10.1002/biot.201400046'
+dois = doi_extract.extract_dois(citations)
+
+See Also
+--------
+publishers.is_known_prefix
+"""
+
+#Standard Library
+#------------------------
+import bisect
+import re
+
+try:
+    from urllib.parse import unquote
+except ImportError:
+    from urllib import unquote
+
+#Local
+#------------------------
+from . import publishers
+
+_config = {'enabled': True,
+           'require_known_prefix': True}
+
+#Candidate DOIs, including a URL encoded slash. Not preceded by a word
+#character or '.', so e.g. '110.1000/x' or 'v10.1000/x' don't match.
+_CANDIDATE = re.compile(r'(?<![\w.])10\.\d{4,9}(?:\.\d+)*(?:/|%2[fF])'
+                        r'[^\s"\'<>]+')
+_VALID = re.compile(r'10\.\d{4,9}(?:\.\d+)*/[^\s"\'<>]+$')
+
+#doi.org (or dx.doi.org) links and 'doi:' labels in front of a DOI
+_LINK_PREFIX = re.compile(r'(?:https?://(?:dx\.)?doi\.org/|doi:\s*)',
+                          re.IGNORECASE)
+
+_TRAILING = '.,;:\'"'
+_BRACKETS = {')': '(', ']': '[', '}': '{'}
+
+
+def configure(**kwargs):
+    """
+    Parameters
+    ----------
+    enabled : bool
+        If False find_doi and extract_dois find nothing, so all citations
+        are looked up.
+    require_known_prefix : bool
+        Only accept DOIs whose prefix is in the publisher index.
+    """
+    for key in kwargs:
+        if key not in _config:
+            raise ValueError('Unrecognized DOI extraction option: %s' % key)
+    _config.update(kwargs)
+
+
+def strip_doi_link(value):
+    """
+    Removes a leading doi.org link or 'doi:' label from a DOI.
+
+    Example
+    -------
+    strip_doi_link('http://dx.doi.org/10.1002/biot.201400046')
+    => '10.1002/biot.201400046'
+    """
+    match = _LINK_PREFIX.match(value)
+    if match is None:
+        return value
+    return value[match.end():]
+
+
+def clean_doi(candidate, require_known_prefix=None):
+    """
+    Returns the DOI in a candidate string, or None if it isn't valid.
+
+    Parameters
+    ----------
+    candidate : str
+    require_known_prefix : bool
+        By default the configured value.
+    """
+    if require_known_prefix is None:
+        require_known_prefix = _config['require_known_prefix']
+    if '%' in candidate:
+        candidate = unquote(candidate)
+
+    while candidate:
+        last = candidate[-1]
+        if last in _TRAILING:
+            candidate = candidate[:-1]
+        elif last in _BRACKETS and (candidate.count(last) >
+                                    candidate.count(_BRACKETS[last])):
+            #e.g. '(doi:10.1000/xyz)', but not '10.1002/(SICI)...(1997)'
+            candidate = candidate[:-1]
+        else:
+            break
+
+    if not _VALID.match(candidate):
+        return None
+    if (require_known_prefix and
+            not publishers.is_known_prefix(publishers.get_doi_prefix(candidate))):
+        return None
+    return candidate
+
+
+def find_doi(citation):
+    """
+    Returns the first valid DOI in a citation, or None.
+    """
+    if not _config['enabled'] or not citation or '10.' not in citation:
+        return None
+    for match in _CANDIDATE.finditer(citation):
+        doi = clean_doi(match.group())
+        if doi is not None:
+            return doi
+    return None
+
+
+def extract_dois(citations):
+    """
+    find_doi for many citations.
+
+    The citations are joined and searched with a single regular expression
+    pass, rather than one search per citation.
+
+    Parameters
+    ----------
+    citations : list of str
+
+    Returns
+    -------
+    list
+        The DOI or None for each citation.
+    """
+    output = [None]*len(citations)
+    if not _config['enabled'] or not citations:
+        return output
+
+    #Start of each citation in the joined text. Candidates can't contain
+    #whitespace, so can't span two citations.
+    starts = []
+    position = 0
+    for citation in citations:
+        starts.append(position)
+        position += len(citation or '') + 1
+    text = '\n'.join(citation or '' for citation in citations)
+
+    for match in _CANDIDATE.finditer(text):
+        i = bisect.bisect_right(starts, match.start()) - 1
+        if output[i] is None:
+            output[i] = clean_doi(match.group())
+    return output
@@ -11,3 +11,10 @@ class DatabaseError(Exception):
 
 class UnsupportedTypeError(Exception):
     pass
+
+class CitationNotFoundError(LookupError):
+    """
+    A citation couldn't be resolved, or only with a score below
+    cache.configure(min_score=...).
+    """
+    pass
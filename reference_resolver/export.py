@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming export of the papers, references and unknown_references tables
+to JSON lines or CSV files, optionally gzip compressed.
+
+Rows are read in chunks through a streaming cursor and written as they are
+read, without going through the ORM, so memory use doesn't depend on the
+size of the tables.
+
+Incremental exports
+-------------------
+With 'since', only papers created or updated at or after that time (UTC)
+are exported, along with the reference lists of those papers and their
+unknown references. Adding references to a paper (see ingest.py) marks it
+as updated. Note that merging duplicates (dedup.py) repoints
+references of other papers to the merged paper without changing those
+papers, so a full export is needed to pick that up.
+
+Each file is written under a temporary name and renamed when complete, so
+readers never see a partial export.
+
+Example
+-------
+from reference_resolver import export
+counts = export.export_all('/data/dump', format='csv', compress=True)
+for row in export.iter_rows('papers', since='2026-01-01'):
+    ...
+
+or from the command line:
+    python -m reference_resolver export /data/dump --format csv --gzip
+
+See Also
+--------
+tables.Paper
+"""
+
+#Standard Library
+#------------------------
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+
+#Third party
+#------------------------
+import sqlalchemy as sql
+
+#Local
+#------------------------
+from . import tables
+from .tables import Paper, Reference, UnknownReference
+
+TABLES = ('papers', 'references', 'unknown_references')
+FORMATS = ('jsonl', 'csv')
+
+#Rows fetched from the database at a time
+DEFAULT_CHUNK_SIZE = 10000
+
+_TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S',
+                 '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S.%f',
+                 '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def parse_since(value):
+    """
+    Returns a datetime from a datetime or an ISO 8601 string (UTC, without
+    a time zone), or None.
+    """
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    for time_format in _TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    raise ValueError('Unrecognized time, expected e.g. 2026-01-31T12:00: %s'
+                     % value)
+
+
+def _changed_papers(since):
+    papers = Paper.__table__
+    return sql.func.coalesce(papers.c.updated, papers.c.created) >= since
+
+
+def _query(name, since):
+    """
+    Returns the select statement for a table, ordered by id.
+    """
+    papers = Paper.__table__
+    references = Reference.__table__
+    unknown = UnknownReference.__table__
+
+    if name == 'papers':
+        query = sql.select([papers])
+        if since is not None:
+            query = query.where(_changed_papers(since))
+        return query.order_by(papers.c.id)
+
+    if name == 'references':
+        query = sql.select([references])
+        if since is not None:
+            changed = sql.select([papers.c.id]).where(_changed_papers(since))
+            query = query.where(references.c.main_paper_id.in_(changed))
+        return query.order_by(references.c.id)
+
+    if name == 'unknown_references':
+        query = sql.select([unknown])
+        if since is not None:
+            changed = sql.select([papers.c.id]).where(_changed_papers(since))
+            ref_ids = sql.select([references.c.id]).where(
+                references.c.main_paper_id.in_(changed))
+            query = query.where(unknown.c.ref_id.in_(ref_ids))
+        return query.order_by(unknown.c.id)
+
+    raise ValueError('Unrecognized table: %s' % name)
+
+
+def get_columns(name):
+    """
+    Returns the column names of an exportable table, in export order.
+    """
+    if name not in TABLES:
+        raise ValueError('Unrecognized table: %s' % name)
+    return [column.name for column in tables.Base.metadata.tables[name].columns]
+
+
+def iter_rows(name, since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the rows of a table as tuples, in the order of get_columns(name)
+    and by increasing id.
+
+    Parameters
+    ----------
+    name : str
+        One of TABLES
+    since : datetime or str
+        See the module documentation.
+    chunk_size : int
+        Rows fetched at a time.
+    """
+    query = _query(name, parse_since(since))
+    engine = tables.get_engine()
+    with engine.connect() as conn:
+        #Asks drivers that buffer results by default to stream them
+        result = conn.execution_options(stream_results=True).execute(query)
+        try:
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield tuple(row)
+        finally:
+            result.close()
+
+
+def _json_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _open(path, compress):
+    if compress:
+        raw = gzip.open(path, 'wb')
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    return io.open(path, 'w', encoding='utf-8', newline='')
+
+
+def export_table(name, path, format=None, since=None, compress=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Parameters
+    ----------
+    name : str
+        One of TABLES
+    path : str
+    format : {'jsonl', 'csv'}
+        By default from the extension of path (ignoring .gz), otherwise
+        'jsonl'.
+    since : datetime or str
+        See the module documentation.
+    compress : bool
+        gzip the output. By default if path ends in .gz.
+    chunk_size : int
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    if compress is None:
+        compress = path.endswith('.gz')
+    if format is None:
+        base = path[:-3] if path.endswith('.gz') else path
+        format = 'csv' if base.lower().endswith('.csv') else 'jsonl'
+    if format not in FORMATS:
+        raise ValueError('Unrecognized export format: %s' % format)
+
+    columns = get_columns(name)
+    n_rows = 0
+    temp_path = path + '.tmp'
+    try:
+        with _open(temp_path, compress) as f:
+            if format == 'csv':
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for row in iter_rows(name, since, chunk_size):
+                    #csv writes None as an empty string
+                    writer.writerow(row)
+                    n_rows += 1
+            else:
+                for row in iter_rows(name, since, chunk_size):
+                    f.write(json.dumps(dict(zip(columns, map(_json_value,
+                                                              row)))))
+                    f.write('\n')
+                    n_rows += 1
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return n_rows
+
+
+def export_all(directory, format='jsonl', since=None, compress=False,
+               names=TABLES, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Exports tables to <directory>/<table>.<format>[.gz]
+
+    Returns
+    -------
+    dict
+        table name => number of rows written, and 'started', the (UTC) time
+        the export started. Passing that as 'since' next time exports
+        everything changed since this export.
+    """
+    started = datetime.datetime.utcnow()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    output = {}
+    for name in names:
+        file_name = '%s.%s%s' % (name, format, '.gz' if compress else '')
+        output[name] = export_table(name, os.path.join(directory, file_name),
+                                    format=format, since=since,
+                                    compress=compress, chunk_size=chunk_size)
+    output['started'] = started
+    return output
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+An in-memory snapshot of the citation graph, for fast bibliometrics.
+
+The graph is loaded from the references table into compressed sparse row
+(CSR) arrays, both forward (paper => its references) and reverse (paper =>
+papers citing it). Papers are numbered 0..n_papers-1 internally; all public
+methods take and return database paper ids.
+
+Memory use is about 24 bytes per paper plus 8 bytes per citation.
+
+Definitions
+-----------
+in degree          : number of papers citing a paper
+out degree         : number of references of a paper (that are identified)
+co-citation(a, b)  : number of papers citing both a and b
+coupling(a, b)     : number of references a and b have in common
+
+Example
+-------
+from reference_resolver import graph
+g = graph.CitationGraph.load()
+citing_ids = g.citations(paper_id)
+ids, counts = g.cocited_with(paper_id, n=10)
+
+See Also
+--------
+tables.Reference
+crawler.crawl
+"""
+
+#Third party
+#------------------------
+import numpy as np
+
+#Local
+#------------------------
+from . import utils
+
+#Rows fetched from the database at a time when loading
+_FETCH_SIZE = 100000
+
+_LOAD_SQL = ('SELECT main_paper_id, ref_paper_id FROM "references" '
+             'WHERE ref_paper_id >= 0 AND main_paper_id IS NOT NULL')
+
+
+def _gather(indptr, indices, rows):
+    """
+    Returns the concatenated neighbors of the given rows, without a Python
+    loop over the rows.
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=indices.dtype)
+    #For each output element, its position in indices: the start of its
+    #row plus its offset within the row
+    row_offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(total) - np.repeat(row_offsets - starts, lengths)
+    return indices[positions]
+
+
+def _sorted_unique(values):
+    #Faster than np.unique, which may hash rather than sort
+    values = np.sort(values)
+    if len(values):
+        keep = np.empty(len(values), dtype=bool)
+        keep[0] = True
+        np.not_equal(values[1:], values[:-1], out=keep[1:])
+        values = values[keep]
+    return values
+
+
+def _indptr(rows, n):
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr
+
+
+class CitationGraph(object):
+
+    """
+    Attributes
+    ----------
+    ids : numpy array of int64
+        Sorted database ids of all papers in the graph.
+    n_papers : int
+    n_citations : int
+        Number of distinct (citing, cited) pairs.
+    """
+
+    def __init__(self, ids, out_indptr, out_indices, in_indptr, in_indices):
+        self.ids = ids
+        self._out_indptr = out_indptr
+        self._out_indices = out_indices
+        self._in_indptr = in_indptr
+        self._in_indices = in_indices
+
+    #Construction
+    #---------------------------------------------------------------------
+    @classmethod
+    def from_edges(cls, citing, cited):
+        """
+        Parameters
+        ----------
+        citing : array-like of int
+            Paper ids of the citing papers
+        cited : array-like of int
+            Paper ids of the cited papers, same length as citing.
+            Duplicate pairs are counted once.
+        """
+        citing = np.asarray(citing, dtype=np.int64)
+        cited = np.asarray(cited, dtype=np.int64)
+        if citing.shape != cited.shape:
+            raise ValueError('citing and cited must have the same length')
+
+        ids = _sorted_unique(np.concatenate((citing, cited)))
+        n = len(ids)
+        src = np.searchsorted(ids, citing)
+        dst = np.searchsorted(ids, cited)
+
+        #Sorting the combined key both removes duplicate citations and
+        #orders the edges by citing paper, then cited paper
+        pairs = _sorted_unique(src*n + dst)
+        src = pairs//n
+        dst = (pairs % n).astype(np.int32)
+        del pairs
+
+        out_indptr = _indptr(src, n)
+        out_indices = dst
+
+        #A stable sort by cited paper keeps the citing papers sorted
+        order = np.argsort(dst, kind='mergesort')
+        in_indptr = _indptr(dst, n)
+        in_indices = src[order].astype(np.int32)
+        return cls(ids, out_indptr, out_indices, in_indptr, in_indices)
+
+    @classmethod
+    def load(cls, engine=None):
+        """
+        Snapshots the references table.
+
+        Unidentified references (see ingest.UNKNOWN_PAPER_ID) are left out.
+        Rows are streamed from the database so only the arrays are held in
+        memory.
+
+        Parameters
+        ----------
+        engine : sqlalchemy engine
+            Defaults to tables.get_engine()
+        """
+        if engine is None:
+            from . import tables
+            engine = tables.get_engine()
+
+        chunks = []
+        conn = engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(_LOAD_SQL)
+            while True:
+                rows = cursor.fetchmany(_FETCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(np.array(rows, dtype=np.int64).reshape(-1, 2))
+            cursor.close()
+        finally:
+            conn.close()
+
+        if chunks:
+            edges = np.concatenate(chunks)
+        else:
+            edges = np.empty((0, 2), dtype=np.int64)
+        return cls.from_edges(edges[:, 0], edges[:, 1])
+
+    def save(self, path):
+        """
+        Saves the arrays to a .npz file, see load_file.
+        """
+        np.savez(path, ids=self.ids,
+                 out_indptr=self._out_indptr, out_indices=self._out_indices,
+                 in_indptr=self._in_indptr, in_indices=self._in_indices)
+
+    @classmethod
+    def load_file(cls, path):
+        with np.load(path) as data:
+            return cls(data['ids'], data['out_indptr'], data['out_indices'],
+                       data['in_indptr'], data['in_indices'])
+
+    #Properties
+    #---------------------------------------------------------------------
+    @property
+    def n_papers(self):
+        return len(self.ids)
+
+    @property
+    def n_citations(self):
+        return len(self._out_indices)
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the arrays, in bytes.
+        """
+        return sum(x.nbytes for x in (self.ids, self._out_indptr,
+                                      self._out_indices, self._in_indptr,
+                                      self._in_indices))
+
+    def __repr__(self):
+        pv = ['n_papers', self.n_papers,
+              'n_citations', self.n_citations,
+              'nbytes', self.nbytes]
+        return utils.property_values_to_string(pv)
+
+    #Id mapping
+    #---------------------------------------------------------------------
+    def _to_index(self, paper_ids):
+        """
+        Returns (node indices, mask of ids which are in the graph)
+        """
+        paper_ids = np.atleast_1d(np.asarray(paper_ids, dtype=np.int64))
+        index = np.searchsorted(self.ids, paper_ids)
+        index[index == len(self.ids)] = 0
+        found = self.ids[index] == paper_ids if len(self.ids) else \
+            np.zeros(len(paper_ids), dtype=bool)
+        return index, found
+
+    def _node(self, paper_id):
+        index, found = self._to_index(paper_id)
+        if not found[0]:
+            return None
+        return index[0]
+
+    def __contains__(self, paper_id):
+        return self._node(paper_id) is not None
+
+    #Neighbors
+    #---------------------------------------------------------------------
+    def references(self, paper_id):
+        """
+        Returns the ids of papers referenced by the paper, sorted.
+        """
+        node = self._node(paper_id)
+        if node is None:
+            return np.empty(0, dtype=np.int64)
+        indptr = self._out_indptr
+        return self.ids[self._out_indices[indptr[node]:indptr[node + 1]]]
+
+    def citations(self, paper_id):
+        """
+        Returns the ids of papers citing the paper, sorted.
+        """
+        node = self._node(paper_id)
+        if node is None:
+            return np.empty(0, dtype=np.int64)
+        indptr = self._in_indptr
+        return self.ids[self._in_indices[indptr[node]:indptr[node + 1]]]
+
+    def out_degree(self, paper_ids=None):
+        """
+        Parameters
+        ----------
+        paper_ids : array-like or None
+            If None, the degrees of all papers (in the order of self.ids)
+
+        Returns
+        -------
+        numpy array
+            0 for papers not in the graph
+        """
+        return self._degree(self._out_indptr, paper_ids)
+
+    def in_degree(self, paper_ids=None):
+        """
+        Number of citations of each paper, see out_degree.
+        """
+        return self._degree(self._in_indptr, paper_ids)
+
+    def _degree(self, indptr, paper_ids):
+        degrees = np.diff(indptr)
+        if paper_ids is None:
+            return degrees
+        index, found = self._to_index(paper_ids)
+        return np.where(found, degrees[index], 0)
+
+    def most_cited(self, n=10):
+        """
+        Returns
+        -------
+        (paper ids, citation counts)
+            The n most cited papers, most cited first.
+        """
+        degrees = self.in_degree()
+        n = min(n, len(degrees))
+        top = np.argsort(-degrees, kind='mergesort')[:n]
+        return self.ids[top], degrees[top]
+
+    #Similarity
+    #---------------------------------------------------------------------
+    def _counts(self, first_indptr, first_indices, second_indptr,
+                second_indices, paper_id, n):
+        node = self._node(paper_id)
+        if node is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        middle = first_indices[first_indptr[node]:first_indptr[node + 1]]
+        others = _gather(second_indptr, second_indices, middle)
+        counts = np.bincount(others, minlength=self.n_papers)
+        counts[node] = 0
+        nonzero = np.flatnonzero(counts)
+        #Highest count first, ties by id
+        order = np.argsort(-counts[nonzero], kind='mergesort')
+        if n is not None:
+            order = order[:n]
+        nodes = nonzero[order]
+        return self.ids[nodes], counts[nodes]
+
+    def cocited_with(self, paper_id, n=None):
+        """
+        Papers cited together with the given paper.
+
+        Returns
+        -------
+        (paper ids, co-citation counts)
+            Highest counts first. If n is given only the top n.
+        """
+        #citers of the paper, then everything they cite
+        return self._counts(self._in_indptr, self._in_indices,
+                            self._out_indptr, self._out_indices, paper_id, n)
+
+    def coupled_with(self, paper_id, n=None):
+        """
+        Papers sharing references with the given paper.
+
+        Returns
+        -------
+        (paper ids, number of shared references)
+            Highest counts first. If n is given only the top n.
+        """
+        #references of the paper, then everything citing them
+        return self._counts(self._out_indptr, self._out_indices,
+                            self._in_indptr, self._in_indices, paper_id, n)
+
+    def cocitation(self, a, b):
+        """
+        Returns the number of papers citing both a and b.
+        """
+        return len(np.intersect1d(self.citations(a), self.citations(b),
+                                  assume_unique=True))
+
+    def coupling(self, a, b):
+        """
+        Returns the number of references a and b have in common.
+        """
+        return len(np.intersect1d(self.references(a), self.references(b),
+                                  assume_unique=True))
+
+    #Neighborhoods
+    #---------------------------------------------------------------------
+    def neighborhood(self, paper_ids, k=1, direction='out'):
+        """
+        Papers within k citation hops.
+
+        Parameters
+        ----------
+        paper_ids : int or array-like
+            Starting papers. Those not in the graph are ignored.
+        k : int
+        direction : {'out', 'in', 'both'}
+            'out' follows references, 'in' follows citations.
+
+        Returns
+        -------
+        numpy array
+            Sorted paper ids, including the starting papers.
+        """
+        if direction not in ('out', 'in', 'both'):
+            raise ValueError('direction must be "out", "in" or "both"')
+
+        index, found = self._to_index(paper_ids)
+        frontier = np.unique(index[found])
+        visited = np.zeros(self.n_papers, dtype=bool)
+        visited[frontier] = True
+
+        for hop in range(k):
+            if not len(frontier):
+                break
+            parts = []
+            if direction in ('out', 'both'):
+                parts.append(_gather(self._out_indptr, self._out_indices,
+                                     frontier))
+            if direction in ('in', 'both'):
+                parts.append(_gather(self._in_indptr, self._in_indices,
+                                     frontier))
+            reached = np.unique(np.concatenate(parts))
+            frontier = reached[~visited[reached]]
+            visited[frontier] = True
+
+        return self.ids[np.flatnonzero(visited)]
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local PMID/PMCID/DOI crosswalk.
+
+Converting identifiers through a web service takes one request per id.
+Instead, a mapping file is imported once into the id_mappings table and
+lookups are answered from its indices, e.g. for millions of PMIDs in
+seconds.
+
+Supported files are CSV files (optionally gzipped) with a header row
+containing at least two of 'PMID', 'PMCID' and 'DOI' (case insensitive),
+such as:
+    - the PMC id mapping file, PMC-ids.csv.gz
+      https://ftp.ncbi.nlm.nih.gov/pub/pmc/PMC-ids.csv.gz
+    - the Europe PMC PMID_PMCID_DOI.csv.gz
+      https://europepmc.org/ftp/pid/PMID_PMCID_DOI.csv.gz
+Other columns are ignored. DOIs may be given as doi.org links. Rows with
+fewer than two identifiers are skipped.
+
+The file is read and inserted in chunks, in a single transaction, so
+memory use doesn't depend on the size of the file and readers see either
+the old or the new mapping. When replacing the table, its indices are
+dropped during the import and rebuilt at the end, which is much faster
+than updating them row by row.
+
+Example
+-------
+from reference_resolver import idmap
+idmap.import_file('PMC-ids.csv.gz')
+dois = idmap.pmids_to_dois([24736437, 26000000])
+=> ['10.1002/biot.201400046', None]
+
+or from the command line:
+    python -m reference_resolver import-idmap PMC-ids.csv.gz
+
+See Also
+--------
+tables.IdMapping
+"""
+
+#Standard Library
+#------------------------
+import csv
+import gzip
+import io
+
+#Third party
+#------------------------
+import sqlalchemy as sql
+
+#Local
+#------------------------
+from . import doi_extract
+from . import tables
+from .tables import IdMapping
+from . import utils
+
+ID_TYPES = ('pmid', 'pmcid', 'doi')
+
+#Rows inserted per executemany
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def normalize_pmid(value):
+    """
+    Returns a PMID as an int, or None if it isn't one.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        pmid = int(value)
+    except ValueError:
+        return None
+    return pmid if pmid > 0 else None
+
+
+def normalize_pmcid(value):
+    """
+    Returns e.g. 'PMC4231239' for 'PMC4231239', 'pmc4231239' or 4231239,
+    or None.
+    """
+    if value is None:
+        return None
+    value = str(value).strip().upper()
+    if value.startswith('PMC'):
+        value = value[3:]
+    if not value.isdigit():
+        return None
+    return 'PMC' + value
+
+
+def normalize_doi(value):
+    """
+    Returns a lower case DOI, also accepting doi.org links, or None.
+    """
+    if not value:
+        return None
+    value = doi_extract.strip_doi_link(value.strip())
+    if not value.startswith('10.'):
+        return None
+    return utils.normalize_doi(value)
+
+
+_NORMALIZERS = {'pmid': normalize_pmid,
+                'pmcid': normalize_pmcid,
+                'doi': normalize_doi}
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8',
+                                newline='')
+    return io.open(path, encoding='utf-8', newline='')
+
+
+def iter_file(path):
+    """
+    Yields (pmid, pmcid, doi) for each usable row of a mapping file.
+
+    Raises
+    ------
+    ValueError
+        If the header doesn't name at least two of the identifiers.
+    """
+    with _open(path) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        names = [x.strip().lower() for x in header]
+        positions = [names.index(x) if x in names else None
+                     for x in ID_TYPES]
+        if sum(x is not None for x in positions) < 2:
+            raise ValueError('Expected a header with at least two of PMID, '
+                             'PMCID and DOI in %s, found: %s'
+                             % (path, ', '.join(header)))
+
+        pmid_i, pmcid_i, doi_i = positions
+        n_columns = max(x for x in positions if x is not None) + 1
+        for row in reader:
+            if len(row) < n_columns:
+                continue
+            pmid = None if pmid_i is None else normalize_pmid(row[pmid_i])
+            pmcid = None if pmcid_i is None else normalize_pmcid(row[pmcid_i])
+            doi = None if doi_i is None else normalize_doi(row[doi_i])
+            if (pmid is not None) + (pmcid is not None) + (doi is not None) > 1:
+                yield pmid, pmcid, doi
+
+
+def import_file(path, replace=True, chunk_size=DEFAULT_CHUNK_SIZE,
+                progress=None):
+    """
+    Loads a mapping file into the id_mappings table.
+
+    Parameters
+    ----------
+    path : str
+        See the module documentation for the format.
+    replace : bool
+        If True, existing mappings are deleted first. Otherwise the rows
+        are added to them, e.g. to combine several sources.
+    chunk_size : int
+        Rows inserted at a time.
+    progress : callable
+        Called with the number of rows imported so far after each chunk.
+
+    Returns
+    -------
+    int
+        Number of rows imported.
+    """
+    table = IdMapping.__table__
+    n_rows = 0
+    with tables.get_engine().begin() as conn:
+        if replace:
+            conn.execute(table.delete())
+            for index in table.indexes:
+                index.drop(conn)
+
+        rows = []
+        for pmid, pmcid, doi in iter_file(path):
+            rows.append({'pmid': pmid, 'pmcid': pmcid, 'doi': doi})
+            if len(rows) == chunk_size:
+                conn.execute(table.insert(), rows)
+                n_rows += len(rows)
+                rows = []
+                if progress is not None:
+                    progress(n_rows)
+        if rows:
+            conn.execute(table.insert(), rows)
+            n_rows += len(rows)
+            if progress is not None:
+                progress(n_rows)
+
+        if replace:
+            for index in table.indexes:
+                index.create(conn)
+    return n_rows
+
+
+def map_ids(ids, source, target):
+    """
+    Maps identifiers of one type to another using the imported mappings.
+
+    Parameters
+    ----------
+    ids : iterable
+    source : {'pmid', 'pmcid', 'doi'}
+        Type of the input ids.
+    target : {'pmid', 'pmcid', 'doi'}
+
+    Returns
+    -------
+    list
+        The mapped id, or None if unknown, for each input id in order. If
+        an id has several mappings, the first imported one is used.
+    """
+    if source not in ID_TYPES or target not in ID_TYPES:
+        raise ValueError('Unrecognized identifier type, options are: %s'
+                         % ', '.join(ID_TYPES))
+
+    normalize = _NORMALIZERS[source]
+    keys = [normalize(x) for x in ids]
+
+    table = IdMapping.__table__
+    source_column = table.c[source]
+    target_column = table.c[target]
+    found = {}
+    with tables.get_engine().connect() as conn:
+        for chunk in utils.chunks(set(x for x in keys if x is not None)):
+            query = sql.select([source_column, target_column]).where(
+                sql.and_(source_column.in_(chunk),
+                         target_column.isnot(None))).order_by(table.c.id)
+            for key, value in conn.execute(query):
+                found.setdefault(key, value)
+    return [found.get(x) for x in keys]
+
+
+def pmids_to_dois(pmids):
+    """
+    Returns the DOI, or None, for each PMID. See map_ids.
+    """
+    return map_ids(pmids, 'pmid', 'doi')
+
+
+def dois_to_pmids(dois):
+    """
+    Returns the PMID, or None, for each DOI. See map_ids.
+    """
+    return map_ids(dois, 'doi', 'pmid')
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk insertion of papers and their reference lists.
+
+This replaces the old db.add_references(refs=..., main_paper_doi=...)
+workflow (see notes in main.py). Rather than adding one ORM object at a
+time, all rows for a batch of papers are written with a handful of
+executemany statements inside a single transaction.
+
+Example
+-------
+from reference_resolver import ingest
+refs = ['10.1038/nrg3686',
+        {'pmid': 4200},
+        {'text': 'Smith J. Some conference abstract. 2011'}]
+main_paper_id = ingest.add_references('10.1002/biot.201400046', refs)
+
+Paper and reference specifications
+----------------------------------
+A paper can be given as:
+    - a DOI string
+    - a dict with any of 'doi', 'pmid', 'isbn'
+    - an object with any of those attributes (e.g. a PaperInfo)
+A reference can be given as any of the above. References without an
+identifier but with text (dict keys 'text', 'unknown_text' or 'citation',
+or a string that isn't a DOI) are stored as UnknownReference rows. A string
+is only taken to be a DOI if it is one as a whole, e.g. not a citation
+starting with '10. Smith J, ...'.
+
+All identifiers given are stored. A paper matching an existing one on any
+of them (preferring doi, then pmid, then isbn) is that paper, and any
+identifiers it is missing are filled in.
+
+Dicts and objects may also have 'title', 'authors' (str or list of str),
+'year' and 'container' values. These are stored for newly created papers
+and make them available to local_match.py.
+
+See Also
+--------
+tables.Paper
+tables.Reference
+tables.UnknownReference
+"""
+
+#Standard Library
+#------------------------
+import collections
+import datetime
+
+#Third party
+#------------------------
+import sqlalchemy as sql
+
+#Local
+#------------------------
+from . import doi_extract
+from . import tables
+from .tables import Paper, Reference, UnknownReference
+from . import utils
+
+#ref_paper_id value used for references we couldn't identify
+UNKNOWN_PAPER_ID = -1
+
+_ID_KEYS = ('doi', 'pmid', 'isbn')
+_TEXT_KEYS = ('text', 'unknown_text', 'citation')
+_METADATA_KEYS = ('title', 'authors', 'year', 'container')
+_NO_METADATA = dict((name, None) for name in _METADATA_KEYS)
+
+
+def _parse_paper(value):
+    """
+    Returns
+    -------
+    key : tuple or None
+        ((column name, value), ...) of every identifier given, in _ID_KEYS
+        (preference) order
+    text : str or None
+        For unidentified references.
+    """
+    if value is None:
+        return None, None
+
+    if isinstance(value, str):
+        doi = doi_extract.clean_doi(value.strip(), require_known_prefix=False)
+        if doi is not None:
+            return (('doi', utils.normalize_doi(doi)),), None
+        return None, value
+
+    if isinstance(value, dict):
+        get = value.get
+    else:
+        get = lambda name: getattr(value, name, None)
+
+    key = []
+    for name in _ID_KEYS:
+        id_value = get(name)
+        if id_value is not None and id_value != '':
+            if name == 'doi':
+                id_value = utils.normalize_doi(id_value)
+            elif name == 'pmid':
+                id_value = int(id_value)
+            key.append((name, id_value))
+    if key:
+        return tuple(key), None
+
+    for name in _TEXT_KEYS:
+        text = get(name)
+        if text:
+            return None, text
+
+    return None, None
+
+
+def _parse_metadata(value):
+    """
+    Returns a dict with a value (possibly None) for every _METADATA_KEYS
+    entry, or None if there is no metadata.
+    """
+    if value is None or isinstance(value, str):
+        return None
+
+    if isinstance(value, dict):
+        get = value.get
+    else:
+        get = lambda name: getattr(value, name, None)
+
+    output = dict((name, get(name)) for name in _METADATA_KEYS)
+    if not any(output.values()):
+        return None
+
+    if isinstance(output['authors'], (list, tuple)):
+        output['authors'] = '; '.join(output['authors'])
+    if output['year'] is not None:
+        output['year'] = int(output['year'])
+    return output
+
+
+def _select_ids(conn, name, values):
+    """
+    Returns a dict of value => paper id for the given identifier column.
+    Papers merged as duplicates (see dedup.py) are replaced by the paper
+    they were merged into. Otherwise if duplicates exist the oldest
+    (smallest id) wins.
+    """
+    table = Paper.__table__
+    column = table.c[name]
+    output = {}
+    for chunk in utils.chunks(values):
+        query = sql.select([column, table.c.id, table.c.new_pointer]).where(
+            column.in_(chunk)).order_by(table.c.id)
+        for value, paper_id, new_pointer in conn.execute(query):
+            output.setdefault(value, new_pointer or paper_id)
+    return output
+
+
+def _get_or_create_paper_ids(conn, keys, metadata):
+    """
+    Papers are matched on any of their identifiers, preferring a match on
+    an earlier one in _ID_KEYS. Identifiers a matched paper is missing are
+    filled in.
+
+    Parameters
+    ----------
+    keys : list of keys from _parse_paper()
+        New papers are created in this order, so their ids don't depend on
+        hashing. Duplicates are ignored.
+    metadata : dict
+        key => dict from _parse_metadata(). Only used for new papers.
+
+    Returns
+    -------
+    ids : dict
+        key => paper id
+    filled_ids : set
+        Ids of existing papers which were given identifiers.
+    """
+    now = datetime.datetime.utcnow()
+    keys = list(collections.OrderedDict.fromkeys(keys))
+
+    #(column name, value) => paper id, for existing papers
+    found = {}
+    for name in _ID_KEYS:
+        values = list(collections.OrderedDict.fromkeys(
+            value for key in keys for key_name, value in key
+            if key_name == name))
+        if values:
+            for value, paper_id in _select_ids(conn, name, values).items():
+                found[(name, value)] = paper_id
+
+    #Keys with identifiers in common are the same new paper
+    new_rows = []
+    #(column name, value) => index into new_rows
+    pending = {}
+    #key => (existing paper id, None) or (None, index into new_rows)
+    matches = {}
+    #paper id => {column name: value}
+    fills = collections.defaultdict(dict)
+    for key in keys:
+        paper_id = next((found[pair] for pair in key if pair in found), None)
+        if paper_id is not None:
+            matches[key] = (paper_id, None)
+            for name, value in key:
+                if found.get((name, value)) != paper_id:
+                    fills[paper_id].setdefault(name, value)
+            continue
+
+        index = next((pending[pair] for pair in key if pair in pending), None)
+        if index is None:
+            index = len(new_rows)
+            #executemany needs the same columns in every row
+            row = metadata.get(key) or _NO_METADATA
+            new_rows.append(dict(row, created=now, new_pointer=0,
+                                 **dict((name, None) for name in _ID_KEYS)))
+        row = new_rows[index]
+        for name, value in key:
+            if row[name] is None:
+                row[name] = value
+                pending.setdefault((name, value), index)
+        matches[key] = (None, index)
+
+    filled_ids = _fill_ids(conn, fills)
+
+    new_ids = []
+    if new_rows:
+        conn.execute(Paper.__table__.insert(), new_rows)
+        #Each new row is found by its preferred identifier, which no
+        #other paper had
+        selected = {}
+        for name in _ID_KEYS:
+            values = [row[name] for row in new_rows if row[name] is not None]
+            selected[name] = _select_ids(conn, name, values) if values else {}
+        for row in new_rows:
+            name = next(name for name in _ID_KEYS if row[name] is not None)
+            new_ids.append(selected[name][row[name]])
+
+    ids = {}
+    for key, (paper_id, index) in matches.items():
+        ids[key] = new_ids[index] if paper_id is None else paper_id
+    return ids, filled_ids
+
+
+def _fill_ids(conn, fills):
+    """
+    Sets identifier columns which are NULL.
+
+    Parameters
+    ----------
+    fills : dict
+        paper id => {column name: value}
+
+    Returns
+    -------
+    set
+        Ids of the papers which were changed.
+    """
+    papers = Paper.__table__
+    filled_ids = set()
+    for name in _ID_KEYS:
+        for chunk in utils.chunks(paper_id for paper_id in fills
+                                  if name in fills[paper_id]):
+            query = sql.select([papers.c.id]).where(sql.and_(
+                papers.c.id.in_(chunk), papers.c[name].is_(None)))
+            empty = [row[0] for row in conn.execute(query)]
+            if not empty:
+                continue
+            conn.execute(
+                papers.update().where(papers.c.id == sql.bindparam('_id'))
+                .values(**{name: sql.bindparam('_value')}),
+                [{'_id': paper_id, '_value': fills[paper_id][name]}
+                 for paper_id in empty])
+            filled_ids.update(empty)
+    return filled_ids
+
+
+def _delete_references(conn, main_paper_ids):
+    references = Reference.__table__
+    unknown = UnknownReference.__table__
+    for chunk in utils.chunks(main_paper_ids):
+        ref_ids = sql.select([references.c.id]).where(
+            references.c.main_paper_id.in_(chunk))
+        conn.execute(unknown.delete().where(unknown.c.ref_id.in_(ref_ids)))
+        conn.execute(references.delete().where(
+            references.c.main_paper_id.in_(chunk)))
+
+
+def add_references_bulk(items, replace=True, mark_retrieved=False):
+    """
+    Adds many papers with their ordered reference lists in one transaction.
+
+    Parameters
+    ----------
+    items : iterable of (paper, references)
+        See the module documentation for the accepted formats.
+    replace : bool
+        If True, existing references of each paper are replaced. Otherwise
+        the new references are added to any existing ones.
+    mark_retrieved : bool
+        If True, Paper.references_retrieved is set for the main papers,
+        i.e. the reference lists are complete.
+
+    Returns
+    -------
+    list of int
+        Database ids of the main papers, in input order.
+    """
+    main_keys = []
+    #main paper key => parsed references. If a paper is given more than
+    #once the last reference list wins.
+    parsed = {}
+    #In input order, see _get_or_create_paper_ids
+    keys = []
+    metadata = {}
+    
+    def add_metadata(key, value):
+        paper_metadata = _parse_metadata(value)
+        if paper_metadata is not None:
+            metadata.setdefault(key, paper_metadata)
+    
+    for paper, references in items:
+        main_key, _ = _parse_paper(paper)
+        if main_key is None:
+            raise ValueError('Main paper needs a doi, pmid or isbn: %r' % (paper,))
+        main_keys.append(main_key)
+        keys.append(main_key)
+        add_metadata(main_key, paper)
+
+        parsed_refs = []
+        for reference in references:
+            key, text = _parse_paper(reference)
+            if key is not None:
+                keys.append(key)
+                add_metadata(key, reference)
+            parsed_refs.append((key, text))
+        parsed[main_key] = parsed_refs
+
+    engine = tables.get_engine()
+    with engine.begin() as conn:
+        ids, filled_ids = _get_or_create_paper_ids(conn, keys, metadata)
+        main_ids = set(ids[main_key] for main_key in parsed)
+
+        if replace:
+            _delete_references(conn, main_ids)
+            first_ordering = {}
+        else:
+            first_ordering = _get_next_ordering(conn, main_ids)
+
+        ref_rows = []
+        #main paper id => {ordering => text}
+        unknown_text = {}
+        for main_key, parsed_refs in parsed.items():
+            main_id = ids[main_key]
+            offset = first_ordering.get(main_id, 0)
+            for ordering, (key, text) in enumerate(parsed_refs, offset):
+                if key is None:
+                    ref_paper_id = UNKNOWN_PAPER_ID
+                    if text:
+                        unknown_text.setdefault(main_id, {})[ordering] = text
+                else:
+                    ref_paper_id = ids[key]
+                ref_rows.append({'main_paper_id': main_id,
+                                 'ref_paper_id': ref_paper_id,
+                                 'ordering': ordering})
+
+        if ref_rows:
+            conn.execute(Reference.__table__.insert(), ref_rows)
+
+        if unknown_text:
+            _add_unknown_text(conn, unknown_text)
+
+        _mark_changed(conn, main_ids, mark_retrieved)
+
+    #Done after committing so lookups can't cache the old rows again
+    Paper.forget_ids(main_ids | filled_ids)
+    return [ids[main_key] for main_key in main_keys]
+
+
+def _mark_changed(conn, paper_ids, retrieved):
+    """
+    Sets Paper.updated for papers whose reference lists changed, so that
+    incremental exports (see export.py) pick up the new references, and
+    Paper.references_retrieved if 'retrieved'.
+    """
+    papers = Paper.__table__
+    now = datetime.datetime.utcnow()
+    values = {'updated': now}
+    if retrieved:
+        values['references_retrieved'] = now
+    for chunk in utils.chunks(paper_ids):
+        conn.execute(papers.update().where(papers.c.id.in_(chunk)).values(
+            **values))
+
+
+def _get_next_ordering(conn, main_paper_ids):
+    references = Reference.__table__
+    output = {}
+    for chunk in utils.chunks(main_paper_ids):
+        query = sql.select([references.c.main_paper_id,
+                            sql.func.max(references.c.ordering)]).where(
+            references.c.main_paper_id.in_(chunk)).group_by(
+            references.c.main_paper_id)
+        for main_id, max_ordering in conn.execute(query):
+            output[main_id] = max_ordering + 1
+    return output
+
+
+def _add_unknown_text(conn, unknown_text):
+    """
+    Parameters
+    ----------
+    unknown_text : dict
+        main paper id => {ordering => text}
+    """
+    #executemany doesn't give us the new reference ids so we look them up
+    references = Reference.__table__
+    rows = []
+    for chunk in utils.chunks(unknown_text):
+        query = sql.select([references.c.id,
+                            references.c.main_paper_id,
+                            references.c.ordering]).where(
+            sql.and_(references.c.main_paper_id.in_(chunk),
+                     references.c.ref_paper_id == UNKNOWN_PAPER_ID))
+        for ref_id, main_id, ordering in conn.execute(query):
+            #Orderings not in the dict are from earlier calls
+            text = unknown_text[main_id].get(ordering)
+            if text is not None:
+                rows.append({'ref_id': ref_id, 'unknown_text': text})
+
+    if rows:
+        conn.execute(UnknownReference.__table__.insert(), rows)
+
+
+def get_paper_ids(papers):
+    """
+    Returns the database ids of papers, creating any that don't exist.
+
+    Parameters
+    ----------
+    papers : iterable
+        See the module documentation for the accepted formats.
+
+    Returns
+    -------
+    list of int
+        In input order.
+    """
+    keys = []
+    metadata = {}
+    for paper in papers:
+        key, _ = _parse_paper(paper)
+        if key is None:
+            raise ValueError('Paper needs a doi, pmid or isbn: %r' % (paper,))
+        keys.append(key)
+        paper_metadata = _parse_metadata(paper)
+        if paper_metadata is not None:
+            metadata.setdefault(key, paper_metadata)
+
+    with tables.get_engine().begin() as conn:
+        ids, filled_ids = _get_or_create_paper_ids(conn, keys, metadata)
+    Paper.forget_ids(filled_ids)
+    return [ids[key] for key in keys]
+
+
+def add_references(paper, references, replace=True):
+    """
+    Adds a paper and its ordered reference list.
+
+    Parameters
+    ----------
+    paper : str, dict or object
+        The citing paper, e.g. a DOI.
+    references : list
+        The references of the paper, in order.
+    replace : bool
+        If True, any references already stored for the paper are replaced.
+
+    Returns
+    -------
+    int
+        Database id of the paper.
+
+    See Also
+    --------
+    add_references_bulk
+    """
+    return add_references_bulk([(paper, references)], replace=replace)[0]
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A work queue stored in the database, for running lookups in several
+processes (possibly on several hosts sharing the database).
+
+A job is a (kind, payload) pair, e.g. ('paper_info', citation) or
+('references', doi). Workers claim a batch of jobs, run them, and mark each
+as done (storing its result as JSON) or failed.
+
+Claiming is a single UPDATE of the oldest claimable jobs, which sets a
+random claim token, so two workers can never hold the same job. A claim is
+a lease: if a worker dies its jobs become claimable again once the lease
+expires. Workers renew their leases while they are running a batch. Failed
+jobs are retried, after an increasing delay, until they have been attempted
+max_attempts times.
+
+Job kinds
+---------
+paper_info : payload is a citation, see main.citation_to_paper_info
+doi        : payload is a citation, see citations.citation_to_doi
+references : payload is a DOI. The references are retrieved and stored,
+             see crawler.py
+
+Example
+-------
+from reference_resolver import jobs
+jobs.enqueue('paper_info', citations)
+#In each worker process
+jobs.run_worker(exit_when_empty=True)
+
+or from the command line:
+    python -m reference_resolver enqueue paper_info citations.txt
+    python -m reference_resolver worker --exit-when-empty
+
+Workers on different hosts compare lease times using their own clocks,
+which therefore need to be roughly in sync (well within lease_seconds).
+To also share Crossref rate limiting between the processes see
+ratelimit.configure(state_path=...).
+
+See Also
+--------
+tables.Job
+"""
+
+#Standard Library
+#------------------------
+import collections
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+#Third party
+#------------------------
+import sqlalchemy as sql
+
+#Local
+#------------------------
+from . import batch
+from . import tables
+from .tables import Job
+from . import utils
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATUSES = (PENDING, RUNNING, DONE, FAILED)
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 30.0
+
+_config = {'lease_seconds': DEFAULT_LEASE_SECONDS,
+           'max_attempts': DEFAULT_MAX_ATTEMPTS,
+           'retry_delay': DEFAULT_RETRY_DELAY}
+
+ClaimedJob = collections.namedtuple('ClaimedJob', ['id', 'kind', 'payload',
+                                                   'attempts'])
+
+
+def configure(**kwargs):
+    """
+    Parameters
+    ----------
+    lease_seconds : float
+        How long a claimed job is held without being renewed. Jobs of a
+        worker that died are claimable again after this.
+    max_attempts : int
+        Default number of times a job is tried before it is marked failed.
+    retry_delay : float
+        Seconds before a failed job is retried. This doubles with each
+        attempt.
+    """
+    for key in kwargs:
+        if key not in _config:
+            raise ValueError('Unrecognized job queue option: %s' % key)
+    _config.update(kwargs)
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def default_worker_id():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+#Handlers
+#-------------------------------------------------------------------------
+def _run_paper_info(citation):
+    from .main import citation_to_paper_info
+    return {'doi': citation_to_paper_info(citation).doi}
+
+
+def _run_doi(citation):
+    from .citations import citation_to_doi
+    result = citation_to_doi(citation)
+    return {'doi': result.doi, 'score': result.score}
+
+
+def _run_references(doi):
+    from . import crawler
+    from . import ingest
+    references = crawler.default_fetch(doi)
+    ingest.add_references_bulk([({'doi': doi}, references)], replace=True,
+                               mark_retrieved=True)
+    return {'n_references': len(references)}
+
+
+_handlers = {'paper_info': _run_paper_info,
+             'doi': _run_doi,
+             'references': _run_references}
+
+
+def register_handler(kind, fn):
+    """
+    Adds (or replaces) a job kind.
+
+    Parameters
+    ----------
+    kind : str
+    fn : callable
+        fn(payload) returning a JSON serializable result, raising on
+        failure. It must be registered in every worker process.
+    """
+    _handlers[kind] = fn
+
+
+def handler_kinds():
+    """
+    Returns
+    -------
+    list of str
+        The registered job kinds, sorted.
+    """
+    return sorted(_handlers)
+
+
+def _check_kind(kind):
+    if kind not in _handlers:
+        raise ValueError('Unrecognized job kind: %s' % kind)
+
+#Queue operations
+#-------------------------------------------------------------------------
+def enqueue(kind, payloads, max_attempts=None, skip_existing=True):
+    """
+    Parameters
+    ----------
+    kind : str
+        See the module documentation.
+    payloads : iterable of str
+    max_attempts : int
+        Defaults to the configured max_attempts.
+    skip_existing : bool
+        If True, payloads already queued with the same kind (in any state)
+        are not added again. Duplicates within payloads are also dropped.
+
+    Returns
+    -------
+    int
+        Number of jobs added.
+    """
+    _check_kind(kind)
+    if max_attempts is None:
+        max_attempts = _config['max_attempts']
+
+    jobs = Job.__table__
+    payloads = list(payloads)
+    if skip_existing:
+        payloads = list(collections.OrderedDict.fromkeys(payloads))
+
+    n_added = 0
+    now = _now()
+    with tables.get_engine().begin() as conn:
+        for chunk in utils.chunks(payloads):
+            if skip_existing:
+                query = sql.select([jobs.c.payload]).where(sql.and_(
+                    jobs.c.kind == kind, jobs.c.payload.in_(chunk)))
+                existing = set(row[0] for row in conn.execute(query))
+                chunk = [x for x in chunk if x not in existing]
+            if not chunk:
+                continue
+            conn.execute(jobs.insert(), [
+                {'kind': kind, 'payload': payload, 'status': PENDING,
+                 'attempts': 0, 'max_attempts': max_attempts,
+                 'available_at': now, 'created': now, 'updated': now}
+                for payload in chunk])
+            n_added += len(chunk)
+    return n_added
+
+
+def _claimable(now):
+    jobs = Job.__table__
+    return sql.and_(
+        jobs.c.attempts < jobs.c.max_attempts,
+        sql.or_(sql.and_(jobs.c.status == PENDING,
+                         jobs.c.available_at <= now),
+                sql.and_(jobs.c.status == RUNNING,
+                         jobs.c.lease_until < now)))
+
+
+def _expire(conn, now):
+    """
+    Marks jobs failed whose lease expired on their last attempt.
+    """
+    jobs = Job.__table__
+    conn.execute(jobs.update().where(sql.and_(
+        jobs.c.status == RUNNING, jobs.c.lease_until < now,
+        jobs.c.attempts >= jobs.c.max_attempts)).values(
+        status=FAILED, claim=None, error='Lease expired', updated=now))
+
+
+def claim(n=1, kinds=None, worker_id=None, lease_seconds=None):
+    """
+    Claims up to n of the oldest claimable jobs.
+
+    Parameters
+    ----------
+    n : int
+    kinds : list of str or None
+        Only claim these kinds of job. Default all.
+    worker_id : str
+        Stored with the jobs for diagnostics. Defaults to host:pid.
+    lease_seconds : float
+        Defaults to the configured lease_seconds.
+
+    Returns
+    -------
+    (claim token, list of ClaimedJob)
+        The token is needed to renew, complete or fail the jobs.
+    """
+    if worker_id is None:
+        worker_id = default_worker_id()
+    if lease_seconds is None:
+        lease_seconds = _config['lease_seconds']
+
+    jobs = Job.__table__
+    token = uuid.uuid4().hex
+    now = _now()
+
+    condition = _claimable(now)
+    if kinds is not None:
+        condition = sql.and_(condition, jobs.c.kind.in_(list(kinds)))
+    ids = sql.select([jobs.c.id]).where(condition).order_by(
+        jobs.c.id).limit(n)
+
+    with tables.get_engine().begin() as conn:
+        _expire(conn, now)
+        #The condition is repeated outside the subquery so that a database
+        #which re-evaluates it on row locks (e.g. PostgreSQL) can't hand a
+        #job to two workers
+        conn.execute(jobs.update().where(sql.and_(
+            jobs.c.id.in_(ids), condition)).values(
+            status=RUNNING, claim=token, worker=worker_id,
+            attempts=jobs.c.attempts + 1,
+            lease_until=now + datetime.timedelta(seconds=lease_seconds),
+            updated=now))
+        rows = conn.execute(sql.select([jobs.c.id, jobs.c.kind,
+                                        jobs.c.payload, jobs.c.attempts])
+                            .where(jobs.c.claim == token)
+                            .order_by(jobs.c.id)).fetchall()
+    return token, [ClaimedJob(*row) for row in rows]
+
+
+def renew(token, lease_seconds=None):
+    """
+    Extends the lease of the running jobs held with the claim token.
+
+    Returns
+    -------
+    int
+        Number of jobs still held.
+    """
+    if lease_seconds is None:
+        lease_seconds = _config['lease_seconds']
+    jobs = Job.__table__
+    now = _now()
+    with tables.get_engine().begin() as conn:
+        result = conn.execute(jobs.update().where(sql.and_(
+            jobs.c.claim == token, jobs.c.status == RUNNING)).values(
+            lease_until=now + datetime.timedelta(seconds=lease_seconds),
+            updated=now))
+        return result.rowcount
+
+
+def complete(job_id, token, result=None):
+    """
+    Marks a job done.
+
+    Returns
+    -------
+    bool
+        False if the job is no longer held with the token (its lease
+        expired and it was claimed by another worker), in which case
+        nothing is changed.
+    """
+    jobs = Job.__table__
+    with tables.get_engine().begin() as conn:
+        updated = conn.execute(jobs.update().where(sql.and_(
+            jobs.c.id == job_id, jobs.c.claim == token)).values(
+            status=DONE, claim=None, lease_until=None, error=None,
+            result=json.dumps(result), updated=_now()))
+        return updated.rowcount == 1
+
+
+def fail(job_id, token, error):
+    """
+    Records a failed attempt. The job is retried later unless it has been
+    attempted max_attempts times, in which case it is marked failed.
+
+    Returns
+    -------
+    str or None
+        The job's new status, or None if the job is no longer held with
+        the token.
+    """
+    jobs = Job.__table__
+    now = _now()
+    with tables.get_engine().begin() as conn:
+        row = conn.execute(sql.select([jobs.c.attempts, jobs.c.max_attempts])
+                           .where(sql.and_(jobs.c.id == job_id,
+                                           jobs.c.claim == token))).fetchone()
+        if row is None:
+            return None
+        attempts, max_attempts = row
+        if attempts >= max_attempts:
+            status = FAILED
+            available_at = None
+        else:
+            status = PENDING
+            delay = _config['retry_delay']*2**(attempts - 1)
+            available_at = now + datetime.timedelta(seconds=delay)
+        updated = conn.execute(jobs.update().where(sql.and_(
+            jobs.c.id == job_id, jobs.c.claim == token)).values(
+            status=status, claim=None, lease_until=None,
+            available_at=available_at, error=str(error)[:1000],
+            updated=now))
+        if updated.rowcount == 0:
+            return None
+        return status
+
+
+def counts(kind=None):
+    """
+    Returns
+    -------
+    dict
+        status => number of jobs, for all statuses.
+    """
+    jobs = Job.__table__
+    query = sql.select([jobs.c.status, sql.func.count()]).group_by(
+        jobs.c.status)
+    if kind is not None:
+        query = query.where(jobs.c.kind == kind)
+    output = dict((status, 0) for status in STATUSES)
+    with tables.get_engine().connect() as conn:
+        output.update(conn.execute(query).fetchall())
+    return output
+
+
+def retry_failed(kind=None):
+    """
+    Makes failed jobs pending again, with their attempts reset.
+
+    Returns
+    -------
+    int
+        Number of jobs reset.
+    """
+    jobs = Job.__table__
+    condition = jobs.c.status == FAILED
+    if kind is not None:
+        condition = sql.and_(condition, jobs.c.kind == kind)
+    now = _now()
+    with tables.get_engine().begin() as conn:
+        return conn.execute(jobs.update().where(condition).values(
+            status=PENDING, attempts=0, available_at=now,
+            updated=now)).rowcount
+
+#Worker
+#-------------------------------------------------------------------------
+class _LeaseRenewer(object):
+
+    """
+    Renews the leases of a claim from a background thread while a batch
+    is running.
+    """
+
+    def __init__(self, token, lease_seconds):
+        self.token = token
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds/3.0):
+            try:
+                renew(self.token, self.lease_seconds)
+            except sql.exc.OperationalError:
+                #e.g. database locked, try again next time
+                pass
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+
+def _run_job(job):
+    return _handlers[job.kind](job.payload)
+
+
+def run_worker(kinds=None, worker_id=None, batch_size=DEFAULT_BATCH_SIZE,
+               max_workers=batch.DEFAULT_MAX_WORKERS, lease_seconds=None,
+               poll_interval=DEFAULT_POLL_INTERVAL, max_jobs=None,
+               exit_when_empty=False, progress=None):
+    """
+    Claims and runs jobs until there are none left (if exit_when_empty) or
+    max_jobs have been run. Otherwise runs until interrupted.
+
+    Parameters
+    ----------
+    kinds : list of str or None
+        Only run these kinds of job. Default all.
+    worker_id : str
+        Defaults to host:pid.
+    batch_size : int
+        Jobs claimed at a time.
+    max_workers : int
+        Jobs of a batch run concurrently, in threads.
+    lease_seconds : float
+        Defaults to the configured lease_seconds.
+    poll_interval : float
+        Seconds to wait before claiming again when no job was claimable.
+    max_jobs : int or None
+    exit_when_empty : bool
+        Return when no job is claimable. Note that jobs waiting to be
+        retried are not claimable until their retry delay has passed.
+    progress : callable
+        Called as progress(stats) after each batch.
+
+    Returns
+    -------
+    dict
+        'done' : jobs completed
+        'retried' : failed attempts that will be retried
+        'failed' : jobs that failed their last attempt
+        'lost' : jobs whose lease expired before they finished
+    """
+    if worker_id is None:
+        worker_id = default_worker_id()
+    if lease_seconds is None:
+        lease_seconds = _config['lease_seconds']
+
+    stats = {'done': 0, 'retried': 0, 'failed': 0, 'lost': 0}
+    n_run = 0
+    while max_jobs is None or n_run < max_jobs:
+        n = batch_size
+        if max_jobs is not None:
+            n = min(n, max_jobs - n_run)
+        token, claimed = claim(n, kinds=kinds, worker_id=worker_id,
+                               lease_seconds=lease_seconds)
+        if not claimed:
+            if exit_when_empty:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        with _LeaseRenewer(token, lease_seconds):
+            for result in batch.iter_batch(_run_job, claimed,
+                                           max_workers=max_workers):
+                job = result.input
+                if result.ok:
+                    if complete(job.id, token, result.result):
+                        stats['done'] += 1
+                    else:
+                        stats['lost'] += 1
+                else:
+                    status = fail(job.id, token, result.error)
+                    if status is None:
+                        stats['lost'] += 1
+                    elif status == FAILED:
+                        stats['failed'] += 1
+                    else:
+                        stats['retried'] += 1
+
+        n_run += len(claimed)
+        if progress is not None:
+            progress(stats)
+
+    return stats
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Matches citations against papers already in the local database.
+
+Candidates are found with the SQLite FTS5 index over the title, authors,
+year and container (journal) of papers (tables.papers_fts). Each candidate
+is then given a confidence between 0 and 1 based on how much of its title,
+author names and year appear in the citation. Only papers with a DOI and a
+title can be matched.
+
+main.citation_to_paper_info tries this before querying Crossref.
+
+Example
+-------
+from reference_resolver import local_match
+local_match.configure(min_confidence=0.9)
+match = local_match.find_paper(citation)
+
+See Also
+--------
+tables.Paper
+ingest.add_references_bulk
+"""
+
+#Standard Library
+#------------------------
+import collections
+import re
+
+#Local
+#------------------------
+from .utils import normalize_citation
+
+DEFAULT_MIN_CONFIDENCE = 0.85
+#Number of full text search hits to score
+DEFAULT_N_CANDIDATES = 10
+#Long citations are truncated to this many search terms
+_MAX_QUERY_TOKENS = 40
+
+#Relative weight of the match components. Components which a paper has no
+#data for are left out.
+_TITLE_WEIGHT = 0.7
+_AUTHOR_WEIGHT = 0.15
+_YEAR_WEIGHT = 0.15
+#Titles shorter than this are penalized since they match too easily
+_MIN_TITLE_TOKENS = 4
+
+_YEAR = re.compile(r'\b(1[5-9]\d\d|20\d\d)\b')
+
+LocalMatch = collections.namedtuple('LocalMatch',
+                                    ['paper_id', 'doi', 'confidence'])
+
+_config = {'enabled': True,
+           'min_confidence': DEFAULT_MIN_CONFIDENCE,
+           'n_candidates': DEFAULT_N_CANDIDATES}
+
+_SEARCH_SQL = """
+SELECT papers.id, papers.doi, papers.title, papers.authors, papers.year
+FROM papers_fts JOIN papers ON papers.id = papers_fts.rowid
+WHERE papers_fts MATCH :query AND papers.doi IS NOT NULL
+ORDER BY bm25(papers_fts) LIMIT :n"""
+
+def configure(**kwargs):
+    """
+    Parameters
+    ----------
+    enabled : bool
+    min_confidence : float
+        0 to 1. Matches below this are rejected.
+    n_candidates : int
+        Number of search hits to consider.
+    """
+    for key in kwargs:
+        if key not in _config:
+            raise ValueError('Unrecognized local match option: %s' % key)
+    _config.update(kwargs)
+
+def _confidence(citation_tokens, citation_years, title, authors, year):
+    title_tokens = normalize_citation(title).split()
+    if not title_tokens:
+        return 0.0
+
+    n_found = sum(1 for x in title_tokens if x in citation_tokens)
+    title_score = float(n_found)/len(title_tokens)
+    if len(title_tokens) < _MIN_TITLE_TOKENS:
+        title_score *= float(len(title_tokens))/_MIN_TITLE_TOKENS
+
+    scores = [(title_score, _TITLE_WEIGHT)]
+
+    if authors:
+        #Initials are ignored
+        names = [x for x in normalize_citation(authors).split() if len(x) > 2]
+        if names:
+            n_found = sum(1 for x in names if x in citation_tokens)
+            scores.append((float(n_found)/len(names), _AUTHOR_WEIGHT))
+
+    if year:
+        scores.append((1.0 if year in citation_years else 0.0, _YEAR_WEIGHT))
+
+    total_weight = sum(weight for score, weight in scores)
+    return sum(score*weight for score, weight in scores)/total_weight
+
+def find_paper(citation, min_confidence=None):
+    """
+    Parameters
+    ----------
+    citation : str
+    min_confidence : float
+        Defaults to the configured value.
+
+    Returns
+    -------
+    LocalMatch or None
+        The best match if its confidence is at least min_confidence.
+    """
+    if not _config['enabled']:
+        return None
+
+    from . import tables
+
+    engine = tables.get_engine()
+    if not tables.fts_available:
+        return None
+
+    if min_confidence is None:
+        min_confidence = _config['min_confidence']
+
+    tokens = normalize_citation(citation).split()
+    citation_tokens = set(tokens)
+    citation_years = set(int(x) for x in _YEAR.findall(citation))
+
+    #Unique terms in order, skipping numbers and very short words
+    terms = []
+    for token in tokens:
+        if len(token) > 2 and not token.isdigit() and token not in terms:
+            terms.append(token)
+    if not terms:
+        return None
+
+    #Tokens only contain word characters, so quoting them is sufficient
+    query = ' OR '.join('"%s"' % x for x in terms[:_MAX_QUERY_TOKENS])
+
+    import sqlalchemy as sql
+    with engine.connect() as conn:
+        rows = conn.execute(sql.text(_SEARCH_SQL), query=query,
+                            n=_config['n_candidates']).fetchall()
+
+    best = None
+    for paper_id, doi, title, authors, year in rows:
+        confidence = _confidence(citation_tokens, citation_years, title,
+                                 authors, year)
+        if best is None or confidence > best.confidence:
+            best = LocalMatch(paper_id, doi, confidence)
+
+    if best is not None and best.confidence >= min_confidence:
+        return best
+    return None
@@ -56,11 +56,21 @@ if sys.version_info.major == 2:
 else:
     from urllib.parse import quote as urllib_quote
 
-# Third party imports
-#---------------------------------
-import requests
-#https://github.com/ScholarTools/crossrefapi
-from crossref.restful import Works
+# Local imports
+#--------------------------------------------
+from . import batch
+from . import cache
+from . import doi_extract
+from . import local_match
+from . import metrics
+from . import raw_store
+from . import utils
+from .errors import CitationNotFoundError
+from .records import PaperRecord, Record, to_plain
+from .singleflight import SingleFlight
+from .utils import normalize_citation
+#Works from https://github.com/ScholarTools/crossrefapi, using our session
+from .crossref import Works
 
 # Other Scholar Tools Imports
 #--------------------------------------------
@@ -101,16 +111,36 @@ Scopus = []
 
 # -----------------------------------------------------
 
-class PaperInfo():
+class PaperInfo(Record):
     
     """
     doi
     url
     pdf_link
-    references
+    entry : dict
+    references : list
+        e.g. of records.ReferenceRecord
+    source : str
+        How the paper was found: 'embedded' (a DOI in the citation), 'cache',
+        'local' (see local_match.py) or 'crossref'
+        
+    Other keyword arguments and attributes are kept in the instance
+    __dict__, as before PaperInfo was a record, and are included in
+    to_dict().
+        
+    Use to_dict() for a JSON serializable version, see records.py
     """
+    
+    _fields = ('doi', 'url', 'pdf_link', 'entry', 'references', 'source')
+    #The __dict__ is only created when other attributes are set
+    __slots__ = _fields + ('__dict__',)
+    
     def __init__(self, **kwargs):
-        self.doi = kwargs.get('doi')
+        extra = dict((name, kwargs.pop(name)) for name in list(kwargs)
+                     if name not in self._fields)
+        super(PaperInfo, self).__init__(**kwargs)
+        if extra:
+            self.__dict__.update(extra)
         
         """
         self.entry = kwargs.get('entry_dict')
@@ -124,15 +154,47 @@ class PaperInfo():
         self.scraper_obj = kwargs.get('scraper_obj')
         self.publisher_interface = kwargs.get('publisher_interface')
         """
+    
+    def to_dict(self):
+        output = super(PaperInfo, self).to_dict()
+        output.update((name, to_plain(value))
+                      for name, value in self.__dict__.items())
+        return output
+    
+    def __eq__(self, other):
+        result = super(PaperInfo, self).__eq__(other)
+        if result is True:
+            return self.__dict__ == other.__dict__
+        return result
+    
+    def __getstate__(self):
+        state = super(PaperInfo, self).__getstate__()
+        return state + (self.__dict__,)
+    
+    def __setstate__(self, state):
+        super(PaperInfo, self).__setstate__(state[:-1])
+        self.__dict__.update(state[-1])
+
+#Query settings for the citation lookup. These are shared with the asyncio
+#version which builds the /works request itself.
+WORKS_SELECT = 'DOI,score,title'
+WORKS_ROWS = 5
+
+#Concurrent lookups of the same (normalized) citation share one request
+_flights = SingleFlight()
 
-def citation_to_paper_info(citation):
+def citation_to_paper_info(citation, use_cache=True, use_local=True,
+                           retry_misses=False):
     """
     Gets the paper and references information from
     a plaintext citation.
     
     Strategies
     ----------
-    1) 
+    1) A DOI in the citation itself (see doi_extract.py)
+    2) Local citation cache
+    3) Full text match against papers in the local database
+    4) Crossref bibliographic query
 
     Uses a search to CrossRef.org to retrive paper DOI.
 
@@ -143,17 +205,36 @@ def citation_to_paper_info(citation):
         Example: Senís, Elena, et al. "CRISPR/Cas9‐mediated genome
                 engineering: An adeno‐associated viral (AAV) vector
                 toolbox. Biotechnology journal 9.11 (2014): 1402-1412.
+    use_cache : bool
+        If True the local citation cache (see cache.py) is checked before
+        querying Crossref and lookups, including failed ones, are added to
+        it. Citations cached as not found are still matched locally.
+    use_local : bool
+        If True the citation is matched against papers in the local database
+        (see local_match.py) before querying Crossref.
+    retry_misses : bool
+        If True, citations cached as not found are queried again.
+        
+    If the same citation (after normalization) is already being queried by
+    another thread, that query's result is shared rather than repeated.
 
     Returns
     -------
     paper_info : PaperInfo
         Class containing relevant paper meta-information and
-        references list.
+        references list. For a DOI in the citation itself no request is
+        made, so 'entry' only holds the title, authors, year etc. of the
+        paper in the local database, or is None if it isn't there.
         Information about the paper itself is in 'entry' value, and is a dict
         (with str and dict values). References list is in 'references'
         value and is a list of dicts (each with str and dict values).
-        Must call .__dict__ to be JSON-serializable
+        Must call .to_dict() to be JSON-serializable
         
+    Raises
+    ------
+    errors.CitationNotFoundError
+        If Crossref had no match, the best match scored below the cache's
+        min_score, or this was cached from an earlier query.
         
     Example
     --------
@@ -168,6 +249,35 @@ def citation_to_paper_info(citation):
     1. Can we use CSL to generate the citation based on the journal style
 
     """
+    with metrics.timer('citation_to_paper_info'):
+        return _citation_to_paper_info(citation, use_cache, use_local,
+                                       retry_misses)
+
+def _citation_to_paper_info(citation, use_cache, use_local, retry_misses):
+    
+    paper_info = _resolve_without_query(citation, use_cache, use_local,
+                                        retry_misses)
+    if paper_info is not None:
+        return paper_info
+
+    return _flights.do(normalize_citation(citation), _query_works, 
+                       citation, use_cache)
+
+def _resolve_without_query(citation, use_cache, use_local, retry_misses):
+    """
+    Strategies 1 to 3 of citation_to_paper_info, shared with the asyncio
+    version (see aio.py).
+    
+    Returns
+    -------
+    PaperInfo or None
+        None if Crossref needs to be queried.
+    """
+    doi = doi_extract.find_doi(citation)
+    metrics.hit('embedded_doi', doi is not None)
+    if doi is not None:
+        return _embedded_paper_info(doi)
+    
     # Encode raw citation
     escaped_quotation = urllib_quote(citation)
     
@@ -176,25 +286,110 @@ def citation_to_paper_info(citation):
     #For right now we only have crossref.
     #
     #There are numerous other strategies out there ... (NYI)
+    
+    cached_miss = None
+    if use_cache:
+        cached = cache.get(citation, include_misses=not retry_misses)
+        if cached is not None:
+            if cached.doi is not None:
+                return PaperInfo(doi=cached.doi, source='cache')
+            cached_miss = cached
+            
+    if use_local:
+        with metrics.timer('local_match'):
+            match = local_match.find_paper(citation)
+        metrics.hit('local_match', match is not None)
+        if match is not None:
+            return PaperInfo(doi=match.doi, source='local')
+    
+    if cached_miss is not None:
+        raise CitationNotFoundError('queried citation not found (cached %s)'
+                                    % cached_miss.reason)
+    return None
 
+def _embedded_paper_info(doi):
+    """
+    Returns the PaperInfo for a DOI found in the citation itself. No request
+    is made, so 'entry' only holds what the local database has on the paper,
+    if anything (see _ENTRY_FIELDS).
+    """
+    #Imported here so importing the package doesn't load the database layer
+    from .tables import Paper
+    paper = Paper.get_from_doi(doi)
+    if paper is None:
+        return PaperInfo(doi=doi, source='embedded')
+    entry = {}
+    for name in _ENTRY_FIELDS:
+        value = getattr(paper, name)
+        if value is not None:
+            entry[name] = value
+    return PaperInfo(doi=doi, entry=entry, source='embedded')
+
+#Paper columns copied to PaperInfo.entry for embedded DOIs
+_ENTRY_FIELDS = PaperRecord._fields
+
+def _query_works(citation, use_cache):
+    
     #TODO: Support etiquette
-    w1 = Works().query(bibliographic=citation).select('DOI,score,title').rows(5)
-    result = w1.get()
+    w1 = Works().query(bibliographic=citation).select(WORKS_SELECT).rows(WORKS_ROWS)
+    with metrics.timer('crossref_works'):
+        result = w1.get()
+    
+    with metrics.timer('raw_store_put'):
+        raw_store.put('crossref_works', citation, result)
+    
+    #TODO: Check out these as well:
+    #from https://github.com/CrossRef/rest-api-doc/issues/456
+    #http://search.crossref.org/references
+    #https://doi.crossref.org/simpleTextQuery
+
+    return _handle_works_response(citation, result, use_cache)
+
+def _handle_works_response(citation, result, use_cache):
+    """
+    The steps of citation_to_paper_info after the Crossref query, shared
+    with the asyncio version: parsing, the min_score check and caching.
+    """
+    try:
+        paper_info = _parse_works_response(result)
+    except CitationNotFoundError:
+        if use_cache:
+            cache.put_miss(citation, cache.NOT_FOUND)
+        raise
+    
+    score = result['message']['items'][0].get('score')
+    if cache.is_low_score(score):
+        if use_cache:
+            cache.put_miss(citation, cache.LOW_SCORE, score)
+        raise CitationNotFoundError('The best match scored %s, below '
+                                    'min_score' % score)
     
+    if use_cache:
+        cache.put(citation, paper_info.doi, score)
+
+    return paper_info
+
+def _parse_works_response(result):
+    """
+    Parameters
+    ----------
+    result : dict
+        Decoded JSON from a Crossref /works query.
+        
+    Returns
+    -------
+    PaperInfo
+    """
     n_values = result['message']['total-results']
     if n_values == 0:
-        raise Exception('queried citation not found')
+        raise CitationNotFoundError('queried citation not found')
         
     entries = result['message']['items']
     
     #TODO: Support scoring support
     doi = entries[0]['DOI']
     
-    #TODO: Check out these as well:
-    #from https://github.com/CrossRef/rest-api-doc/issues/456
-    #http://search.crossref.org/references
-    #https://doi.crossref.org/simpleTextQuery
-
+    return PaperInfo(doi=doi, source='crossref')
     
     """
     # Check if this DOI has been searched and saved before.
@@ -210,6 +405,164 @@ def citation_to_paper_info(citation):
     return paper_info
     """
 
+def citations_to_paper_info(citations, max_workers=batch.DEFAULT_MAX_WORKERS):
+    """
+    Resolves many citations concurrently using citation_to_paper_info.
+
+    Parameters
+    ----------
+    citations : iterable of str
+    max_workers : int
+        Maximum number of requests to have in flight at once.
+        
+    Returns
+    -------
+    list of batch.BatchResult
+        In the same order as the input. The 'result' attribute holds the
+        PaperInfo. Failed lookups have their exception in 'error' rather
+        than aborting the batch. Citations containing a DOI are found in
+        a single pass before any lookups are made.
+    """
+    citations = list(citations)
+    known = []
+    for doi in doi_extract.extract_dois(citations):
+        if doi is None:
+            #Counted as a miss by citation_to_paper_info
+            known.append(None)
+        else:
+            metrics.hit('embedded_doi', True)
+            known.append(_embedded_paper_info(doi))
+    return batch.run_batch(citation_to_paper_info, citations,
+                           max_workers=max_workers, known=known)
+
+def iter_citations_to_paper_info(citations, 
+                                 max_workers=batch.DEFAULT_MAX_WORKERS,
+                                 ordered=False):
+    """
+    Streaming version of citations_to_paper_info.
+    
+    Yields
+    ------
+    batch.BatchResult
+        As they complete unless ordered is True.
+    """
+    return batch.iter_batch(citation_to_paper_info, citations,
+                            max_workers=max_workers, ordered=ordered)
+
+#DOIs per /works?filter=doi:...,doi:... request. Longer lists risk
+#exceeding url length limits.
+DOI_CHUNK_SIZE = 50
+#Crossref returns at most 1000 rows per request and each chunk asks for
+#twice as many rows as DOIs (see _fetch_doi_chunk). Larger chunks would be
+#truncated, reporting DOIs that exist as not found.
+MAX_DOI_CHUNK_SIZE = 500
+
+def _fetch_doi_chunk(chunk, select):
+    """
+    Parameters
+    ----------
+    chunk : list of str
+        Normalized DOIs
+        
+    Returns
+    -------
+    dict
+        doi => metadata dict, for the DOIs that were found
+    """
+    if len(chunk) == 1 and ',' in chunk[0]:
+        #A comma would split the filter value, so the single work route
+        #is used instead
+        item = Works().doi(chunk[0])
+        return {chunk[0]: item} if item else {}
+    
+    w = Works()
+    if select is not None:
+        w = w.select(select)
+    #A DOI can occasionally match more than one record
+    w = w.rows(2*len(chunk))
+    w.request_params['filter'] = ','.join('doi:' + x for x in chunk)
+    result = w.get()
+    
+    output = {}
+    for item in result['message']['items']:
+        doi = utils.normalize_doi(item['DOI'])
+        output.setdefault(doi, item)
+    return output
+
+def dois_to_metadata(dois, chunk_size=DOI_CHUNK_SIZE, select=None,
+                     max_workers=batch.DEFAULT_MAX_WORKERS):
+    """
+    Retrieves Crossref metadata for many DOIs, chunk_size DOIs per request.
+    
+    Parameters
+    ----------
+    dois : iterable of str
+    chunk_size : int
+        Number of DOIs per request, at most MAX_DOI_CHUNK_SIZE.
+    select : str
+        Comma separated fields to return, e.g. 'DOI,title,author'. By 
+        default all fields are returned. 'DOI' is always added.
+    max_workers : int
+        Maximum number of requests to have in flight at once.
+        
+    Returns
+    -------
+    list of batch.BatchResult
+        One per input DOI, in input order. The 'result' attribute holds
+        the Crossref metadata (dict). DOIs Crossref doesn't know about have
+        a LookupError as their 'error'. If a request fails, all DOIs of its
+        chunk have that exception as their 'error'.
+        
+    Example
+    -------
+    results = dois_to_metadata(['10.1002/biot.201400046', '10.1038/nrg3686'])
+    titles = [x.result['title'] for x in results if x.ok]
+    """
+    if not 1 <= chunk_size <= MAX_DOI_CHUNK_SIZE:
+        raise ValueError('chunk_size must be between 1 and %d'
+                         % MAX_DOI_CHUNK_SIZE)
+    if select is not None:
+        fields = [x.strip() for x in select.split(',')]
+        if 'DOI' not in fields:
+            select = ','.join(['DOI'] + fields)
+    
+    dois = list(dois)
+    normalized = [utils.normalize_doi(x) for x in dois]
+    
+    unique = []
+    seen = set()
+    for doi in normalized:
+        if doi not in seen:
+            seen.add(doi)
+            if ',' in doi:
+                #Fetched on its own, see _fetch_doi_chunk
+                continue
+            unique.append(doi)
+    chunks = [unique[i:i + chunk_size] 
+              for i in range(0, len(unique), chunk_size)]
+    chunks.extend([x] for x in seen if ',' in x)
+    
+    found = {}
+    errors = {}
+    for result in batch.iter_batch(lambda x: _fetch_doi_chunk(x, select), 
+                                   chunks, max_workers=max_workers):
+        if result.ok:
+            found.update(result.result)
+        else:
+            for doi in result.input:
+                errors[doi] = result.error
+    
+    output = []
+    for index, (doi, key) in enumerate(zip(dois, normalized)):
+        if key in found:
+            output.append(batch.BatchResult(index, doi, result=found[key]))
+        else:
+            error = errors.get(key)
+            if error is None:
+                error = LookupError('DOI not found: %s' % doi)
+            output.append(batch.BatchResult(index, doi, error=error))
+    return output
+
 # This is commented out because retrieve_all_info subsumes it.
 '''
 def paper_info_from_doi(doi, skip_saved=False):
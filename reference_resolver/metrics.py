@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing and counting of the stages of a lookup.
+
+The lookup functions time their stages (cache lookups, url encoding, the
+HTTP round trip, JSON decoding, database queries, ...) and count events
+such as cache hits and errors. This is off by default, in which case each
+instrumented stage costs one dictionary lookup.
+
+Timings are kept as histograms (see BUCKETS). A stage that raises also
+increments the counter '<stage>_errors'.
+
+Example
+-------
+from reference_resolver import metrics
+metrics.configure(enabled=True)
+...
+metrics.stats()['timings']['crossref_search']
+=> {'count': 120, 'sum': 31.2, 'mean': 0.26, 'p50': 0.25, ...}
+print(metrics.to_prometheus())
+
+Events can also be forwarded elsewhere (e.g. to statsd):
+
+    def forward(kind, name, value):
+        #kind is 'count' or 'time' (value in seconds)
+        ...
+    metrics.add_callback(forward)
+
+Stages
+------
+citation_to_doi, citation_to_paper_info : whole lookups
+citation_cache_get, citation_cache_put : cache.py
+local_match : full text search of the local database
+encode_url : quoting of the citation
+crossref_search, crossref_works : Crossref round trips (the latter
+    includes JSON decoding)
+json_decode : decoding of the search.crossref.org response
+http_request : every request made through sessions.py
+rate_limit_wait : time spent waiting for the rate limiter
+retrieve_references, scopus_references, scrape_references
+db_paper_lookup : tables.Paper.get_from_doi / get_from_pmid queries
+
+Counters
+--------
+citation_cache_hits, citation_cache_misses, paper_cache_hits,
+paper_cache_misses, local_match_hits, local_match_misses, <stage>_errors
+
+See Also
+--------
+cache.stats
+ratelimit.stats
+"""
+
+#Standard Library
+#------------------------
+import bisect
+import re
+import threading
+import time
+
+#Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_config = {'enabled': False}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_callbacks = []
+
+
+def configure(**kwargs):
+    """
+    Parameters
+    ----------
+    enabled : bool
+        Default False.
+    """
+    for key in kwargs:
+        if key not in _config:
+            raise ValueError('Unrecognized metrics option: %s' % key)
+    _config.update(kwargs)
+
+
+def enabled():
+    return _config['enabled']
+
+
+def add_callback(fn):
+    """
+    Calls fn(kind, name, value) on each event while enabled. kind is
+    'count' or 'time'. Callbacks are called in the thread recording the
+    event so should be quick.
+    """
+    with _lock:
+        _callbacks.append(fn)
+
+
+def remove_callback(fn):
+    with _lock:
+        _callbacks.remove(fn)
+
+
+class _Histogram(object):
+
+    def __init__(self):
+        #The last count is for values above the last bucket
+        self.counts = [0]*(len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q quantile.
+        """
+        if not self.count:
+            return 0.0
+        target = q*self.count
+        total = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            if total >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'sum': self.sum,
+                'mean': self.sum/self.count if self.count else 0.0,
+                'p50': self.quantile(0.5),
+                'p90': self.quantile(0.9),
+                'p99': self.quantile(0.99),
+                'max': self.max}
+
+#Recording
+#-------------------------------------------------------------------------
+def _notify(kind, name, value):
+    for fn in list(_callbacks):
+        fn(kind, name, value)
+
+
+def incr(name, value=1):
+    if not _config['enabled']:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    if _callbacks:
+        _notify('count', name, value)
+
+
+def observe(name, seconds):
+    """
+    Records a duration, in seconds.
+    """
+    if not _config['enabled']:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram()
+        histogram.observe(seconds)
+    if _callbacks:
+        _notify('time', name, seconds)
+
+
+class _Timer(object):
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            incr(self.name + '_errors')
+        return False
+
+
+class _NullTimer(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """
+    Context manager timing its block as the stage 'name'.
+
+    Example
+    -------
+    with metrics.timer('crossref_search'):
+        response = sessions.get(url)
+    """
+    if not _config['enabled']:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def hit(name, is_hit):
+    """
+    Counts a hit or miss, as '<name>_hits' or '<name>_misses'.
+    """
+    if not _config['enabled']:
+        return
+    incr(name + ('_hits' if is_hit else '_misses'))
+
+#Export
+#-------------------------------------------------------------------------
+def stats():
+    """
+    Returns
+    -------
+    dict
+        'counters' : name => count
+        'timings' : name => dict of count, sum, mean, p50, p90, p99 and
+            max (seconds). Quantiles are bucket upper bounds.
+        'hit_rates' : name => hits/(hits + misses), for each pair of
+            '<name>_hits' and '<name>_misses' counters
+    """
+    with _lock:
+        counters = dict(_counters)
+        timings = dict((name, x.summary()) for name, x in _histograms.items())
+
+    hit_rates = {}
+    for name in counters:
+        if name.endswith('_hits'):
+            prefix = name[:-len('_hits')]
+            hits = counters[name]
+            total = hits + counters.get(prefix + '_misses', 0)
+            hit_rates[prefix] = hits/total if total else 0.0
+        elif name.endswith('_misses'):
+            prefix = name[:-len('_misses')]
+            hit_rates.setdefault(prefix, 0.0)
+
+    return {'counters': counters, 'timings': timings, 'hit_rates': hit_rates}
+
+
+_INVALID_NAME_CHARACTERS = re.compile(r'[^a-zA-Z0-9_]')
+
+def _metric_name(prefix, name):
+    return _INVALID_NAME_CHARACTERS.sub('_', prefix + '_' + name)
+
+
+def to_prometheus(prefix='reference_resolver'):
+    """
+    Returns the metrics in the Prometheus text exposition format. Counters
+    are named <prefix>_<name>_total and timings <prefix>_<name>_seconds.
+    """
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((name, list(x.counts), x.count, x.sum)
+                            for name, x in _histograms.items())
+
+    lines = []
+    for name, value in counters:
+        metric = _metric_name(prefix, name) + '_total'
+        lines.append('# TYPE %s counter' % metric)
+        lines.append('%s %s' % (metric, value))
+
+    for name, counts, count, total in histograms:
+        metric = _metric_name(prefix, name) + '_seconds'
+        lines.append('# TYPE %s histogram' % metric)
+        cumulative = 0
+        for bound, n in zip(BUCKETS, counts):
+            cumulative += n
+            lines.append('%s_bucket{le="%g"} %d' % (metric, bound, cumulative))
+        lines.append('%s_bucket{le="+Inf"} %d' % (metric, count))
+        lines.append('%s_sum %r' % (metric, total))
+        lines.append('%s_count %d' % (metric, count))
+
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -32,3 +32,11 @@ except ImportError:
     # TODO: Provide link to repo
     # Eventually pip the repo and specify pip is possible
 
+
+
+aiohttp_available = True
+try:
+    import aiohttp
+except ImportError:
+    aiohttp_available = False
+    aiohttp = MissingModule('The async functions require the "aiohttp" library')
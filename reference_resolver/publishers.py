@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DOI prefix => publisher lookup.
+
+The publisher metadata in reference_metadata/ is spread across three files:
+    doi_prefix_dict.txt - JSON, prefix => [name] or [name, base url]
+    references_prefix_table.csv - Crossref members with reference linking
+    full_prefix_table.csv - all Crossref members
+
+These are merged (in that order of priority) into a single sorted,
+tab-separated index file, doi_prefix_index.tsv, by build_index(). Only that
+file is read at runtime, and only on the first lookup.
+
+To rebuild the index after changing the source files:
+    python -m reference_resolver.publishers
+
+Example
+-------
+from reference_resolver import publishers
+publishers.publisher_from_doi('10.1002/biot.201400046')
+=> Publisher(prefix='10.1002', name='Wiley Blackwell (John Wiley & Sons)',
+             url='http://onlinelibrary.wiley.com', reference_links=True)
+"""
+
+#Standard Library
+#------------------------
+import bisect
+import collections
+import csv
+import io
+import json
+import os
+import re
+import threading
+
+package_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+metadata_path = os.path.join(package_path, 'reference_metadata')
+
+INDEX_PATH = os.path.join(metadata_path, 'doi_prefix_index.tsv')
+
+Publisher = collections.namedtuple('Publisher',
+                                   ['prefix', 'name', 'url', 'reference_links'])
+
+_VALID_PREFIX = re.compile(r'10\.\d+(\.\d+)*$')
+
+_lock = threading.Lock()
+#Sorted list of prefixes and the corresponding Publisher entries
+_prefixes = None
+_entries = None
+
+
+def _load():
+    global _prefixes, _entries
+    with _lock:
+        if _prefixes is not None:
+            return
+        prefixes = []
+        entries = []
+        with io.open(INDEX_PATH, 'r', encoding='utf-8') as f:
+            for line in f:
+                prefix, name, url, reference_links = line.rstrip('\n').split('\t')
+                prefixes.append(prefix)
+                entries.append(Publisher(prefix, name, url or None,
+                                         reference_links == '1'))
+        _entries = entries
+        _prefixes = prefixes
+
+
+def _find(prefix):
+    #Binary search of the sorted prefix list
+    i = bisect.bisect_left(_prefixes, prefix)
+    if i != len(_prefixes) and _prefixes[i] == prefix:
+        return _entries[i]
+    return None
+
+
+def get_doi_prefix(doi):
+    """
+    Returns the prefix (e.g. '10.1002') of a DOI (e.g. '10.1002/biot.1').
+    """
+    return doi.split('/', 1)[0].strip()
+
+
+def publisher_from_doi(doi):
+    """
+    Parameters
+    ----------
+    doi : str
+        A DOI or a bare DOI prefix.
+
+    Returns
+    -------
+    Publisher or None
+        Uses the longest matching prefix, so a subdivided registrant code
+        such as 10.1000.10 falls back to 10.1000 if it isn't listed itself.
+    """
+    if _prefixes is None:
+        _load()
+
+    prefix = get_doi_prefix(doi)
+    while True:
+        entry = _find(prefix)
+        if entry is not None:
+            return entry
+        i = prefix.rfind('.')
+        #Don't go shorter than 10.xxxx
+        if i <= 2:
+            return None
+        prefix = prefix[:i]
+
+
+def is_known_prefix(prefix):
+    """
+    Returns whether a DOI prefix (or a DOI) is in the publisher index.
+    """
+    return publisher_from_doi(prefix) is not None
+
+
+#Building the index
+#------------------------------------------------------------------------
+def _read_prefix_csv(file_name):
+    with io.open(os.path.join(metadata_path, file_name), 'r',
+                 encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield (row['Prefix'].strip(), row['Name'].strip(),
+                   row['Reference Links Live'].strip() == 'Yes')
+
+
+def build_index(output_path=INDEX_PATH):
+    """
+    Merges the source files in reference_metadata/ into the index file.
+
+    Returns
+    -------
+    n_prefixes : int
+    """
+    #prefix => [name, url, reference_links]
+    merged = {}
+
+    with io.open(os.path.join(metadata_path, 'doi_prefix_dict.txt'), 'r',
+                 encoding='utf-8') as f:
+        prefix_dict = json.load(f)
+
+    for prefix, values in prefix_dict.items():
+        url = values[1] if len(values) > 1 else ''
+        merged[prefix] = [values[0], url, False]
+
+    for file_name in ('references_prefix_table.csv', 'full_prefix_table.csv'):
+        for prefix, name, reference_links in _read_prefix_csv(file_name):
+            #Some rows are malformed, e.g. 'none'
+            if not _VALID_PREFIX.match(prefix):
+                continue
+            if prefix in merged:
+                merged[prefix][2] = merged[prefix][2] or reference_links
+            else:
+                merged[prefix] = [name, '', reference_links]
+
+    with io.open(output_path, 'w', encoding='utf-8', newline='\n') as f:
+        #Sorted as strings to match bisect in _find()
+        for prefix in sorted(merged):
+            name, url, reference_links = merged[prefix]
+            name = ' '.join(name.split())
+            f.write(u'%s\t%s\t%s\t%d\n' % (prefix, name, url,
+                                           reference_links))
+
+    return len(merged)
+
+
+if __name__ == '__main__':
+    n_prefixes = build_index()
+    print('Wrote %d prefixes to %s' % (n_prefixes, INDEX_PATH))
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pacing of outbound requests, per host.
+
+Each host gets a token bucket. A request takes a token, and if none is
+available waits until one will be. The rate starts at DEFAULT_RATE and is
+updated from the X-Rate-Limit-Limit and X-Rate-Limit-Interval headers that
+Crossref sends with each response. A 429 or 503 response blocks the host for
+an exponentially increasing time (or the Retry-After time if that is longer)
+and the request is retried. A successful response resets the backoff.
+
+By default the buckets are held in memory and shared by all threads of the
+process. To share them between processes (e.g. several workers resolving
+one corpus) set a state file, which is a small SQLite database:
+
+    ratelimit.configure(state_path='/tmp/crossref_rate.db')
+
+All requests made through sessions.request and aio.AsyncClient pass
+through this module.
+
+See Also
+--------
+sessions.request
+aio.AsyncClient.get_json
+"""
+
+#Standard Library
+#------------------------
+import collections
+import re
+import threading
+import time
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+#Requests per second before a host has told us its limit
+DEFAULT_RATE = 50.0
+#Seconds worth of requests that can be made in a burst
+DEFAULT_BURST = 1.0
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_MAX_BACKOFF = 120.0
+#Number of times a throttled request is retried
+DEFAULT_MAX_RETRIES = 5
+
+THROTTLE_STATUS = (429, 503)
+
+_config = {'enabled': True,
+           'default_rate': DEFAULT_RATE,
+           'burst': DEFAULT_BURST,
+           'backoff_base': DEFAULT_BACKOFF_BASE,
+           'max_backoff': DEFAULT_MAX_BACKOFF,
+           'max_retries': DEFAULT_MAX_RETRIES,
+           'state_path': None}
+
+_stats = {'requests': 0,
+          'delayed': 0,
+          'wait_seconds': 0.0,
+          'throttled': 0}
+_stats_lock = threading.Lock()
+
+#rate       : requests per second
+#tokens     : may be negative, i.e. owed by requests already waiting
+#updated    : time tokens was last updated
+#blocked_until : no requests before this time (backoff)
+#backoff    : number of consecutive throttled responses
+_State = collections.namedtuple('_State', ['rate', 'tokens', 'updated',
+                                           'blocked_until', 'backoff'])
+
+def configure(**kwargs):
+    """
+    Parameters
+    ----------
+    enabled : bool
+    default_rate : float
+        Requests per second for hosts without rate limit headers.
+    burst : float
+        Bucket size, in seconds worth of requests at the current rate.
+    backoff_base : float
+        The first backoff after a throttled response, in seconds. This
+        doubles for each further throttled response.
+    max_backoff : float
+    max_retries : int
+        Number of times a throttled request is retried.
+    state_path : str or None
+        SQLite file for sharing state between processes. If None (default)
+        state is only shared between threads.
+    """
+    global _store
+    for key in kwargs:
+        if key not in _config:
+            raise ValueError('Unrecognized rate limit option: %s' % key)
+    _config.update(kwargs)
+    if 'state_path' in kwargs:
+        _store = None
+
+def _incr(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+def stats():
+    """
+    Returns
+    -------
+    dict
+        'requests', 'delayed' (requests which had to wait), 'wait_seconds'
+        and 'throttled' (429/503 responses), for this process.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+#State storage
+#-------------------------------------------------------------------------
+class _MemoryStore(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def transact(self, host, fn):
+        """
+        Calls fn(state or None), which returns (new state, value), and
+        returns value. The state is locked for the duration.
+        """
+        with self._lock:
+            state, value = fn(self._states.get(host))
+            self._states[host] = state
+        return value
+
+    @staticmethod
+    def now():
+        return time.monotonic()
+
+
+class _SQLiteStore(object):
+
+    """
+    State shared through a SQLite file. Each transaction takes the database
+    write lock (BEGIN IMMEDIATE) so reading and updating a bucket is atomic
+    across processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limits (host TEXT PRIMARY KEY, '
+            'rate REAL, tokens REAL, updated REAL, blocked_until REAL, '
+            'backoff INTEGER)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=30,
+                                   isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def transact(self, host, fn):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT rate, tokens, updated, blocked_until, '
+                               'backoff FROM rate_limits WHERE host = ?',
+                               (host,)).fetchone()
+            state, value = fn(_State(*row) if row else None)
+            conn.execute('INSERT OR REPLACE INTO rate_limits VALUES '
+                         '(?, ?, ?, ?, ?, ?)', (host,) + tuple(state))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    @staticmethod
+    def now():
+        #Must be comparable between processes
+        return time.time()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def _get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if _config['state_path']:
+                    _store = _SQLiteStore(_config['state_path'])
+                else:
+                    _store = _MemoryStore()
+    return _store
+
+#Bucket logic
+#-------------------------------------------------------------------------
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+def _refill(state, now):
+    if state is None:
+        rate = _config['default_rate']
+        return _State(rate, rate*_config['burst'], now, 0.0, 0)
+    capacity = state.rate*_config['burst']
+    tokens = min(capacity, state.tokens + (now - state.updated)*state.rate)
+    return state._replace(tokens=tokens, updated=now)
+
+def reserve(url):
+    """
+    Takes a token for the url's host without waiting for it.
+
+    This is for callers that wait themselves, e.g. with asyncio.sleep.
+
+    Returns
+    -------
+    float
+        Seconds to wait before making the request.
+    """
+    if not _config['enabled']:
+        return 0.0
+
+    store = _get_store()
+
+    def take(state):
+        #Read inside the transaction so it is ordered with other processes
+        now = store.now()
+        state = _refill(state, now)
+        tokens = state.tokens - 1
+        wait = max(0.0, -tokens/state.rate, state.blocked_until - now)
+        return state._replace(tokens=tokens), wait
+
+    wait = store.transact(_host(url), take)
+    _incr('requests')
+    if wait > 0:
+        _incr('delayed')
+        _incr('wait_seconds', wait)
+    return wait
+
+def acquire(url):
+    """
+    Blocks until a request can be made to the url's host.
+
+    Returns
+    -------
+    float
+        Seconds waited.
+    """
+    wait = reserve(url)
+    if wait > 0:
+        time.sleep(wait)
+    return wait
+
+_INTERVAL = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*$')
+_INTERVAL_UNITS = {'ms': 0.001, 's': 1.0, None: 1.0, 'm': 60.0, 'h': 3600.0}
+
+def _parse_rate(headers):
+    """
+    Returns requests per second from the X-Rate-Limit headers, or None.
+    """
+    try:
+        limit = float(headers.get('X-Rate-Limit-Limit'))
+    except (TypeError, ValueError):
+        return None
+    match = _INTERVAL.match(headers.get('X-Rate-Limit-Interval') or '1s')
+    if match is None or limit <= 0:
+        return None
+    interval = float(match.group(1))*_INTERVAL_UNITS[match.group(2)]
+    if interval <= 0:
+        return None
+    return limit/interval
+
+def _parse_retry_after(headers):
+    #Only the seconds form is handled, not HTTP dates
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return 0.0
+
+def update(url, status, headers):
+    """
+    Updates the url host's bucket from a response.
+
+    Parameters
+    ----------
+    url : str
+    status : int
+        HTTP status code
+    headers : mapping
+        Response headers. Lookups should be case insensitive, as they are
+        for requests and aiohttp responses.
+
+    Returns
+    -------
+    bool
+        True if the response was a throttling response (429 or 503), in
+        which case the request should be retried.
+    """
+    if not _config['enabled']:
+        return False
+
+    throttled = status in THROTTLE_STATUS
+    rate = _parse_rate(headers)
+
+    store = _get_store()
+
+    def apply(state):
+        now = store.now()
+        state = _refill(state, now)
+        if rate is not None and rate != state.rate:
+            #Rescale, so waiting requests aren't owed more time than before
+            state = state._replace(rate=rate,
+                                   tokens=state.tokens*rate/state.rate)
+        if throttled:
+            backoff = state.backoff + 1
+            delay = min(_config['max_backoff'],
+                        _config['backoff_base']*2**(backoff - 1))
+            delay = max(delay, _parse_retry_after(headers))
+            state = state._replace(backoff=backoff,
+                                   blocked_until=max(state.blocked_until,
+                                                     now + delay))
+        elif state.backoff:
+            state = state._replace(backoff=0)
+        return state, None
+
+    store.transact(_host(url), apply)
+    if throttled:
+        _incr('throttled')
+    return throttled
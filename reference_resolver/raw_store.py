@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On disk store of raw API responses.
+
+The store is disabled by default. Once enabled, every response is kept
+and the store grows without limit, so it is meant for runs whose responses
+are to be reprocessed later (e.g. to rescore candidates) without querying
+again. Lookup results then only keep the key of their response rather than
+the decoded response itself, which also keeps memory bounded in large
+batches.
+
+Responses are stored as zlib compressed JSON, one file per distinct
+response, named by a hash of the kind of request, the request itself (e.g.
+the url) and the response. A later, different response to the same request
+is stored alongside the earlier one, so the 'raw' of an earlier result
+never changes.
+
+By default the store is a directory next to the database file, e.g.
+refs_raw/ for refs.db.
+
+Example
+-------
+from reference_resolver import raw_store
+raw_store.configure(enabled=True)
+result = rr.citation_to_doi(citation)
+result.raw_key
+result.raw  #decoded from the store
+for request, response in raw_store.iter_responses('crossref_search'):
+    ...
+
+See Also
+--------
+citations._CitationDOISearchResponse
+"""
+
+#Standard Library
+#------------------------
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+DEFAULT_COMPRESS_LEVEL = 6
+
+_SUFFIX = '.json.z'
+#File in each request's directory naming its latest response
+_LATEST = 'latest'
+
+_config = {'enabled': False,
+           'path': None,
+           'compress_level': DEFAULT_COMPRESS_LEVEL}
+
+
+def configure(**kwargs):
+    """
+    Parameters
+    ----------
+    enabled : bool
+        If False (default) nothing is stored and lookup results hold their
+        responses in memory.
+    path : str or None
+        Directory of the store. If None, '<database name>_raw' next to the
+        database file (see tables.set_db_path).
+    compress_level : int
+        zlib level, 1 (fastest) to 9 (smallest).
+    """
+    for key in kwargs:
+        if key not in _config:
+            raise ValueError('Unrecognized raw store option: %s' % key)
+    _config.update(kwargs)
+
+
+def get_root():
+    if _config['path'] is not None:
+        return _config['path']
+    from . import tables
+    return os.path.splitext(tables.db_path)[0] + '_raw'
+
+
+def _digest(*parts):
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def make_key(kind, request, response):
+    """
+    Returns the key of a response,
+    '<kind>/<sha1 of kind and request>/<sha1 of the response>'.
+    """
+    return '%s/%s/%s' % (kind, _digest(kind, request),
+                         _digest(json.dumps(response, sort_keys=True)))
+
+
+def _request_dir(kind, request_digest):
+    #Spread the requests over subdirectories to keep directories small
+    return os.path.join(get_root(), kind, request_digest[:2], request_digest)
+
+
+def _path(key):
+    kind, request_digest, response_digest = key.split('/')
+    return os.path.join(_request_dir(kind, request_digest),
+                        response_digest + _SUFFIX)
+
+
+def put(kind, request, response):
+    """
+    Parameters
+    ----------
+    kind : str
+        e.g. 'crossref_search'. Used as a subdirectory name.
+    request : str
+        Identifies the request, e.g. the url.
+    response :
+        JSON serializable.
+
+    Returns
+    -------
+    str or None
+        The key of the stored response. None if the store is disabled or
+        the response couldn't be written, in which case the caller should
+        keep the response itself.
+    """
+    if not _config['enabled']:
+        return None
+
+    key = make_key(kind, request, response)
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            data = zlib.compress(json.dumps({'request': request,
+                                             'response': response}
+                                            ).encode('utf-8'),
+                                 _config['compress_level'])
+            _write(path, data)
+        #For get_request
+        _write(os.path.join(os.path.dirname(path), _LATEST),
+               key.split('/')[2].encode('ascii'))
+    except OSError:
+        return None
+    return key
+
+
+def _write(path, data):
+    #Written under a temporary name so readers never see partial files
+    temp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _load(path):
+    with open(path, 'rb') as f:
+        return json.loads(zlib.decompress(f.read()).decode('utf-8'))
+
+
+def get(key):
+    """
+    Returns the decoded response stored under the key.
+
+    Raises
+    ------
+    KeyError
+        If there is no such response.
+    """
+    try:
+        return _load(_path(key))['response']
+    except (IOError, OSError):
+        raise KeyError(key)
+
+
+def get_request(kind, request):
+    """
+    Returns the latest stored response to a request, or None.
+    """
+    request_digest = _digest(kind, request)
+    try:
+        with open(os.path.join(_request_dir(kind, request_digest),
+                               _LATEST)) as f:
+            response_digest = f.read()
+        return get('%s/%s/%s' % (kind, request_digest, response_digest))
+    except (IOError, OSError, KeyError):
+        return None
+
+
+def iter_responses(kind):
+    """
+    Yields (request, response) for all stored responses of a kind, in no
+    particular order.
+    """
+    root = os.path.join(get_root(), kind)
+    if not os.path.isdir(root):
+        return
+    for prefix in sorted(os.listdir(root)):
+        prefix = os.path.join(root, prefix)
+        for directory in sorted(os.listdir(prefix)):
+            directory = os.path.join(prefix, directory)
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(_SUFFIX):
+                    entry = _load(os.path.join(directory, name))
+                    yield entry['request'], entry['response']
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact record types for papers, references and lookup results.
+
+Records use __slots__ rather than an instance dict, which makes each one
+several times smaller than the equivalent dict or plain object (see
+benchmarks/bench_records.py). This matters when millions of references are
+held in memory, e.g. while crawling.
+
+Records convert to plain dicts with to_dict(), nested records and lists of
+records included, so they can be written as JSON:
+
+    json.dumps(record.to_dict())
+    json.dumps(list_of_records, default=records.json_default)
+
+They can be passed anywhere ingest.py accepts a paper or reference.
+
+Example
+-------
+from reference_resolver.records import ReferenceRecord
+ref = ReferenceRecord(doi='10.1038/nrg3686', title='...', year=2014)
+unknown = ReferenceRecord(text='Smith J. Some conference abstract. 2011')
+
+See Also
+--------
+main.PaperInfo
+citations._CitationDOISearchResponse
+"""
+
+#Local
+#------------------------
+from . import utils
+from .utils import get_truncated_display_string as td
+
+
+def to_plain(value):
+    """
+    Returns value with any records (also in lists) converted by to_dict().
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [to_plain(x) for x in value]
+    return value
+
+
+def json_default(value):
+    """
+    'default' function for json.dump(s), for serializing records.
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError('%s is not JSON serializable' % type(value).__name__)
+
+
+class Record(object):
+
+    """
+    Base class. Subclasses list their attributes in _fields and set
+    __slots__ to (at least) the same names. Unset attributes are None.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, **kwargs):
+        for name in self._fields:
+            setattr(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError('Unexpected %s attribute(s): %s'
+                            % (type(self).__name__, ', '.join(sorted(kwargs))))
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Keys which aren't attributes of the record are ignored.
+        """
+        return cls(**dict((name, data.get(name)) for name in cls._fields))
+
+    def to_dict(self):
+        return dict((name, to_plain(getattr(self, name)))
+                    for name in self._fields)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self._fields)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def __setstate__(self, state):
+        for name, value in zip(self._fields, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        pv = []
+        for name in self._fields:
+            pv.extend([name, td(str(getattr(self, name)))])
+        return utils.property_values_to_string(pv)
+
+
+class PaperRecord(Record):
+
+    """
+    Attributes
+    ----------
+    doi : str
+    pmid : int
+    isbn : str
+    title : str
+    authors : str or list of str
+    year : int
+    container : str
+        Journal or book title
+    """
+
+    _fields = ('doi', 'pmid', 'isbn', 'title', 'authors', 'year',
+               'container')
+    __slots__ = _fields
+
+
+class ReferenceRecord(PaperRecord):
+
+    """
+    A paper cited in a reference list. See PaperRecord for the attributes.
+
+    Attributes
+    ----------
+    text : str
+        The citation text, for references that couldn't be identified.
+    """
+
+    _fields = PaperRecord._fields + ('text',)
+    __slots__ = ('text',)
@@ -3,11 +3,19 @@
 
 #JAH: Why are we reaching back to the root?
 import reference_resolver as rr
+from . import metrics
 
 #What is this for????? - can we make this optional?????
-from scopy import Scopus
+#scopy is imported and the client constructed on first use, see
+#get_scopus_api()
+_scopus_api = None
 
-scopus_api = Scopus()
+def get_scopus_api():
+    global _scopus_api
+    if _scopus_api is None:
+        from scopy import Scopus
+        _scopus_api = Scopus()
+    return _scopus_api
 
 #Why just this one function in this module??????
 
@@ -23,14 +31,17 @@ def retrieve_references(doi):
     if doi is None:
         return None
 
-    try:
-        refs = scopus_api.bibliography_retrieval.get_from_doi(doi=doi)
-    except LookupError or ConnectionRefusedError or ConnectionError:
-        refs = None
-        pass
-
-    if refs is None or len(refs) == 0:
-        paper_info = rr.doi_to_webscraped_info(doi=doi, refs_only=True)
-        refs = paper_info.references
+    with metrics.timer('retrieve_references'):
+        try:
+            with metrics.timer('scopus_references'):
+                refs = get_scopus_api().bibliography_retrieval.get_from_doi(doi=doi)
+        except LookupError or ConnectionRefusedError or ConnectionError:
+            refs = None
+            pass
+
+        if refs is None or len(refs) == 0:
+            with metrics.timer('scrape_references'):
+                paper_info = rr.doi_to_webscraped_info(doi=doi, refs_only=True)
+            refs = paper_info.references
 
     return refs
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared HTTP session used for all (blocking) outbound requests.
+
+Using a single requests.Session means connections are pooled and kept alive
+between lookups rather than paying for a new TCP/TLS handshake on every
+citation. Requests are paced, and retried when throttled, by ratelimit.py.
+
+Example
+-------
+from reference_resolver import sessions
+sessions.configure(pool_maxsize=64, max_retries=5)
+
+See Also
+--------
+ratelimit
+crossref.Works
+aio.AsyncClient
+"""
+
+#Standard Library
+#------------------------
+import threading
+
+#Number of hosts to keep pools for
+DEFAULT_POOL_CONNECTIONS = 10
+#Connections kept per host. Should be at least the number of threads
+#making requests (see batch.DEFAULT_MAX_WORKERS).
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+#429 and 503 (throttling) are retried by ratelimit instead, which shares
+#the backoff between all threads
+DEFAULT_STATUS_FORCELIST = (500, 502, 504)
+DEFAULT_TIMEOUT = 30
+
+_lock = threading.Lock()
+_session = None
+_config = {'pool_connections': DEFAULT_POOL_CONNECTIONS,
+           'pool_maxsize': DEFAULT_POOL_MAXSIZE,
+           'max_retries': DEFAULT_MAX_RETRIES,
+           'backoff_factor': DEFAULT_BACKOFF_FACTOR,
+           'status_forcelist': DEFAULT_STATUS_FORCELIST,
+           'keep_alive': True,
+           'timeout': DEFAULT_TIMEOUT}
+
+def configure(**kwargs):
+    """
+    Updates the session settings. The shared session is rebuilt on next use.
+
+    Parameters
+    ----------
+    pool_connections : int
+    pool_maxsize : int
+        Maximum number of connections kept open per host.
+    max_retries : int
+        Retries for connection errors and retryable status codes.
+    backoff_factor : float
+        Retry delays are backoff_factor * 2**(retry number - 1)
+    status_forcelist : sequence of int
+        Status codes which are retried.
+    keep_alive : bool
+        If False, connections are closed after each request.
+    timeout : float
+        Default timeout in seconds, used when a call doesn't specify one.
+    """
+    global _session
+    for key in kwargs:
+        if key not in _config:
+            raise ValueError('Unrecognized session option: %s' % key)
+
+    with _lock:
+        _config.update(kwargs)
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def _create_session():
+    #Imported here as requests is relatively slow to import
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=_config['max_retries'],
+                  backoff_factor=_config['backoff_factor'],
+                  status_forcelist=_config['status_forcelist'],
+                  raise_on_status=False)
+
+    adapter = HTTPAdapter(pool_connections=_config['pool_connections'],
+                          pool_maxsize=_config['pool_maxsize'],
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not _config['keep_alive']:
+        session.headers['Connection'] = 'close'
+    return session
+
+def get_session():
+    """
+    Returns the shared requests.Session, creating it if necessary.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+def close():
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def request(method, url, **kwargs):
+    """
+    Makes a request using the shared session.
+
+    Parameters match requests.request. If no timeout is given the configured
+    default is used.
+    
+    The request waits for the host's rate limit (see ratelimit.py) and is
+    retried if throttled.
+
+    Returns
+    -------
+    requests.Response
+        After max_retries throttled attempts the last (429 or 503) response
+        is returned.
+    """
+    from . import metrics
+    from . import ratelimit
+    
+    kwargs.setdefault('timeout', _config['timeout'])
+    session = get_session()
+    for attempt in range(ratelimit._config['max_retries'] + 1):
+        wait = ratelimit.acquire(url)
+        metrics.observe('rate_limit_wait', wait)
+        with metrics.timer('http_request'):
+            response = session.request(method, url, **kwargs)
+        if not ratelimit.update(url, response.status_code, response.headers):
+            break
+    return response
+
+def get(url, **kwargs):
+    return request('get', url, **kwargs)
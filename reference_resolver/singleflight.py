@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coalescing of concurrent identical lookups ("single flight").
+
+When many citations are resolved concurrently the same popular reference is
+often requested by several workers at once. Rather than each of them
+querying Crossref, the first caller for a key performs the lookup and the
+others wait for it and share its result, or its exception.
+
+Only lookups that are in progress at the same time are coalesced. Once the
+lookup finishes the key is forgotten, repeat lookups are the job of the
+citation cache (see cache.py).
+
+Example
+-------
+flights = SingleFlight()
+response = flights.do(key, fetch_function, citation)
+
+See Also
+--------
+citations.citation_to_doi
+main.citation_to_paper_info
+aio.AsyncClient
+"""
+
+#Standard Library
+#------------------------
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        #Number of callers that shared the result, in addition to the leader
+        self.n_shared = 0
+
+
+class SingleFlight(object):
+
+    """
+    Thread based coalescing of calls with the same key.
+
+    Attributes
+    ----------
+    n_calls : int
+        Number of calls that were actually made.
+    n_shared : int
+        Number of callers that received another caller's result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.n_calls = 0
+        self.n_shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Calls fn(*args, **kwargs) unless a call with the same key is
+        already in progress, in which case its outcome is returned.
+
+        Parameters
+        ----------
+        key : hashable
+            Callers with equal keys must be asking for the same thing.
+        fn : callable
+
+        Returns
+        -------
+        The result of fn. If fn raised, the same exception is raised in
+        every waiting caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.n_calls += 1
+                leader = True
+            else:
+                call.n_shared += 1
+                self.n_shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def in_flight(self):
+        """
+        Returns the number of keys currently being looked up.
+        """
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight(object):
+
+    """
+    asyncio version of SingleFlight.
+
+    An instance must only be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self.n_calls = 0
+        self.n_shared = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Awaits fn(*args, **kwargs) unless a call with the same key is
+        already in progress, in which case its outcome is returned.
+        """
+        import asyncio
+
+        future = self._futures.get(key)
+        if future is not None:
+            self.n_shared += 1
+            #shield, so a cancelled waiter doesn't cancel the shared lookup
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        self.n_calls += 1
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            if not future.cancelled():
+                future.set_exception(e)
+                #Avoid "exception was never retrieved" when nobody waited
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
@@ -6,12 +6,13 @@
 #------------------------
 import datetime
 import os
+import threading
 
 
 # Third party imports
 #--------------------------------------
 import sqlalchemy as sql
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, validates
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -19,6 +20,7 @@ Base = declarative_base()
 # Local imports
 #-------------------------------------
 from . import tables
+from . import metrics
 
 package_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 
@@ -27,12 +29,82 @@ package_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 db_path = os.path.join(package_path,'refs.db')
 dialect = 'sqlite:///'
 
-# Combine the dialect and path names to use as params for the engine
-engine_params = dialect + db_path
+# Applied to every new connection. WAL lets readers proceed while a bulk
+# insert is running and, with synchronous=NORMAL, avoids an fsync per
+# transaction.
+SQLITE_PRAGMAS = ['PRAGMA journal_mode=WAL',
+                  'PRAGMA synchronous=NORMAL',
+                  'PRAGMA temp_store=MEMORY',
+                  'PRAGMA cache_size=-65536']
 
-engine = sql.create_engine(engine_params, echo=False)
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+#Seconds to wait for a lock held by another connection/process
+SQLITE_TIMEOUT = 30
+
+# The engine is created (and the tables created if necessary) on first use
+# rather than on import, see get_engine()
+_engine_lock = threading.Lock()
+_engine = None
+_engine_pid = None
+_session_factory = sessionmaker()
+
+def set_db_path(path):
+    """
+    Points the package at a different database file. Any existing engine is
+    disposed of and a new one is created on next use. Cached paper lookups
+    are dropped since they came from the old database.
+    """
+    global db_path, _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+        db_path = path
+        _paper_cache.clear()
+
+def get_engine():
+    """
+    Returns the engine for the local database, creating the engine and any
+    missing tables on first use.
+    
+    A new engine is also created in forked child processes, since database
+    connections can't be shared with the parent.
+    """
+    global _engine, _engine_pid
+    pid = os.getpid()
+    if _engine is None or _engine_pid != pid:
+        with _engine_lock:
+            if _engine is None or _engine_pid != pid:
+                # Combine the dialect and path names to use as params for the engine
+                engine_params = dialect + db_path
+                #Connections are pooled rather than opened per session.
+                #check_same_thread is disabled since a pooled connection may
+                #be used by different threads (one at a time).
+                engine = sql.create_engine(engine_params, echo=False,
+                            poolclass=sql.pool.QueuePool,
+                            connect_args={'check_same_thread': False,
+                                          'timeout': SQLITE_TIMEOUT})
+                sql.event.listen(engine, 'connect', _set_sqlite_pragmas)
+                _create_tables(engine)
+                _session_factory.configure(bind=engine)
+                #Also after a fork, the parent may change papers after the
+                #child copied its cache
+                _paper_cache.clear()
+                _engine_pid = pid
+                _engine = engine
+    return _engine
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+def Session():
+    """
+    Returns a new ORM session bound to the local database.
+    """
+    get_engine()
+    return _session_factory()
 
 
 #============================================================
@@ -48,7 +120,8 @@ class UnknownReference(Base):
     __tablename__ = 'unknown_references'
     
     id = sql.Column(sql.INTEGER, primary_key=True)
-    ref_id = sql.Column(sql.INTEGER, sql.ForeignKey('unknown_references.id'))
+    ref_id = sql.Column(sql.INTEGER, sql.ForeignKey('references.id'), index=True)
+    #The Reference entry (with a ref_paper_id of -1) this text belongs to
     
     unknown_text = sql.Column(sql.VARCHAR)
     #If we don't know the reference, put the text here
@@ -63,9 +136,10 @@ class Reference(Base):
     __tablename__ = 'references'
 
     id = sql.Column(sql.INTEGER, primary_key=True)
-    main_paper_id = sql.Column(sql.INTEGER, sql.ForeignKey('papers.id'))
+    main_paper_id = sql.Column(sql.INTEGER, sql.ForeignKey('papers.id'), index=True)
 
-    ref_paper_id = sql.Column(sql.INTEGER, sql.ForeignKey('papers.id'),default=-1)
+    ref_paper_id = sql.Column(sql.INTEGER, sql.ForeignKey('papers.id'),default=-1,
+                              index=True)
     #Can we have this be -1 if we don't know what it is????
     
     ordering = sql.Column(sql.INTEGER)
@@ -82,19 +156,31 @@ class Paper(Base):
 
     id = sql.Column(sql.INTEGER, primary_key=True)
 
-    doi = sql.Column(sql.VARCHAR)
-    pmid = sql.Column(sql.BigInteger)
-    isbn = sql.Column(sql.VARCHAR)
+    doi = sql.Column(sql.VARCHAR, index=True)
+    #Always lower case, see normalize_doi()
+    pmid = sql.Column(sql.BigInteger, index=True)
+    isbn = sql.Column(sql.VARCHAR, index=True)
     chapter = sql.Column(sql.INTEGER)
     first_page = sql.Column(sql.VARCHAR)
+    
+    #Bibliographic info, used for matching citations locally (see 
+    #local_match.py). These are indexed in the papers_fts table.
+    title = sql.Column(sql.VARCHAR)
+    authors = sql.Column(sql.VARCHAR)
+    year = sql.Column(sql.INTEGER)
+    container = sql.Column(sql.VARCHAR)
+    #journal or book title
+    
     created = sql.Column(sql.DateTime, default=datetime.datetime.utcnow)
     updated = sql.Column(sql.DateTime, onupdate=datetime.datetime.utcnow)
-    #TODO: Need something to indicate that we have added the references
-    #- but we might want to know how as well for later verification
-    #- as well as when the references were added
+    #When the references of the paper were retrieved (see crawler.py). NULL
+    #if they haven't been.
+    #TODO: we might want to know how as well for later verification
+    references_retrieved = sql.Column(sql.DateTime)
     
-    new_pointer = sql.Column(sql.BigInteger, default=0)
-    #If we ever need to merge duplicates all duplicates will point to a new id
+    new_pointer = sql.Column(sql.BigInteger, default=0, index=True)
+    #When duplicates are merged (see dedup.py) all duplicates point directly
+    #to the id of the paper that is kept, which has new_pointer 0.
 
     def __repr__(self):
         pv = ['id: ', self.id,
@@ -105,6 +191,13 @@ class Paper(Base):
               'new_pointer',self.new_pointer]
         return utils.property_values_to_string(pv)
     
+    @property
+    def canonical_id(self):
+        """
+        Id of the paper this one has been merged into, or its own id.
+        """
+        return self.new_pointer or self.id
+    
     @staticmethod
     def create_from_doi(input_doi):
         #populate other properties here as well
@@ -115,12 +208,281 @@ class Paper(Base):
         pdb.set_trace()
         pass
     
+    @validates('doi')
+    def normalize_doi(self, key, value):
+        return utils.normalize_doi(value)
+    
     @staticmethod
     def get_from_doi(input_doi):
+        """
+        Returns
+        -------
+        Paper or None
+            Papers are returned detached from any session. Found papers are
+            kept in an in-memory LRU cache so repeated lookups don't touch
+            the database (see clear_lookup_cache).
+        """
         #TODO: Option for creating if no exist
-        session = Session()
-        result = session.query(Paper).filter_by(doi=input_doi)
-        obj = result.first()
-        return obj
+        doi = utils.normalize_doi(input_doi)
+        return Paper._get_cached('doi', doi)
+    
+    @staticmethod
+    def get_from_pmid(input_pmid):
+        """
+        See get_from_doi
+        """
+        return Paper._get_cached('pmid', int(input_pmid))
+    
+    @staticmethod
+    def _get_cached(column_name, value):
+        key = (column_name, value)
+        obj = _paper_cache.get(key)
+        metrics.hit('paper_cache', obj is not None)
+        if obj is not None:
+            return obj
         
+        with metrics.timer('db_paper_lookup'):
+            session = Session()
+            try:
+                result = session.query(Paper).filter_by(**{column_name: value})
+                obj = result.first()
+                if obj is not None:
+                    session.expunge(obj)
+                    _paper_cache.put(key, obj)
+            finally:
+                session.close()
+        return obj
+    
+    @staticmethod
+    def clear_lookup_cache():
+        _paper_cache.clear()
+    
+    @staticmethod
+    def forget_ids(paper_ids):
+        """
+        Removes cached lookups of papers changed without the ORM (e.g. by
+        ingest.py), which bypasses the events that do this otherwise.
+        """
+        paper_ids = set(paper_ids)
+        if paper_ids:
+            _paper_cache.discard_where(lambda key, paper: paper.id in paper_ids)
+
+#Detached Paper objects keyed by ('doi', doi) or ('pmid', pmid)
+PAPER_CACHE_SIZE = 10000
+_paper_cache = utils.LRUCache(PAPER_CACHE_SIZE)
+
+def _forget_paper(mapper, connection, target):
+    #Remove any cached lookups for a paper that has been changed or deleted,
+    #including values from before the change
+    state = sql.inspect(target)
+    for name in ('doi', 'pmid'):
+        history = state.attrs[name].history
+        for value in list(history.deleted) + [getattr(target, name)]:
+            if value is not None:
+                _paper_cache.discard((name, value))
+
+sql.event.listen(Paper, 'after_update', _forget_paper)
+sql.event.listen(Paper, 'after_delete', _forget_paper)
+
+class CitationCache(Base):
+    """
+    Cache of previously resolved citations, see cache.py
+    
+    'citation_key' is the normalized citation (utils.normalize_citation).
+    'last_used' is only approximately maintained and is used to evict the
+    least recently used entries when the cache grows too large.
+    Entries without a doi are cached misses, with 'reason' being
+    'not_found' or 'low_score'.
+    """
+    __tablename__ = 'citation_cache'
+    
+    citation_key = sql.Column(sql.VARCHAR, primary_key=True)
+    doi = sql.Column(sql.VARCHAR)
+    score = sql.Column(sql.FLOAT)
+    reason = sql.Column(sql.VARCHAR)
+    fetched = sql.Column(sql.DateTime, default=datetime.datetime.utcnow)
+    last_used = sql.Column(sql.DateTime, default=datetime.datetime.utcnow,
+                           index=True)
+    
+    def __repr__(self):
+        pv = ['citation_key: ', self.citation_key,
+              'doi: ', self.doi,
+              'score: ', self.score,
+              'reason: ', self.reason,
+              'fetched', self.fetched,
+              'last_used', self.last_used]
+        return utils.property_values_to_string(pv)
+
+class Watermark(Base):
+    """
+    Progress markers for jobs that process rows incrementally, e.g. the
+    largest paper id that dedup.py has processed.
+    """
+    __tablename__ = 'watermarks'
+    
+    name = sql.Column(sql.VARCHAR, primary_key=True)
+    value = sql.Column(sql.BigInteger)
+    updated = sql.Column(sql.DateTime, default=datetime.datetime.utcnow,
+                         onupdate=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        pv = ['name: ', self.name,
+              'value: ', self.value,
+              'updated', self.updated]
+        return utils.property_values_to_string(pv)
+
+class Job(Base):
+    """
+    Work queue shared by worker processes, see jobs.py
+    
+    status : 'pending', 'running', 'done' or 'failed'
+    claim : random token set when a worker claims the job. Only the holder
+        of the current claim can complete it.
+    lease_until : a running job whose lease has expired (e.g. its worker
+        crashed) can be claimed by another worker.
+    available_at : pending jobs aren't claimed before this (retry delay)
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (sql.Index('ix_jobs_kind_payload', 'kind', 'payload'),
+                      sql.Index('ix_jobs_status_available', 'status',
+                                'available_at'))
+    
+    id = sql.Column(sql.INTEGER, primary_key=True)
+    kind = sql.Column(sql.VARCHAR, nullable=False)
+    payload = sql.Column(sql.VARCHAR, nullable=False)
+    status = sql.Column(sql.VARCHAR, nullable=False, default='pending')
+    attempts = sql.Column(sql.INTEGER, nullable=False, default=0)
+    max_attempts = sql.Column(sql.INTEGER, nullable=False, default=3)
+    worker = sql.Column(sql.VARCHAR)
+    claim = sql.Column(sql.VARCHAR, index=True)
+    lease_until = sql.Column(sql.DateTime, index=True)
+    available_at = sql.Column(sql.DateTime, default=datetime.datetime.utcnow)
+    #JSON
+    result = sql.Column(sql.VARCHAR)
+    error = sql.Column(sql.VARCHAR)
+    created = sql.Column(sql.DateTime, default=datetime.datetime.utcnow)
+    updated = sql.Column(sql.DateTime, default=datetime.datetime.utcnow,
+                         onupdate=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        pv = ['id: ', self.id,
+              'kind: ', self.kind,
+              'payload: ', self.payload,
+              'status: ', self.status,
+              'attempts: ', self.attempts,
+              'worker: ', self.worker,
+              'error', self.error]
+        return utils.property_values_to_string(pv)
+
+class IdMapping(Base):
+    """
+    Local identifier crosswalk (e.g. the PMC id mapping file), see idmap.py
+
+    Any of the identifiers may be missing. 'doi' is lower case and 'pmcid'
+    includes the 'PMC' prefix.
+    """
+    __tablename__ = 'id_mappings'
+
+    id = sql.Column(sql.INTEGER, primary_key=True)
+    pmid = sql.Column(sql.BigInteger, index=True)
+    pmcid = sql.Column(sql.VARCHAR, index=True)
+    doi = sql.Column(sql.VARCHAR, index=True)
+
+    def __repr__(self):
+        pv = ['id: ', self.id,
+              'pmid: ', self.pmid,
+              'pmcid: ', self.pmcid,
+              'doi: ', self.doi]
+        return utils.property_values_to_string(pv)
+
+#Full text index over the bibliographic columns of papers. This is an
+#"external content" table, i.e. it only stores the index, and is kept in
+#sync with the papers table by triggers. Papers without a title aren't
+#indexed.
+_FTS_COLUMNS = 'title, authors, year, container'
+_FTS_NEW = 'new.id, new.title, new.authors, new.year, new.container'
+_FTS_OLD = 'old.id, old.title, old.authors, old.year, old.container'
+_FTS_DDL = [
+"""CREATE VIRTUAL TABLE papers_fts USING fts5(%s, content='papers',
+    content_rowid='id', tokenize='unicode61 remove_diacritics 1')""" % _FTS_COLUMNS,
+"""CREATE TRIGGER papers_fts_insert AFTER INSERT ON papers
+    WHEN new.title IS NOT NULL BEGIN
+    INSERT INTO papers_fts(rowid, %s) VALUES (%s);
+    END""" % (_FTS_COLUMNS, _FTS_NEW),
+"""CREATE TRIGGER papers_fts_delete AFTER DELETE ON papers
+    WHEN old.title IS NOT NULL BEGIN
+    INSERT INTO papers_fts(papers_fts, rowid, %s) VALUES ('delete', %s);
+    END""" % (_FTS_COLUMNS, _FTS_OLD),
+"""CREATE TRIGGER papers_fts_update_old AFTER UPDATE OF %s ON papers
+    WHEN old.title IS NOT NULL BEGIN
+    INSERT INTO papers_fts(papers_fts, rowid, %s) VALUES ('delete', %s);
+    END""" % (_FTS_COLUMNS, _FTS_COLUMNS, _FTS_OLD),
+"""CREATE TRIGGER papers_fts_update_new AFTER UPDATE OF %s ON papers
+    WHEN new.title IS NOT NULL BEGIN
+    INSERT INTO papers_fts(rowid, %s) VALUES (%s);
+    END""" % (_FTS_COLUMNS, _FTS_COLUMNS, _FTS_NEW),
+#Index any papers that existed before the index was created
+"""INSERT INTO papers_fts(rowid, %s) SELECT id, %s FROM papers
+    WHERE title IS NOT NULL""" % (_FTS_COLUMNS, _FTS_COLUMNS)]
+
+#Set when creating the tables. Some SQLite builds don't include FTS5.
+fts_available = False
+
+def _create_fts(engine):
+    global fts_available
+    inspector = sql.inspect(engine)
+    if 'papers_fts' in inspector.get_table_names():
+        fts_available = True
+        return
+    
+    try:
+        with engine.begin() as conn:
+            for statement in _FTS_DDL:
+                conn.execute(sql.text(statement))
+    except sql.exc.OperationalError:
+        fts_available = False
+    else:
+        fts_available = True
+
+def _create_tables(engine):
+    #This needs to be called after all tables have been defined
+    Base.metadata.create_all(engine)
+    
+    #create_all only creates new tables. This adds columns and indices that
+    #were introduced after a table was first created.
+    inspector = sql.inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = set(x['name'] for x in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute('ALTER TABLE "%s" ADD COLUMN "%s" %s' % 
+                                 (table.name, column.name, column_type))
+
+        existing = set(x['name'] for x in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                
+    _lower_case_dois(engine)
+    _create_fts(engine)
+
+#Watermark set once papers.doi has been made lower case
+_LOWER_CASE_DOIS = 'papers_lower_case_dois'
 
+def _lower_case_dois(engine):
+    #DOIs were stored as given before lookups started lower casing them
+    #(see Paper.normalize_doi). This converts such rows once so they can be
+    #found. SQLite's lower() only changes ASCII letters, as in DOIs.
+    marks = Watermark.__table__
+    papers = Paper.__table__
+    with engine.begin() as conn:
+        done = conn.execute(sql.select([marks.c.value]).where(
+            marks.c.name == _LOWER_CASE_DOIS)).fetchall()
+        if done:
+            return
+        conn.execute(papers.update().where(
+            papers.c.doi != sql.func.lower(papers.c.doi)).values(
+            doi=sql.func.lower(papers.c.doi)))
+        conn.execute(marks.insert().values(name=_LOWER_CASE_DOIS, value=1))
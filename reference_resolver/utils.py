@@ -2,6 +2,105 @@
 """
 """
 
+import collections
+import re
+import threading
+import unicodedata
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+#SQLite limits the number of bound parameters per statement
+IN_CHUNK_SIZE = 500
+
+def chunks(values, size=IN_CHUNK_SIZE):
+    """
+    Yields lists of at most 'size' values, e.g. for the values of an 'IN'
+    clause.
+    """
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def normalize_citation(citation):
+    """
+    Returns a canonical form of a citation for use as a lookup key.
+    
+    Unicode is normalized (e.g. the non-breaking hyphens that show up in
+    copy/pasted citations), case is folded and all punctuation and
+    whitespace runs are collapsed to a single space.
+    
+    Example
+    -------
+    normalize_citation('Senís, E. "CRISPR/Cas9‐mediated" (2014).')
+    => 'senís e crispr cas9 mediated 2014'
+    """
+    citation = unicodedata.normalize('NFKC', citation).casefold()
+    return _NON_WORD.sub(' ', citation).strip()
+
+def normalize_doi(doi):
+    """
+    DOIs are case insensitive. We store and look them up in lower case.
+    """
+    if doi is None:
+        return None
+    return doi.strip().lower()
+
+class LRUCache(object):
+    
+    """
+    A small thread-safe, size-bounded, least-recently-used mapping.
+    
+    Attributes
+    ----------
+    max_size : int
+    hits : int
+    misses : int
+    """
+    
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+        
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            
+    def discard_where(self, predicate):
+        """
+        Removes all entries for which predicate(key, value) is true.
+        """
+        with self._lock:
+            for key in [k for k, v in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+            
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            
+    def __len__(self):
+        return len(self._data)
+
 def property_values_to_string(pv):
     """
     Parameters
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import asyncio
+
+import pytest
+
+from reference_resolver import aio, cache, citations, ingest, main, metrics
+from reference_resolver import tables
+from reference_resolver.errors import CitationNotFoundError
+
+#citation => (doi, score), None for no results
+RESULTS = {'a good citation': ('10.1000/good', 90.0),
+           'a vague citation': ('10.1000/vague', 20.0),
+           'a web page': None}
+
+TITLE = ('CRISPR/Cas9-mediated genome engineering: An adeno-associated '
+         'viral (AAV) vector toolbox')
+LOCAL = ('Senís, Elena, et al. "%s. Biotechnology journal 9.11 (2014): '
+         '1402-1412.' % TITLE)
+
+
+class _FakeClient(aio.AsyncClient):
+
+    """
+    Answers search.crossref.org and /works requests from RESULTS.
+    """
+
+    def __init__(self):
+        super(_FakeClient, self).__init__()
+        self.requests = []
+
+    async def get_json(self, url, params=None):
+        if params is None:
+            citation = url.split('?q=')[1].replace('%20', ' ')
+        else:
+            citation = params['query.bibliographic']
+        self.requests.append(citation)
+        #Lets concurrent lookups overlap
+        await asyncio.sleep(0.01)
+
+        result = RESULTS[citation]
+        if params is None:
+            if result is None:
+                return []
+            return [{'doi': 'http://dx.doi.org/' + result[0],
+                     'score': result[1]}]
+        if result is None:
+            return {'message': {'total-results': 0, 'items': []}}
+        return {'message': {'total-results': 1,
+                            'items': [{'DOI': result[0], 'score': result[1]}]}}
+
+
+@pytest.fixture
+def client(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    cache.configure(min_score=50)
+    yield _FakeClient()
+    cache.configure(min_score=None)
+    metrics.configure(enabled=False)
+    metrics.reset()
+    tables.get_engine().dispose()
+
+
+def _run(client, fn, *args, **kwargs):
+    async def run():
+        async with client:
+            return await fn(*args, client=client, **kwargs)
+    return asyncio.run(run())
+
+
+def test_citation_to_doi(client):
+    metrics.configure(enabled=True)
+    response = _run(client, aio.async_citation_to_doi, 'a good citation')
+    assert response.doi == '10.1000/good'
+    #Cached, also for the blocking version
+    response = _run(client, aio.async_citation_to_doi, 'a good citation')
+    assert response.doi == '10.1000/good'
+    assert citations.citation_to_doi('a good citation').doi == '10.1000/good'
+
+    for citation in ('a vague citation', 'a web page'):
+        for i in range(2):
+            with pytest.raises(CitationNotFoundError):
+                _run(client, aio.async_citation_to_doi, citation)
+    assert cache.get('a vague citation').reason == cache.LOW_SCORE
+
+    response = _run(client, aio.async_citation_to_doi, 'doi:10.1002/biot.1.')
+    assert response.doi == '10.1002/biot.1'
+    assert client.requests == ['a good citation', 'a vague citation',
+                               'a web page']
+
+    stats = metrics.stats()
+    assert stats['counters']['embedded_doi_hits'] == 1
+    #Including the blocking lookup
+    assert stats['timings']['citation_to_doi']['count'] == 8
+    assert stats['timings']['crossref_search']['count'] == 3
+
+
+def test_citation_to_paper_info(client):
+    ingest.get_paper_ids([{'doi': '10.1002/biot.201400046', 'title': TITLE,
+                           'authors': ['Senís, Elena'], 'year': 2014}])
+    info = _run(client, aio.async_citation_to_paper_info, LOCAL)
+    assert info.doi == '10.1002/biot.201400046'
+
+    info = _run(client, aio.async_citation_to_paper_info, 'a good citation')
+    assert info.doi == '10.1000/good'
+    assert main.citation_to_paper_info('a good citation').doi == '10.1000/good'
+    with pytest.raises(CitationNotFoundError):
+        _run(client, aio.async_citation_to_paper_info, 'a vague citation')
+    assert client.requests == ['a good citation', 'a vague citation']
+
+
+def test_batch_coalesces(client):
+    citation_list = ['a good citation', 'a good citation', 'a web page']
+
+    async def run():
+        async with client:
+            return await aio.async_citations_to_dois(citation_list, client)
+    results = asyncio.run(run())
+    assert [x.result.doi for x in results[:2]] == ['10.1000/good'] * 2
+    assert isinstance(results[2].error, CitationNotFoundError)
+    assert client.requests == ['a good citation', 'a web page']
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import time
+
+from reference_resolver import batch
+
+
+def _slow_square(x):
+    if x == 3:
+        raise LookupError('bad input')
+    #Later inputs finish first
+    time.sleep(0.01*(5 - x))
+    return x*x
+
+
+def test_run_batch_keeps_order_and_errors():
+    results = batch.run_batch(_slow_square, range(5), max_workers=4)
+    assert [r.index for r in results] == [0, 1, 2, 3, 4]
+    assert [r.result for r in results] == [0, 1, 4, None, 16]
+    assert isinstance(results[3].error, LookupError)
+    assert not results[3].ok
+
+
+def test_iter_batch_streams_from_generator():
+    inputs = (x for x in range(5))
+    results = list(batch.iter_batch(_slow_square, inputs, max_workers=5))
+    assert sorted(r.index for r in results) == [0, 1, 2, 3, 4]
+    #Unordered iteration yields the fastest first
+    assert results[0].index != 0
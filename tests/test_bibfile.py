@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import io
+import json
+
+import pytest
+
+from reference_resolver import bibfile
+
+BIBTEX = """
+@comment{ignored}
+@article{senis2014,
+  author = {Sen{\\'i}s, Elena and Fatouros, Chronis},
+  title = {{CRISPR/Cas9}-mediated genome engineering (AAV},
+  journal = "Biotechnology journal",
+  year = 2014, volume = {9}, number = {11}, pages = {1402--1412}
+}@book{b, title={A Book}, doi={10.1000/xyz}}
+@article{c, title={Linked}, doi={https://doi.org/10.1000/XYZ.2.}}
+@article{d, title={Bad}, doi={not a doi}}
+"""
+
+RIS = """TY  - JOUR
+AU  - Senis, Elena
+TI  - CRISPR/Cas9-mediated genome engineering
+JO  - Biotechnology journal
+PY  - 2014/11/01
+SP  - 1402
+EP  - 1412
+ER  - 
+TY  - JOUR
+ID  - second
+DO  - doi:10.1000/ABC
+ER  - 
+"""
+
+
+def test_read_bibtex():
+    entries = list(bibfile.read_bibtex(io.StringIO(BIBTEX)))
+    assert [x.key for x in entries] == ['senis2014', 'b', 'c', 'd']
+    assert entries[0].citation == ("Senis, Elena, Fatouros, Chronis. "
+                                   "CRISPR/Cas9-mediated genome engineering "
+                                   "(AAV. Biotechnology journal 9(11) "
+                                   "(2014): 1402-1412.")
+    #Normalized like resolved DOIs, or looked up if invalid
+    assert [x.doi for x in entries[1:]] == ['10.1000/xyz', '10.1000/xyz.2',
+                                            None]
+
+
+def test_read_ris():
+    entries = list(bibfile.read_ris(io.StringIO(RIS)))
+    assert [x.key for x in entries] == ['1', 'second']
+    assert entries[0].citation.endswith('Biotechnology journal (2014): 1402-1412.')
+    assert entries[1].doi == '10.1000/abc'
+
+
+def test_resolve_file_resumes(tmp_path, monkeypatch):
+    input_path = str(tmp_path / 'citations.txt')
+    output_path = str(tmp_path / 'out.jsonl')
+    with open(input_path, 'w') as f:
+        f.write('\n'.join('citation %d' % i for i in range(25)))
+
+    calls = []
+
+    def resolver(citation):
+        calls.append(citation)
+        if citation == 'citation 13' and calls.count(citation) == 1:
+            raise KeyboardInterrupt
+        if citation == 'citation 7':
+            raise LookupError('not found')
+        return '10.1/' + citation.split()[1]
+
+    monkeypatch.setattr(bibfile, '_get_resolver', lambda method: resolver)
+
+    with pytest.raises(KeyboardInterrupt):
+        bibfile.resolve_file(input_path, output_path, max_workers=1,
+                             checkpoint_every=5)
+    first_run = len(calls)
+
+    counts = bibfile.resolve_file(input_path, output_path, max_workers=1,
+                                  checkpoint_every=5)
+    assert counts == {'n_ok': 12, 'n_failed': 0, 'n_skipped': 13}
+    assert len(calls) == first_run + 12
+
+    with open(output_path) as f:
+        records = [json.loads(x) for x in f]
+    assert [x['index'] for x in records] == list(range(25))
+    assert records[7]['error'].startswith('LookupError')
+    assert records[24]['doi'] == '10.1/24'
+
+
+def test_resolve_file_sources_and_changed_input(tmp_path, monkeypatch):
+    from reference_resolver.main import PaperInfo
+
+    input_path = str(tmp_path / 'refs.ris')
+    output_path = str(tmp_path / 'out.jsonl')
+    with open(input_path, 'w') as f:
+        f.write(RIS)
+
+    def resolver(citation):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(bibfile, '_get_resolver', lambda method: resolver)
+    with pytest.raises(KeyboardInterrupt):
+        bibfile.resolve_file(input_path, output_path, max_workers=1)
+
+    #Resuming with a changed input
+    with open(input_path, 'a') as f:
+        f.write('TY  - JOUR\nTI  - Another\nER  - \n')
+    with pytest.raises(ValueError):
+        bibfile.resolve_file(input_path, output_path, max_workers=1)
+
+    monkeypatch.setattr(bibfile, '_get_resolver', lambda method: lambda x:
+                        PaperInfo(doi='10.1000/local', source='local'))
+    counts = bibfile.resolve_file(input_path, output_path, max_workers=1,
+                                  resume=False)
+    assert counts['n_ok'] == 3
+    with open(output_path) as f:
+        records = [json.loads(x) for x in f]
+    assert [x['source'] for x in records] == ['local', 'file', 'local']
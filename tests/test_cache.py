@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import datetime
+
+import pytest
+
+from reference_resolver import cache, main, tables
+from reference_resolver.errors import CitationNotFoundError
+
+#citation => (doi, score), None for no results
+RESULTS = {'a good citation': ('10.1/good', 90.0),
+           'a vague citation': ('10.1/vague', 20.0),
+           'a web page': None}
+
+
+class _FakeWorks(object):
+
+    requests = []
+
+    def query(self, bibliographic):
+        self.citation = bibliographic
+        return self
+
+    def select(self, fields):
+        return self
+
+    def rows(self, n):
+        return self
+
+    def get(self):
+        _FakeWorks.requests.append(self.citation)
+        result = RESULTS[self.citation]
+        if result is None:
+            return {'message': {'total-results': 0, 'items': []}}
+        return {'message': {'total-results': 1,
+                            'items': [{'DOI': result[0], 'score': result[1]}]}}
+
+
+@pytest.fixture
+def works(tmp_path, monkeypatch):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    monkeypatch.setattr(main, 'Works', _FakeWorks)
+    _FakeWorks.requests = []
+    yield _FakeWorks.requests
+    cache.configure(min_score=None, negative_ttl=cache.DEFAULT_NEGATIVE_TTL)
+    tables.get_engine().dispose()
+
+
+@pytest.fixture
+def db(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    cache.reset_stats()
+    yield
+    cache.configure(ttl=cache.DEFAULT_TTL, max_size=cache.DEFAULT_MAX_SIZE,
+                    negative_ttl=cache.DEFAULT_NEGATIVE_TTL)
+    tables.get_engine().dispose()
+
+
+def _lookup(citation, **kwargs):
+    return main.citation_to_paper_info(citation, use_local=False, **kwargs)
+
+
+def test_misses_are_cached(works):
+    for i in range(3):
+        with pytest.raises(CitationNotFoundError):
+            _lookup('a web page')
+    assert works == ['a web page']
+    assert cache.get('a web page').reason == cache.NOT_FOUND
+    assert cache.get('a web page', include_misses=False) is None
+
+    with pytest.raises(CitationNotFoundError):
+        _lookup('a web page', retry_misses=True)
+    assert len(works) == 2
+
+    assert _lookup('a good citation').doi == '10.1/good'
+    assert _lookup('a good citation').doi == '10.1/good'
+    assert len(works) == 3
+
+
+def test_low_scores_are_misses(works):
+    cache.configure(min_score=50)
+    with pytest.raises(CitationNotFoundError):
+        _lookup('a vague citation')
+    with pytest.raises(CitationNotFoundError):
+        _lookup('a vague citation')
+    assert works == ['a vague citation']
+    cached = cache.get('a vague citation')
+    assert cached.doi is None
+    assert cached.reason == cache.LOW_SCORE
+    assert cached.score == 20.0
+
+    cache.configure(min_score=None)
+    assert _lookup('a vague citation', retry_misses=True).doi == '10.1/vague'
+
+
+def test_misses_expire_sooner(works):
+    with pytest.raises(CitationNotFoundError):
+        _lookup('a web page')
+    _lookup('a good citation')
+
+    cache.configure(negative_ttl=datetime.timedelta(0))
+    assert cache.get('a web page') is None
+    assert cache.get('a good citation').doi == '10.1/good'
+
+
+def test_hits_and_misses(db):
+    assert cache.get('Some  Citation.') is None
+    cache.put('Some  Citation.', '10.1000/a', 80.0)
+    #Keyed by the normalized citation
+    cached = cache.get('some citation')
+    assert (cached.doi, cached.score, cached.reason) == ('10.1000/a', 80.0,
+                                                         None)
+    cache.put('some citation', '10.1000/b')
+    assert cache.get('Some  Citation.').doi == '10.1000/b'
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+    assert stats['hit_rate'] == 2/3
+
+    cache.configure(enabled=False)
+    try:
+        assert cache.get('some citation') is None
+    finally:
+        cache.configure(enabled=True)
+
+
+def test_entries_expire(db):
+    cache.put('a citation', '10.1000/a')
+    cache.put_miss('a web page')
+    cache.configure(ttl=datetime.timedelta(0))
+    assert cache.get('a citation') is None
+    #Misses have their own ttl
+    assert cache.get('a web page').reason == cache.NOT_FOUND
+
+    cache.configure(ttl=cache.DEFAULT_TTL,
+                    negative_ttl=datetime.timedelta(0))
+    assert cache.get('a web page') is None
+    assert cache.stats()['expired'] == 2
+    #Expired entries are removed
+    cache.configure(negative_ttl=cache.DEFAULT_NEGATIVE_TTL)
+    assert cache.get('a web page') is None
+    assert cache.get('a citation') is None
+
+
+def test_eviction(db, monkeypatch):
+    for i in range(5):
+        cache.put('citation %d' % i, '10.1000/%d' % i)
+    assert cache.evict() == 0
+
+    #A hit makes an entry recently used
+    monkeypatch.setattr(cache, '_LAST_USED_RESOLUTION', datetime.timedelta(0))
+    assert cache.get('citation 0') is not None
+
+    cache.configure(max_size=3)
+    assert cache.evict() == 2
+    kept = [i for i in range(5) if cache.get('citation %d' % i) is not None]
+    assert kept == [0, 3, 4]
+    assert cache.stats()['evictions'] == 2
+
+    #put() checks the size periodically
+    monkeypatch.setattr(cache, '_EVICT_CHECK_INTERVAL', 1)
+    cache.put('citation 5', '10.1000/5')
+    assert cache.get('citation 5') is not None
+    assert sum(cache.get('citation %d' % i) is not None
+               for i in range(6)) == 3
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import pytest
+
+from reference_resolver import crawler, tables
+
+#doi => references
+GRAPH = {'10.1000/a': ['10.1000/b', '10.1000/c', {'text': 'Unknown 2001'}],
+         '10.1000/b': ['10.1000/c', '10.1000/d'],
+         '10.1000/c': ['10.1000/e'],
+         '10.1000/d': [],
+         '10.1000/e': ['10.1000/a']}
+
+
+@pytest.fixture
+def db(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    yield
+    tables.get_engine().dispose()
+
+
+def _fetcher(calls):
+    def fetch(doi):
+        calls.append(doi)
+        if doi not in GRAPH:
+            raise LookupError(doi)
+        return GRAPH[doi]
+    return fetch
+
+
+def test_crawl_depth(db):
+    calls = []
+    stats = crawler.crawl(['10.1000/a'], max_depth=1, fetch=_fetcher(calls))
+    assert sorted(calls) == ['10.1000/a', '10.1000/b', '10.1000/c']
+    assert stats['fetched'] == 3
+    assert stats['complete']
+
+    #Rerunning deeper only fetches the new level
+    calls = []
+    stats = crawler.crawl(['10.1000/a'], max_depth=3, fetch=_fetcher(calls))
+    assert sorted(calls) == ['10.1000/d', '10.1000/e']
+    assert stats['stored'] == 3
+
+
+def test_crawl_budget_resumes(db):
+    calls = []
+    stats = crawler.crawl(['10.1000/a'], max_depth=5, max_papers=2,
+                          fetch=_fetcher(calls), batch_size=1)
+    assert len(calls) == 2
+    assert not stats['complete']
+
+    stats = crawler.crawl(['10.1000/a'], max_depth=5, fetch=_fetcher(calls))
+    assert sorted(calls) == sorted(GRAPH)
+    assert stats['complete']
+    assert stats['fetched'] == 3
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import pytest
+import sqlalchemy as sql
+
+from reference_resolver import dedup, idmap, ingest, tables
+from reference_resolver.tables import Paper, Reference
+
+
+@pytest.fixture
+def engine(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    engine = tables.get_engine()
+    yield engine
+    engine.dispose()
+
+
+def _insert(engine, **values):
+    values.setdefault('new_pointer', 0)
+    with engine.begin() as conn:
+        return conn.execute(Paper.__table__.insert().values(
+            **values)).inserted_primary_key[0]
+
+
+def _pointers(engine):
+    papers = Paper.__table__
+    with engine.connect() as conn:
+        return dict(conn.execute(sql.select([papers.c.id,
+                                             papers.c.new_pointer])).fetchall())
+
+
+def test_merge_duplicates(engine):
+    a = _insert(engine, doi='10.1000/ABC', title='A title')
+    b = _insert(engine, doi='10.1000/abc')
+    c = _insert(engine, pmid=123)
+    d = _insert(engine, isbn='978-3', chapter=1)
+    e = _insert(engine, isbn='978-3', chapter=2)
+
+    stats = dedup.merge_duplicates()
+    assert stats == {'processed': 5, 'rechecked': 0, 'merged': 1, 'groups': 1}
+    assert _pointers(engine) == {a: 0, b: a, c: 0, d: 0, e: 0}
+
+    #A paper with both identifiers joins the DOI and PMID groups. Nothing
+    #before it is rescanned.
+    f = _insert(engine, doi='10.1000/abc', pmid=123)
+    ingest.add_references('10.1000/other', ['10.1000/abc', {'pmid': 123}])
+    stats = dedup.merge_duplicates()
+    assert stats['processed'] == 2
+    pointers = _pointers(engine)
+    assert [pointers[x] for x in (a, b, c, f)] == [0, a, a, a]
+
+    #References now point at the kept paper
+    references = Reference.__table__
+    with engine.connect() as conn:
+        cited = [row[0] for row in conn.execute(
+            sql.select([references.c.ref_paper_id]))]
+    assert cited == [a, a]
+
+    with engine.connect() as conn:
+        pmid = conn.execute(sql.select([Paper.__table__.c.pmid]).where(
+            Paper.__table__.c.id == a)).scalar()
+    assert pmid == 123
+
+    #New references to any of the duplicates go to the kept paper
+    ingest.add_references('10.1000/third', [{'pmid': 123}])
+    with engine.connect() as conn:
+        cited = conn.execute(sql.select([sql.func.max(
+            references.c.id), references.c.ref_paper_id])).fetchone()[1]
+    assert cited == a
+
+
+def test_reference_lists_are_not_duplicated(engine):
+    ingest.add_references({'pmid': 5}, ['10.1000/x', '10.1000/y'])
+    ingest.add_references({'doi': '10.1000/main'}, ['10.1000/x'])
+    #Joins the two
+    _insert(engine, doi='10.1000/main', pmid=5)
+    dedup.merge_duplicates()
+
+    references = Reference.__table__
+    with engine.connect() as conn:
+        n = conn.execute(sql.select([sql.func.count()]).select_from(
+            references)).scalar()
+    assert n == 2
+
+
+def test_identifiers_added_by_ingest(engine):
+    pmid_id, doi_id = ingest.get_paper_ids([{'pmid': 5}, '10.1000/x'])
+    assert dedup.merge_duplicates()['merged'] == 0
+
+    #Cited with both, which gives the DOI paper the PMID
+    main_id = ingest.add_references('10.1000/main',
+                                    [{'doi': '10.1000/x', 'pmid': 5}])
+    stats = dedup.merge_duplicates()
+    assert stats['processed'] == 1
+    assert stats['rechecked'] >= 1
+    assert stats['merged'] == 1
+    assert _pointers(engine)[doi_id] == pmid_id
+    assert Paper.get_from_doi('10.1000/x').canonical_id == pmid_id
+
+    references = Reference.__table__
+    with engine.connect() as conn:
+        cited = conn.execute(sql.select([references.c.ref_paper_id]).where(
+            references.c.main_paper_id == main_id)).scalar()
+    assert cited == pmid_id
+
+    #Papers changed by the merge are rechecked, finding nothing new
+    stats = dedup.merge_duplicates()
+    assert (stats['processed'], stats['merged']) == (0, 0)
+
+
+def test_identifier_mappings(engine, tmp_path):
+    pmid_id, doi_id, other_id = ingest.get_paper_ids(
+        [{'pmid': 5}, '10.1000/x', {'pmid': 6}])
+    path = str(tmp_path / 'ids.csv')
+    with open(path, 'w') as f:
+        f.write('PMID,PMCID,DOI\n5,,https://doi.org/10.1000/X\n'
+                '7,,10.1000/y\n')
+    idmap.import_file(path)
+
+    stats = dedup.merge_duplicates()
+    assert stats == {'processed': 3, 'rechecked': 0, 'merged': 1, 'groups': 1}
+    assert _pointers(engine) == {pmid_id: 0, doi_id: pmid_id, other_id: 0}
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import pytest
+
+from reference_resolver import citations, doi_extract, ingest, main, metrics
+from reference_resolver import sessions, tables
+
+CASES = [
+    ('Senís E, et al. Biotechnol J. 2014;9(11):1402-12. '
+     'doi:10.1002/biot.201400046.', '10.1002/biot.201400046'),
+    ('Available at https://doi.org/10.1038/nrg3686, accessed 2019',
+     '10.1038/nrg3686'),
+    ('(http://dx.doi.org/10.1016%2Fj.cell.2014.05.010)',
+     '10.1016/j.cell.2014.05.010'),
+    ('J Biomed Mater Res. DOI: 10.1002/(SICI)1097-4636(199711)37:2;2-K',
+     '10.1002/(SICI)1097-4636(199711)37:2;2-K'),
+    #Unknown prefix, no suffix, part of a longer number
+    ('Nobody. doi:10.99999/abc', None),
+    ('Version 10.1002/ of the manual', None),
+    ('Table 110.1002/x', None),
+    ('Smith J. A paper without a DOI. Nature. 2001;10.5:1-2', None),
+    ('', None),
+]
+
+
+@pytest.mark.parametrize('citation,doi', CASES)
+def test_find_doi(citation, doi):
+    assert doi_extract.find_doi(citation) == doi
+
+
+def test_extract_dois():
+    citation_list = [x[0] for x in CASES]
+    assert doi_extract.extract_dois(citation_list) == [x[1] for x in CASES]
+    assert doi_extract.extract_dois([]) == []
+
+
+def test_strip_doi_link():
+    for value in ('http://dx.doi.org/10.1002/biot.1',
+                  'https://doi.org/10.1002/biot.1', 'DOI: 10.1002/biot.1',
+                  '10.1002/biot.1'):
+        assert doi_extract.strip_doi_link(value) == '10.1002/biot.1'
+    assert doi_extract.strip_doi_link('https://example.org/10.1002/biot.1') == \
+        'https://example.org/10.1002/biot.1'
+
+
+def test_unknown_prefixes_allowed():
+    doi_extract.configure(require_known_prefix=False)
+    try:
+        assert doi_extract.find_doi('doi:10.99999/abc') == '10.99999/abc'
+    finally:
+        doi_extract.configure(require_known_prefix=True)
+
+
+def test_resolution_is_short_circuited(monkeypatch, tmp_path):
+    #Citations without a DOI check the cache
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+
+    def no_requests(*args, **kwargs):
+        raise AssertionError('no request should be made')
+    monkeypatch.setattr(sessions, 'get', no_requests)
+    monkeypatch.setattr(main, 'Works', no_requests)
+
+    citation = CASES[0][0]
+    assert citations.citation_to_doi(citation).doi == CASES[0][1]
+    assert main.citation_to_paper_info(citation).doi == CASES[0][1]
+
+    results = citations.citations_to_dois([CASES[1][0], 'no doi here'])
+    assert results[0].result.doi == CASES[1][1]
+    assert results[1].index == 1
+    assert isinstance(results[1].error, AssertionError)
+    results = main.citations_to_paper_info([CASES[2][0]])
+    assert results[0].result.doi == CASES[2][1]
+    tables.get_engine().dispose()
+
+
+def test_embedded_doi_results(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    metrics.configure(enabled=True)
+    try:
+        ingest.get_paper_ids([{'doi': CASES[0][1], 'title': 'A title',
+                               'year': 2014}])
+        entry = {'doi': CASES[0][1], 'title': 'A title', 'year': 2014}
+        assert main.citation_to_paper_info(CASES[0][0]).entry == entry
+
+        results = main.citations_to_paper_info([CASES[0][0], CASES[1][0]])
+        assert results[0].result.entry == entry
+        #Not in the database
+        assert results[1].result.doi == CASES[1][1]
+        assert results[1].result.entry is None
+
+        citations.citations_to_dois([CASES[0][0], CASES[1][0]])
+        assert metrics.stats()['counters']['embedded_doi_hits'] == 5
+    finally:
+        metrics.configure(enabled=False)
+        metrics.reset()
+        tables.get_engine().dispose()
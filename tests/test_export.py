@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import csv
+import datetime
+import gzip
+import json
+import os
+
+import pytest
+
+from reference_resolver import export, ingest, tables
+from reference_resolver.__main__ import main
+from reference_resolver.tables import Paper
+
+
+@pytest.fixture
+def db(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    ingest.add_references('10.1000/a', ['10.1000/b', {'text': 'An abstract'}])
+    ingest.add_references('10.1000/c', ['10.1000/b', {'text': 'A web page'}])
+    yield
+    tables.get_engine().dispose()
+
+
+def _read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_export_formats(db, tmp_path):
+    counts = export.export_all(str(tmp_path / 'out'))
+    assert counts['papers'] == 3
+    assert counts['references'] == 4
+    assert counts['unknown_references'] == 2
+
+    papers = _read_jsonl(str(tmp_path / 'out' / 'papers.jsonl'))
+    assert [x['doi'] for x in papers] == ['10.1000/a', '10.1000/b', '10.1000/c']
+    assert set(papers[0]) == set(export.get_columns('papers'))
+    unknown = _read_jsonl(str(tmp_path / 'out' / 'unknown_references.jsonl'))
+    assert [x['unknown_text'] for x in unknown] == ['An abstract',
+                                                    'A web page']
+
+    path = str(tmp_path / 'references.csv.gz')
+    assert export.export_table('references', path, chunk_size=1) == 4
+    with gzip.open(path, 'rt') as f:
+        rows = list(csv.DictReader(f))
+    assert [x['ordering'] for x in rows] == ['0', '1', '0', '1']
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_export_since(db, tmp_path):
+    papers = Paper.__table__
+    old = datetime.datetime(2020, 1, 1)
+    with tables.get_engine().begin() as conn:
+        conn.execute(papers.update().values(created=old, updated=None))
+        #Marks 10.1000/c as updated now
+        conn.execute(papers.update().where(papers.c.doi == '10.1000/c')
+                     .values(title='Updated'))
+
+    since = '2021-01-01'
+    assert [row[1] for row in export.iter_rows('papers', since=since)] == [
+        '10.1000/c']
+    assert len(list(export.iter_rows('references', since=since))) == 2
+    unknown = list(export.iter_rows('unknown_references', since=since))
+    assert [row[2] for row in unknown] == ['A web page']
+
+    out = str(tmp_path / 'out')
+    assert main(['export', out, '--since', since, '--format', 'csv',
+                 '--tables', 'papers']) == 0
+    with open(os.path.join(out, 'papers.csv')) as f:
+        assert len(list(csv.DictReader(f))) == 1
+    with pytest.raises(ValueError):
+        export.parse_since('yesterday')
+
+
+def test_export_since_new_references(db, tmp_path):
+    papers = Paper.__table__
+    old = datetime.datetime(2020, 1, 1)
+    with tables.get_engine().begin() as conn:
+        conn.execute(papers.update().values(created=old, updated=None))
+    since = datetime.datetime.utcnow()
+    ingest.add_references('10.1000/a', ['10.1000/b', '10.1000/d'])
+
+    changed = list(export.iter_rows('papers', since=since))
+    assert sorted(row[1] for row in changed) == ['10.1000/a', '10.1000/d']
+    counts = export.export_all(str(tmp_path / 'out'), since=since)
+    assert counts['references'] == 2
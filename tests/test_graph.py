@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import numpy as np
+
+from reference_resolver import ingest, tables
+from reference_resolver.graph import CitationGraph
+
+#citing => cited, by paper id
+EDGES = {10: [20, 30, 40],
+         11: [20, 30],
+         12: [30, 50],
+         20: [50],
+         50: [60]}
+
+
+def _graph():
+    citing = [a for a, refs in EDGES.items() for b in refs]
+    cited = [b for a, refs in EDGES.items() for b in refs]
+    #Duplicates are ignored
+    return CitationGraph.from_edges(citing + [10], cited + [20])
+
+
+def test_neighbors_and_degrees():
+    g = _graph()
+    assert g.n_papers == 8
+    assert g.n_citations == 9
+    assert list(g.references(10)) == [20, 30, 40]
+    assert list(g.citations(30)) == [10, 11, 12]
+    assert list(g.references(999)) == []
+    assert list(g.in_degree([30, 20, 999])) == [3, 2, 0]
+    assert list(g.out_degree([10, 60])) == [3, 0]
+    ids, counts = g.most_cited(2)
+    assert list(ids) == [30, 20]
+
+
+def test_cocitation_and_coupling():
+    g = _graph()
+    assert g.cocitation(20, 30) == 2
+    assert g.coupling(10, 11) == 2
+    ids, counts = g.cocited_with(30)
+    assert list(zip(ids, counts)) == [(20, 2), (40, 1), (50, 1)]
+    ids, counts = g.coupled_with(10, n=1)
+    assert list(ids) == [11]
+
+
+def test_neighborhood():
+    g = _graph()
+    assert list(g.neighborhood(10, k=1)) == [10, 20, 30, 40]
+    assert list(g.neighborhood(10, k=2)) == [10, 20, 30, 40, 50]
+    assert list(g.neighborhood(60, k=2, direction='in')) == [12, 20, 50, 60]
+    assert list(g.neighborhood([999], k=3)) == []
+
+
+def test_load_from_database(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    try:
+        ids = ingest.add_references_bulk(
+            [('10.1000/a', ['10.1000/b', '10.1000/c', {'text': 'unknown'}]),
+             ('10.1000/b', ['10.1000/c'])])
+        g = CitationGraph.load()
+        assert g.n_citations == 3
+        assert g.in_degree(ids)[1] == 1
+
+        path = str(tmp_path / 'graph.npz')
+        g.save(path)
+        g2 = CitationGraph.load_file(path)
+        assert np.array_equal(g2.citations(ids[1]), g.citations(ids[1]))
+    finally:
+        tables.get_engine().dispose()
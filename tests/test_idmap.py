@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import csv
+import gzip
+import io
+
+import pytest
+
+from reference_resolver import idmap, tables
+from reference_resolver.__main__ import main
+
+
+@pytest.fixture
+def db(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    yield
+    tables.get_engine().dispose()
+
+
+def _write(path, rows):
+    if path.endswith('.gz'):
+        f = io.TextIOWrapper(gzip.open(path, 'wb'), encoding='utf-8',
+                             newline='')
+    else:
+        f = io.open(path, 'w', encoding='utf-8', newline='')
+    with f:
+        csv.writer(f).writerows(rows)
+    return path
+
+
+PMC_ROWS = [
+    ['Journal Title', 'ISSN', 'eISSN', 'Year', 'Volume', 'Issue', 'Page',
+     'DOI', 'PMCID', 'PMID', 'Manuscript Id', 'Release Date'],
+    ['Biotechnol J', '', '', '2014', '9', '11', '1402',
+     '10.1002/BIOT.201400046', 'PMC4231239', '24736437', '', 'live'],
+    ['Nat Rev Genet', '', '', '2014', '15', '5', '321',
+     '10.1038/nrg3686', 'PMC4000000', '', '', 'live'],
+    #Only one identifier
+    ['A Journal', '', '', '2014', '', '', '', '', 'PMC4000001', '', '', ''],
+    ['Truncated'],
+]
+
+
+def test_import_and_lookup(db, tmp_path):
+    path = _write(str(tmp_path / 'PMC-ids.csv.gz'), PMC_ROWS)
+    assert idmap.import_file(path, chunk_size=1) == 2
+
+    assert idmap.pmids_to_dois([24736437, '24736437', 1, None]) == [
+        '10.1002/biot.201400046', '10.1002/biot.201400046', None, None]
+    assert idmap.dois_to_pmids(['https://doi.org/10.1002/biot.201400046',
+                                '10.1038/nrg3686']) == [24736437, None]
+    assert idmap.map_ids(['pmc4000000', 4231239], 'pmcid', 'doi') == [
+        '10.1038/nrg3686', '10.1002/biot.201400046']
+    with pytest.raises(ValueError):
+        idmap.map_ids([1], 'pmid', 'isbn')
+
+    #Europe PMC format, with DOI links, added to the PMC mappings
+    epmc = _write(str(tmp_path / 'PMID_PMCID_DOI.csv'), [
+        ['PMID', 'PMCID', 'DOI'],
+        ['1', '', 'https://doi.org/10.1016/0000-0001'],
+        ['24736437', 'PMC4231239', 'https://doi.org/10.1002/other']])
+    assert idmap.import_file(epmc, replace=False) == 2
+    assert idmap.pmids_to_dois([1, 24736437]) == [
+        '10.1016/0000-0001', '10.1002/biot.201400046']
+
+    assert idmap.import_file(epmc) == 2
+    assert idmap.pmids_to_dois([24736437]) == ['10.1002/other']
+    assert idmap.pmids_to_dois([]) == []
+
+
+def test_bad_header(db, tmp_path):
+    path = _write(str(tmp_path / 'bad.csv'), [['PMID', 'Title'], ['1', 'x']])
+    with pytest.raises(ValueError):
+        idmap.import_file(path)
+
+
+def test_cli(db, tmp_path):
+    path = _write(str(tmp_path / 'PMC-ids.csv'), PMC_ROWS)
+    assert main(['import-idmap', path, '--quiet']) == 0
+    assert idmap.dois_to_pmids(['10.1002/biot.201400046']) == [24736437]
+    bad = _write(str(tmp_path / 'bad.csv'), [['Title']])
+    assert main(['import-idmap', bad, '--quiet']) == 2
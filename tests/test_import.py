@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_is_lazy():
+    #A fresh interpreter is needed as other tests load these modules
+    code = ('import sys, reference_resolver, reference_resolver.ref_retrieval; '
+            'heavy = ["sqlalchemy", "requests", "crossref", "scopy"]; '
+            'print([m for m in heavy if m in sys.modules])')
+    with tempfile.TemporaryDirectory() as cwd:
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=cwd, env=env, text=True)
+    assert output.strip() == '[]'
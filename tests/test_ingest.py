@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import os
+
+from reference_resolver import tables, ingest
+from reference_resolver.tables import Reference, UnknownReference
+
+
+def test_add_references(tmp_path):
+    tables.set_db_path(os.path.join(str(tmp_path), 'test.db'))
+
+    refs = ['10.1038/NRG3686', {'pmid': 4200}, {'text': 'Some abstract'}]
+    main_id = ingest.add_references('10.1002/biot.201400046', refs)
+    #Replacing shouldn't duplicate anything
+    assert ingest.add_references({'doi': '10.1002/BIOT.201400046'}, refs) == main_id
+
+    session = tables.Session()
+    rows = session.query(Reference).filter_by(main_paper_id=main_id).order_by(
+        Reference.ordering).all()
+    assert [x.ordering for x in rows] == [0, 1, 2]
+    assert rows[2].ref_paper_id == ingest.UNKNOWN_PAPER_ID
+    unknown = session.query(UnknownReference).all()
+    assert [(x.ref_id, x.unknown_text) for x in unknown] == [(rows[2].id, 'Some abstract')]
+    session.close()
+
+    assert tables.Paper.get_from_doi('10.1038/nrg3686').id == rows[0].ref_paper_id
+    tables.get_engine().dispose()
+
+
+def test_citation_text_and_insert_order(tmp_path):
+    tables.set_db_path(os.path.join(str(tmp_path), 'test.db'))
+
+    citation = '10. Smith J, Jones K. A paper on things. Nature 2001;4:1-2'
+    refs = ['10.1038/nrg3686', citation, 'doi:10.1000/no', '10.1016/a.',
+            {'pmid': 4200}, '10.1000/b']
+    main_id = ingest.add_references('10.1002/biot.201400046', refs)
+
+    session = tables.Session()
+    papers = session.query(tables.Paper).order_by(tables.Paper.id).all()
+    #New papers are created in input order, main paper first
+    assert [(x.doi, x.pmid) for x in papers] == [
+        ('10.1002/biot.201400046', None), ('10.1038/nrg3686', None),
+        ('10.1016/a', None), (None, 4200), ('10.1000/b', None)]
+    assert papers[0].id == main_id
+    unknown = session.query(UnknownReference).order_by(UnknownReference.id)
+    assert [x.unknown_text for x in unknown] == [citation, 'doi:10.1000/no']
+    session.close()
+    tables.get_engine().dispose()
+
+
+def test_all_identifiers_are_kept(tmp_path):
+    tables.set_db_path(os.path.join(str(tmp_path), 'test.db'))
+    pmid_id, isbn_id = ingest.get_paper_ids([{'pmid': 5}, {'isbn': '978'}])
+    assert tables.Paper.get_from_pmid(5).doi is None
+
+    ref = {'doi': '10.1000/X', 'pmid': 5, 'isbn': '978'}
+    main_id = ingest.add_references('10.1000/main', [ref])
+    new_id = ingest.add_references('10.1000/new', [
+        {'doi': '10.1000/y', 'pmid': 6, 'isbn': '979'}, {'pmid': 6}])
+
+    #Matched on the pmid, which is preferred to the isbn, and given the
+    #other identifiers. The isbn paper is left for dedup.py.
+    session = tables.Session()
+    refs = session.query(Reference).filter_by(main_paper_id=main_id).all()
+    assert [x.ref_paper_id for x in refs] == [pmid_id]
+    papers = dict((x.id, (x.doi, x.pmid, x.isbn))
+                  for x in session.query(tables.Paper))
+    assert papers[pmid_id] == ('10.1000/x', 5, '978')
+    assert papers[isbn_id] == (None, None, '978')
+
+    #A new paper with all of them, referenced by either
+    refs = session.query(Reference).filter_by(main_paper_id=new_id).all()
+    assert len(set(x.ref_paper_id for x in refs)) == 1
+    assert papers[refs[0].ref_paper_id] == ('10.1000/y', 6, '979')
+    session.close()
+
+    #Lookups by any identifier, including cached ones, see the doi
+    assert tables.Paper.get_from_pmid(5).doi == '10.1000/x'
+    assert tables.Paper.get_from_doi('10.1000/x').id == pmid_id
+    assert ingest.get_paper_ids([{'isbn': '979'}, {'doi': '10.1000/x'}]) == [
+        refs[0].ref_paper_id, pmid_id]
+    tables.get_engine().dispose()
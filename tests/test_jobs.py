@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import json
+import threading
+
+import pytest
+import sqlalchemy as sql
+
+from reference_resolver import jobs, tables
+from reference_resolver.tables import Job
+
+
+@pytest.fixture
+def db(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    yield
+    tables.get_engine().dispose()
+
+
+@pytest.fixture
+def handler():
+    calls = []
+    lock = threading.Lock()
+
+    def run(payload):
+        with lock:
+            calls.append(payload)
+        if payload.startswith('bad'):
+            raise LookupError(payload)
+        return {'length': len(payload)}
+
+    jobs.register_handler('test', run)
+    yield calls
+    del jobs._handlers['test']
+
+
+def _rows(**where):
+    table = Job.__table__
+    query = sql.select([table.c.payload, table.c.status, table.c.attempts,
+                        table.c.result]).order_by(table.c.id)
+    for name, value in where.items():
+        query = query.where(table.c[name] == value)
+    with tables.get_engine().connect() as conn:
+        return conn.execute(query).fetchall()
+
+
+def test_enqueue_skips_existing(db, handler):
+    assert jobs.enqueue('test', ['a', 'b', 'a']) == 2
+    assert jobs.enqueue('test', ['b', 'c']) == 1
+    assert jobs.counts()['pending'] == 3
+    assert 'test' in jobs.handler_kinds()
+    with pytest.raises(ValueError):
+        jobs.enqueue('unknown', ['a'])
+
+
+def test_claims_are_exclusive(db, handler):
+    jobs.enqueue('test', ['a', 'b', 'c'])
+    token1, claimed1 = jobs.claim(2, worker_id='w1')
+    token2, claimed2 = jobs.claim(2, worker_id='w2')
+    assert [x.payload for x in claimed1] == ['a', 'b']
+    assert [x.payload for x in claimed2] == ['c']
+    assert jobs.claim(2)[1] == []
+
+    #Only the claim holder can complete a job
+    assert not jobs.complete(claimed1[0].id, token2)
+    assert jobs.complete(claimed1[0].id, token1, {'x': 1})
+    assert json.loads(_rows(payload='a')[0].result) == {'x': 1}
+
+
+def test_expired_lease_is_reclaimed(db, handler):
+    jobs.enqueue('test', ['a'], max_attempts=2)
+    token1, claimed = jobs.claim(1, lease_seconds=-1)
+    token2, reclaimed = jobs.claim(1, lease_seconds=-1)
+    assert [x.id for x in reclaimed] == [claimed[0].id]
+    assert reclaimed[0].attempts == 2
+
+    #The first worker has lost the job
+    assert not jobs.complete(claimed[0].id, token1)
+    assert jobs.fail(claimed[0].id, token1, 'error') is None
+
+    #Out of attempts once the second lease also expires
+    assert jobs.claim(1)[1] == []
+    assert _rows()[0].status == 'failed'
+
+
+def test_fail_retries_then_fails(db, handler):
+    jobs.configure(retry_delay=0)
+    try:
+        jobs.enqueue('test', ['a'], max_attempts=2)
+        token, claimed = jobs.claim(1)
+        assert jobs.fail(claimed[0].id, token, 'first') == 'pending'
+        token, claimed = jobs.claim(1)
+        assert claimed[0].attempts == 2
+        assert jobs.fail(claimed[0].id, token, 'second') == 'failed'
+        assert jobs.claim(1)[1] == []
+
+        assert jobs.retry_failed() == 1
+        assert jobs.claim(1)[1][0].attempts == 1
+    finally:
+        jobs.configure(retry_delay=30.0)
+
+
+def test_workers_run_each_job_once(db, handler):
+    payloads = ['job%03d' % i for i in range(60)] + ['bad1', 'bad2']
+    jobs.enqueue('test', payloads, max_attempts=1)
+
+    results = []
+
+    def work():
+        results.append(jobs.run_worker(batch_size=5, max_workers=2,
+                                       exit_when_empty=True))
+
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(handler) == sorted(payloads)
+    assert sum(x['done'] for x in results) == 60
+    assert sum(x['failed'] for x in results) == 2
+    assert jobs.counts() == {'pending': 0, 'running': 0, 'done': 60,
+                             'failed': 2}
+    row = _rows(payload='job007')[0]
+    assert json.loads(row.result) == {'length': 6}
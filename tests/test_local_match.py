@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import os
+
+from reference_resolver import tables, ingest, local_match
+
+c2 = 'Senís, Elena, et al. "CRISPR/Cas9‐mediated genome engineering: An adeno‐associated viral (AAV) vector toolbox. Biotechnology journal 9.11 (2014): 1402-1412.'
+
+
+def test_find_paper(tmp_path):
+    tables.set_db_path(os.path.join(str(tmp_path), 'test.db'))
+
+    paper = {'doi': '10.1002/biot.201400046',
+             'title': 'CRISPR/Cas9-mediated genome engineering: An '
+                      'adeno-associated viral (AAV) vector toolbox',
+             'authors': ['Senís, Elena', 'Fatouros, Chronis'],
+             'year': 2014,
+             'container': 'Biotechnology Journal'}
+    other = {'doi': '10.1/other', 'title': 'Genome engineering in mice',
+             'year': 2014}
+    ingest.add_references(paper, [other])
+
+    match = local_match.find_paper(c2)
+    assert match.doi == '10.1002/biot.201400046'
+    assert match.confidence > 0.9
+
+    assert local_match.find_paper('Genome engineering in yeast. 2014') is None
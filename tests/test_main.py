@@ -8,3 +8,49 @@
 
 
 
+
+import pytest
+
+from reference_resolver import main
+
+
+class _FakeWorks(object):
+
+    #Stands in for crossref.Works, with Crossref's upper case DOIs
+    requests = []
+
+    def __init__(self):
+        self.request_params = {}
+
+    def rows(self, n):
+        self.request_params['rows'] = n
+        return self
+
+    def get(self):
+        dois = [x[4:] for x in self.request_params['filter'].split(',')]
+        _FakeWorks.requests.append(dois)
+        if any('error' in x for x in dois):
+            raise IOError('request failed')
+        items = [{'DOI': x.upper()} for x in dois if 'missing' not in x]
+        return {'message': {'total-results': len(items), 'items': items}}
+
+
+def test_dois_to_metadata(monkeypatch):
+    monkeypatch.setattr(main, 'Works', _FakeWorks)
+    dois = ['10.1/a', '10.1/missing', '10.1/B', '10.1/a', '10.1/c',
+            '10.1/error']
+    results = main.dois_to_metadata(dois, chunk_size=2, max_workers=2)
+
+    assert len(_FakeWorks.requests) == 3
+    assert [x.input for x in results] == dois
+    assert results[0].result['DOI'] == '10.1/A'
+    assert results[3].ok and results[2].ok and results[4].ok
+    assert isinstance(results[1].error, LookupError)
+    assert isinstance(results[5].error, IOError)
+
+
+def test_dois_to_metadata_chunk_size():
+    #Crossref's 1000 row limit would truncate the results
+    for chunk_size in (0, main.MAX_DOI_CHUNK_SIZE + 1):
+        with pytest.raises(ValueError):
+            main.dois_to_metadata(['10.1000/a'], chunk_size=chunk_size)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import pytest
+
+from reference_resolver import metrics
+
+
+@pytest.fixture
+def enabled():
+    metrics.reset()
+    metrics.configure(enabled=True)
+    yield
+    metrics.configure(enabled=False)
+    metrics.reset()
+
+
+def test_disabled_records_nothing():
+    metrics.reset()
+    with metrics.timer('stage'):
+        metrics.incr('count')
+        metrics.hit('cache', True)
+    stats = metrics.stats()
+    assert stats['counters'] == {}
+    assert stats['timings'] == {}
+
+
+def test_timer_and_counters(enabled):
+    for i in range(3):
+        with metrics.timer('stage'):
+            pass
+    with pytest.raises(KeyError):
+        with metrics.timer('stage'):
+            raise KeyError()
+    metrics.hit('cache', True)
+    metrics.hit('cache', True)
+    metrics.hit('cache', False)
+
+    stats = metrics.stats()
+    timing = stats['timings']['stage']
+    assert timing['count'] == 4
+    assert 0 <= timing['p50'] <= timing['p99'] <= timing['max']
+    assert stats['counters']['stage_errors'] == 1
+    assert stats['hit_rates']['cache'] == pytest.approx(2/3)
+
+
+def test_prometheus(enabled):
+    metrics.incr('lookups', 2)
+    metrics.observe('stage', 0.003)
+    metrics.observe('stage', 100.0)
+    text = metrics.to_prometheus(prefix='rr')
+    lines = text.splitlines()
+    assert 'rr_lookups_total 2' in lines
+    assert 'rr_stage_seconds_bucket{le="0.0025"} 0' in lines
+    assert 'rr_stage_seconds_bucket{le="0.005"} 1' in lines
+    assert 'rr_stage_seconds_bucket{le="60"} 1' in lines
+    assert 'rr_stage_seconds_bucket{le="+Inf"} 2' in lines
+    assert 'rr_stage_seconds_count 2' in lines
+
+
+def test_callbacks(enabled):
+    events = []
+
+    def callback(kind, name, value):
+        events.append((kind, name, value))
+
+    metrics.add_callback(callback)
+    try:
+        metrics.incr('lookups')
+        metrics.observe('stage', 0.5)
+    finally:
+        metrics.remove_callback(callback)
+    metrics.incr('lookups')
+    assert events == [('count', 'lookups', 1), ('time', 'stage', 0.5)]
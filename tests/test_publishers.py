@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+from reference_resolver import publishers
+
+
+def test_publisher_from_doi():
+    publisher = publishers.publisher_from_doi('10.1002/biot.201400046')
+    assert publisher.prefix == '10.1002'
+    assert publisher.url == 'http://onlinelibrary.wiley.com'
+
+
+def test_longest_prefix_fallback():
+    assert publishers.publisher_from_doi('10.1016.99/abc').prefix == '10.1016'
+    assert publishers.publisher_from_doi('10.99999999/abc') is None
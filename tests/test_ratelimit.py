@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import pytest
+
+from reference_resolver import ratelimit
+
+URL = 'https://api.crossref.org/works?query=x'
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def limiter(request, tmp_path):
+    old = dict(ratelimit._config)
+    state_path = str(tmp_path / 'rate.db') if request.param == 'sqlite' else None
+    ratelimit.configure(default_rate=10.0, burst=0.5, state_path=state_path)
+    yield ratelimit
+    ratelimit._config.update(old)
+    ratelimit._store = None
+
+
+def test_parse_rate():
+    assert ratelimit._parse_rate({'X-Rate-Limit-Limit': '50',
+                                  'X-Rate-Limit-Interval': '1s'}) == 50
+    assert ratelimit._parse_rate({'X-Rate-Limit-Limit': '120',
+                                  'X-Rate-Limit-Interval': '1m'}) == 2
+    assert ratelimit._parse_rate({}) is None
+
+
+def test_requests_are_paced(limiter):
+    #A burst of 5, then one every 0.1 s
+    waits = [limiter.reserve(URL) for i in range(8)]
+    assert waits[:5] == [0]*5
+    assert waits[5:] == pytest.approx([0.1, 0.2, 0.3], abs=0.02)
+
+    #Other hosts are independent
+    assert limiter.reserve('http://search.crossref.org/dois') == 0
+
+
+def test_rate_from_headers(limiter):
+    limiter.update(URL, 200, {'X-Rate-Limit-Limit': '100',
+                              'X-Rate-Limit-Interval': '1s'})
+    waits = [limiter.reserve(URL) for i in range(60)]
+    assert waits[-1] > 0
+    assert waits[-1] - waits[-2] == pytest.approx(0.01, abs=0.002)
+
+
+def test_backoff_on_throttle(limiter):
+    limiter.configure(backoff_base=2.0)
+    assert limiter.update(URL, 429, {})
+    assert limiter.reserve(URL) == pytest.approx(2.0, abs=0.05)
+    assert limiter.update(URL, 503, {'Retry-After': '10'})
+    assert limiter.reserve(URL) == pytest.approx(10.0, abs=0.05)
+    #Success resets the backoff, but not the existing block
+    assert not limiter.update(URL, 200, {})
+    assert limiter.update(URL, 429, {})
+    assert limiter.reserve(URL) == pytest.approx(10.0, abs=0.05)
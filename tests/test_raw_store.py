@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import os
+
+import pytest
+
+from reference_resolver import citations, raw_store
+
+SEARCH_RESPONSE = [{'doi': 'http://dx.doi.org/10.1002/biot.201400046',
+                    'score': 99.1, 'title': 'CRISPR/Cas9'},
+                   {'doi': 'http://dx.doi.org/10.1/other', 'score': 12.0}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    raw_store.configure(path=str(tmp_path / 'raw'), enabled=True)
+    yield str(tmp_path / 'raw')
+    raw_store.configure(path=None, enabled=False)
+
+
+def test_put_get(store):
+    key = raw_store.put('crossref_search', 'http://x/?q=a', SEARCH_RESPONSE)
+    assert key == raw_store.make_key('crossref_search', 'http://x/?q=a',
+                                     SEARCH_RESPONSE)
+    assert key.startswith('crossref_search/')
+    assert raw_store.get(key) == SEARCH_RESPONSE
+    assert raw_store.get_request('crossref_search',
+                                 'http://x/?q=a') == SEARCH_RESPONSE
+    assert raw_store.get_request('crossref_search', 'http://x/?q=b') is None
+    with pytest.raises(KeyError):
+        raw_store.get(raw_store.make_key('crossref_search', 'missing', []))
+
+    raw_store.put('crossref_search', 'http://x/?q=b', [])
+    assert sorted(raw_store.iter_responses('crossref_search')) == [
+        ('http://x/?q=a', SEARCH_RESPONSE), ('http://x/?q=b', [])]
+    assert list(raw_store.iter_responses('crossref_works')) == []
+
+
+def test_disabled_and_unwritable(store, tmp_path):
+    raw_store.configure(enabled=False)
+    assert raw_store.put('crossref_search', 'a', SEARCH_RESPONSE) is None
+    raw_store.configure(enabled=True)
+
+    #A file where the directory should be
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    raw_store.configure(path=str(blocker))
+    assert raw_store.put('crossref_search', 'a', SEARCH_RESPONSE) is None
+
+
+def test_new_responses_are_kept_separately(store):
+    first = raw_store.put('crossref_search', 'url', SEARCH_RESPONSE)
+    response = citations._parse_search_response(SEARCH_RESPONSE, first)
+    second = raw_store.put('crossref_search', 'url', SEARCH_RESPONSE[1:])
+    assert second != first
+    assert raw_store.get_request('crossref_search', 'url') == \
+        SEARCH_RESPONSE[1:]
+    #The earlier result still sees its own response
+    assert response.raw == SEARCH_RESPONSE[0]
+
+    assert raw_store.put('crossref_search', 'url', SEARCH_RESPONSE) == first
+    assert raw_store.get_request('crossref_search', 'url') == SEARCH_RESPONSE
+    assert len(list(raw_store.iter_responses('crossref_search'))) == 2
+
+
+def test_disabled_by_default():
+    assert raw_store.put('crossref_search', 'a', SEARCH_RESPONSE) is None
+
+
+def test_response_raw_is_lazy(store):
+    key = raw_store.put('crossref_search', 'url', SEARCH_RESPONSE)
+    response = citations._parse_search_response(SEARCH_RESPONSE, key)
+    assert response.doi == '10.1002/biot.201400046'
+    assert response._raw is None
+    assert response.raw == SEARCH_RESPONSE[0]
+
+    response = citations._parse_search_response(SEARCH_RESPONSE)
+    assert response.raw is SEARCH_RESPONSE[0]
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import json
+import pickle
+
+import pytest
+
+from reference_resolver import citations, ingest, tables
+from reference_resolver.main import PaperInfo
+from reference_resolver.records import ReferenceRecord, json_default
+
+
+def test_records_serialize():
+    refs = [ReferenceRecord(doi='10.1000/a', year=2001),
+            ReferenceRecord(text='Smith J. An abstract. 2011')]
+    info = PaperInfo(doi='10.1000/main', references=refs)
+    with pytest.raises(AttributeError):
+        refs[0].extra = 1
+    with pytest.raises(TypeError):
+        ReferenceRecord(volume=1)
+
+    data = json.loads(json.dumps(info.to_dict()))
+    assert data['doi'] == '10.1000/main'
+    assert data['references'][0]['year'] == 2001
+    assert data['references'][1]['doi'] is None
+    assert ReferenceRecord.from_dict(data['references'][0]) == refs[0]
+    assert json.loads(json.dumps(refs, default=json_default))[1]['text'] == \
+        refs[1].text
+
+    assert pickle.loads(pickle.dumps(info)) == info
+
+    response = citations._CitationDOISearchResponse(
+        {'doi': 'http://dx.doi.org/10.1000/x', 'score': 99.0},
+        source='crossref')
+    assert response.to_dict() == {'doi': '10.1000/x', 'score': 99.0,
+                                  'normalized_score': None, 'raw_key': None,
+                                  'source': 'crossref'}
+    assert pickle.loads(pickle.dumps(response)).raw == response.raw
+
+
+def test_paper_info_extra_attributes():
+    #As before PaperInfo was a record
+    info = PaperInfo(doi='10.1000/main', scraper_obj='x')
+    info.doi_prefix = '10.1000'
+    assert info.__dict__ == {'scraper_obj': 'x', 'doi_prefix': '10.1000'}
+    assert info.to_dict()['scraper_obj'] == 'x'
+    assert info.to_dict()['doi'] == '10.1000/main'
+    copy = pickle.loads(pickle.dumps(info))
+    assert copy == info and copy.doi_prefix == '10.1000'
+    assert PaperInfo(doi='10.1000/main') != info
+
+
+def test_records_can_be_ingested(tmp_path):
+    tables.set_db_path(str(tmp_path / 'refs.db'))
+    try:
+        refs = [ReferenceRecord(doi='10.1000/a', title='A paper', year=2001),
+                ReferenceRecord(text='Smith J. An abstract. 2011')]
+        ingest.add_references('10.1000/main', refs)
+        paper = tables.Paper.get_from_doi('10.1000/a')
+        assert paper.title == 'A paper'
+    finally:
+        tables.get_engine().dispose()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import json
+import threading
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from reference_resolver import crossref, sessions
+
+
+class _FakeAdapter(HTTPAdapter):
+
+    """
+    Answers every request with an empty Crossref result, recording the urls.
+    """
+
+    def __init__(self):
+        super(_FakeAdapter, self).__init__()
+        self.urls = []
+
+    def send(self, request, **kwargs):
+        self.urls.append(request.url)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response._content = json.dumps({'message': {'total-results': 0,
+                                                    'items': []}}).encode()
+        return response
+
+
+@pytest.fixture
+def session_config():
+    old = dict(sessions._config)
+    sessions.close()
+    yield
+    sessions.close()
+    sessions._config.update(old)
+
+
+def test_session_is_shared(session_config):
+    session = sessions.get_session()
+    assert sessions.get_session() is session
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(
+        sessions.get_session()))
+    thread.start()
+    thread.join()
+    assert other == [session]
+
+    #Rebuilt after a configuration change or close()
+    sessions.configure(timeout=5)
+    rebuilt = sessions.get_session()
+    assert rebuilt is not session
+    assert sessions.get_session() is rebuilt
+    sessions.close()
+    assert sessions.get_session() is not rebuilt
+
+
+def test_retry_configuration(session_config):
+    sessions.configure(pool_maxsize=7, max_retries=5, backoff_factor=2.0,
+                       status_forcelist=(500,))
+    session = sessions.get_session()
+    for prefix in ('http://', 'https://'):
+        adapter = session.get_adapter(prefix + 'api.crossref.org/works')
+        assert adapter._pool_maxsize == 7
+        retry = adapter.max_retries
+        assert retry.total == 5
+        assert retry.backoff_factor == 2.0
+        assert list(retry.status_forcelist) == [500]
+        #The last response is returned rather than raising
+        assert not retry.raise_on_status
+    assert session.headers['Connection'] == 'keep-alive'
+
+    sessions.configure(keep_alive=False)
+    assert sessions.get_session().headers['Connection'] == 'close'
+
+    with pytest.raises(ValueError):
+        sessions.configure(retries=1)
+
+
+def test_works_uses_shared_session(session_config):
+    adapter = _FakeAdapter()
+    sessions.get_session().mount('https://', adapter)
+
+    response = sessions.get('https://api.crossref.org/works')
+    assert response.json()['message']['total-results'] == 0
+    assert len(adapter.urls) == 1
+
+    #Including queries derived from the Works object
+    works = crossref.Works()
+    result = works.query(bibliographic='a citation').rows(2).get()
+    assert result['message']['items'] == []
+    assert len(adapter.urls) == 2
+    url = adapter.urls[-1]
+    assert url.startswith(crossref.get_works_url())
+    assert 'query.bibliographic=a+citation' in url
+    assert 'rows=2' in url
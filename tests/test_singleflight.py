@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import threading
+import time
+
+import pytest
+
+from reference_resolver import batch
+from reference_resolver.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    calls = []
+
+    def fetch(x):
+        calls.append(x)
+        time.sleep(0.05)
+        return x*2
+
+    results = batch.run_batch(lambda x: flights.do('key', fetch, x),
+                              [1]*8, max_workers=8)
+    assert [r.result for r in results] == [2]*8
+    assert len(calls) == 1
+    assert flights.n_shared == 7
+    assert flights.in_flight() == 0
+
+
+def test_exception_is_shared_and_key_released():
+    flights = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.05)
+        raise LookupError('not found')
+
+    errors = []
+
+    def waiter():
+        started.wait()
+        try:
+            flights.do('key', fail)
+        except LookupError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    with pytest.raises(LookupError):
+        flights.do('key', fail)
+    thread.join()
+    assert len(errors) == 1
+
+    #Later calls run again
+    assert flights.do('key', lambda: 3) == 3
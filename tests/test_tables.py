@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import os
+
+from reference_resolver import ingest, tables
+from reference_resolver.tables import Paper
+
+
+def test_set_db_path_drops_cached_papers(tmp_path):
+    tables.set_db_path(os.path.join(str(tmp_path), 'a.db'))
+    ingest.get_paper_ids(['10.1000/a'])
+    assert Paper.get_from_doi('10.1000/a') is not None
+
+    tables.set_db_path(os.path.join(str(tmp_path), 'b.db'))
+    assert Paper.get_from_doi('10.1000/a') is None
+    tables.get_engine().dispose()
+
+
+def test_lookups_are_cached(tmp_path, monkeypatch):
+    tables.set_db_path(os.path.join(str(tmp_path), 'test.db'))
+    ingest.get_paper_ids(['10.1000/a', {'pmid': 5}])
+    paper = Paper.get_from_doi('10.1000/A')
+    assert Paper.get_from_pmid('5').pmid == 5
+
+    def no_session():
+        raise AssertionError('should be cached')
+    monkeypatch.setattr(tables, 'Session', no_session)
+    assert Paper.get_from_doi('10.1000/a') is paper
+    assert Paper.get_from_pmid(5).pmid == 5
+    monkeypatch.undo()
+
+    #Changes through the ORM
+    session = tables.Session()
+    session.query(Paper).filter_by(doi='10.1000/a').one().doi = '10.1000/b'
+    session.commit()
+    session.close()
+    assert Paper.get_from_doi('10.1000/a') is None
+    assert Paper.get_from_doi('10.1000/b').id == paper.id
+
+    #Core updates by ingest and dedup
+    assert Paper.get_from_doi('10.1000/b').references_retrieved is None
+    ingest.add_references_bulk([('10.1000/b', [])], mark_retrieved=True)
+    assert Paper.get_from_doi('10.1000/b').references_retrieved is not None
+
+    from reference_resolver import dedup
+    with tables.get_engine().begin() as conn:
+        conn.execute(Paper.__table__.insert().values(doi='10.1000/b', pmid=6,
+                                                     new_pointer=0))
+    assert Paper.get_from_pmid(6).canonical_id != paper.id
+    dedup.merge_duplicates()
+    assert Paper.get_from_pmid(6).canonical_id == paper.id
+    tables.get_engine().dispose()
+
+
+def test_mixed_case_dois_are_converted(tmp_path):
+    path = os.path.join(str(tmp_path), 'test.db')
+    tables.set_db_path(path)
+    papers = Paper.__table__
+    marks = tables.Watermark.__table__
+    #As written by older versions
+    with tables.get_engine().begin() as conn:
+        conn.execute(papers.insert().values(doi='10.1002/BIOT.201400046'))
+        conn.execute(marks.delete())
+
+    tables.set_db_path(path)
+    assert Paper.get_from_doi('10.1002/biot.201400046') is not None
+    tables.get_engine().dispose()